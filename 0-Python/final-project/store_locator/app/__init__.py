@@ -1,14 +1,17 @@
 
-from flask import Flask
+from flask import Flask, Response
 from flask_cors import CORS
 from store_locator.app.extensions import db, jwt, migrate, limiter, cache
 from store_locator.app.config import Config
 
-def create_app():
+def create_app(overrides=None):
+    """overrides: 覆盖Config的配置项（测试/benchmark用），在初始化扩展之前生效"""
     app = Flask(__name__)
     
 
     app.config.from_object(Config)
+    if overrides:
+        app.config.update(overrides)
     
 
     db.init_app(app)
@@ -30,11 +33,69 @@ def create_app():
     app.register_blueprint(admin_bp)
     
 
+    from store_locator.app.stores.spatial_index import spatial_index
+    from store_locator.app.stores.geocoding import geocode_cache
+    from store_locator.app.stores.result_cache import search_result_cache
+    from store_locator.app.stores.fragments import store_fragments
+    from store_locator.app.stores.postal_nearby import postal_nearby
+    from store_locator.app.stores.shards import shard_router
+    from store_locator.app.stores import service_mask
+    from store_locator.app.stores.search import init_search_service
+    from store_locator.app.stores.import_jobs import import_jobs
+    from store_locator.app.stores.validation import validation_pool
+    from store_locator.app.auth.permissions import permission_cache
+    from store_locator.app.auth.passwords import password_hasher
+    from store_locator.app.auth.tokens import token_purger
+    from store_locator.app.rate_limit import rate_limiter
+    from store_locator.app.db_routing import db_router
+    spatial_index.init_app(app)
+    geocode_cache.init_app(app)
+    search_result_cache.init_app(app)
+    store_fragments.init_app(app)
+    postal_nearby.init_app(app)
+    shard_router.init_app(app)
+    service_mask.init_app(app)
+    init_search_service(app)
+    validation_pool.init_app(app)
+    import_jobs.init_app(app)
+    permission_cache.init_app(app)
+    password_hasher.init_app(app)
+    token_purger.init_app(app)
+    rate_limiter.init_app(app)
+    db_router.init_app(app)
+    
+
     @app.route('/health')
     def health():
         return {'status': 'healthy'}, 200
     
 
+    if app.config.get('METRICS_ENABLED', True):
+        from store_locator.app.metrics import metrics
+        metrics.register_stats('store_search_cache', search_result_cache.stats,
+                               counters=('hits', 'misses', 'bypassed', 'recomputed', 'stale_skipped', 'invalidations'))
+        metrics.register_stats('store_fragments', store_fragments.stats,
+                               counters=('hits', 'misses', 'invalidations'))
+        metrics.register_stats('postal_nearby', postal_nearby.stats,
+                               counters=('hits', 'misses', 'refreshed_stores', 'refresh_failures'))
+        metrics.register_stats('store_shards', shard_router.stats,
+                               counters=('synced_stores', 'sync_failures'))
+        metrics.register_stats('rate_limiter', rate_limiter.stats,
+                               counters=('allowed', 'rejected', 'sync_failures'))
+        metrics.register_stats('password_hasher', password_hasher.stats,
+                               counters=('submitted', 'completed', 'rejected'))
+        metrics.register_stats('db_replica', db_router.stats,
+                               counters=('replica_requests', 'primary_requests', 'fallbacks_lag',
+                                         'fallbacks_unavailable', 'fallbacks_error', 'fallbacks_pool_timeout'))
+        metrics.register_collector('db_pool', db_router.pool_samples)
+
+        @app.route('/metrics')
+        @limiter.exempt
+        def prometheus_metrics():
+            # Prometheus文本格式（本进程的指标）
+            return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+    
+
     @app.errorhandler(404)
     def not_found(e):
         return {'error': 'Resource not found'}, 404
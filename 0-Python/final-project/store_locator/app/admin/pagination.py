@@ -0,0 +1,118 @@
+"""
+管理端店铺列表的游标（keyset）分页
+不用OFFSET: 每页按 WHERE (排序键) > 上一页最后一行 取 per_page+1 行，
+深分页和第一页一样快；总数可选，用缓存/估算代替每页 COUNT(*)
+
+游标对客户端不透明: base64url(JSON {"o": 排序方式, "k": 上一页最后一行的排序键})
+"""
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import select, func, text, and_, or_
+from store_locator.app.extensions import db, cache
+
+ORDERS = ('id', 'updated')
+
+COUNT_CACHE_KEY = 'admin:stores:count'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(order, row):
+    if order == 'updated':
+        key = [row.updated_at.isoformat() if row.updated_at else None, row.id]
+    else:
+        key = [row.id]
+    raw = json.dumps({'o': order, 'k': key}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, order):
+    """返回上一页最后一行的排序键；空游标（第一页）返回None"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+        if data['o'] != order:
+            raise InvalidCursor('cursor does not match order')
+        if order == 'updated':
+            updated_at, pk = data['k']
+            return (datetime.fromisoformat(updated_at) if updated_at else None, int(pk))
+        return (int(data['k'][0]),)
+    except InvalidCursor:
+        raise
+    except Exception:
+        raise InvalidCursor('invalid cursor')
+
+
+def keyset_page(order='id', cursor=None, per_page=20):
+    """
+    取一页店铺行（一条SQL）
+
+    排序:
+        id      → id 升序
+        updated → (updated_at, id) 降序（最近修改的在前）
+    返回: (rows, next_cursor)，没有下一页时 next_cursor 为None
+    """
+    from store_locator.app.models import Store
+
+    table = Store.__table__
+    key = decode_cursor(cursor, order)
+    stmt = select(table)
+
+    if order == 'updated':
+        if key:
+            updated_at, pk = key
+            stmt = stmt.where(or_(
+                table.c.updated_at < updated_at,
+                and_(table.c.updated_at == updated_at, table.c.id < pk)
+            ))
+        stmt = stmt.order_by(table.c.updated_at.desc(), table.c.id.desc())
+    else:
+        if key:
+            stmt = stmt.where(table.c.id > key[0])
+        stmt = stmt.order_by(table.c.id)
+
+    rows = db.session.execute(stmt.limit(per_page + 1)).all()
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        return rows, encode_cursor(order, rows[-1])
+    return rows, None
+
+
+def store_count(mode='cached', ttl=60):
+    """
+    店铺总数（不随每页查询）
+
+    mode:
+        cached   → COUNT(*) 结果缓存 ttl 秒
+        estimate → PostgreSQL 用 pg_class.reltuples（不扫表），其他数据库同 cached
+    返回: (total, is_estimate)
+    """
+    from store_locator.app.models import Store
+
+    if mode == 'estimate' and db.engine.dialect.name == 'postgresql':
+        estimate = db.session.execute(
+            text("SELECT reltuples::bigint FROM pg_class WHERE relname = :name"),
+            {'name': Store.__tablename__}
+        ).scalar()
+        # 从未ANALYZE过的表 reltuples 为 -1/0，退回精确计数
+        if estimate and estimate > 0:
+            return int(estimate), True
+
+    try:
+        total = cache.get(COUNT_CACHE_KEY)
+    except Exception as e:
+        print(f"[Admin] count cache unavailable: {e}")
+        total = None
+
+    if total is None:
+        total = db.session.execute(select(func.count()).select_from(Store.__table__)).scalar()
+        try:
+            cache.set(COUNT_CACHE_KEY, total, timeout=ttl)
+        except Exception as e:
+            print(f"[Admin] count cache set failed: {e}")
+    return total, False
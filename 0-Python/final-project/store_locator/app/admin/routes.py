@@ -3,11 +3,22 @@
 处理店铺CRUD和用户管理
 """
 from datetime import datetime
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from store_locator.app.auth.decorators import permission_required
-from store_locator.app.models import Store, Service, User, Role
+from store_locator.app.db_routing import replica_reads
+from store_locator.app.models import Store, Service, User, Role, ImportJob
 from store_locator.app.extensions import db
-from store_locator.app.stores.import_csv import import_stores_from_csv
+from store_locator.app.stores.import_csv import import_stores_from_csv, import_stores_streaming
+from store_locator.app.stores.signals import stores_changed
+from store_locator.app.stores.serializers import serialize_stores, serialize_rows
+from store_locator.app.stores.result_cache import search_result_cache
+from store_locator.app.stores.fragments import store_fragments
+from store_locator.app.stores.postal_nearby import postal_nearby
+from store_locator.app.stores.import_jobs import import_jobs
+from store_locator.app.stores.bulk_update import apply_store_changes, deactivate_stores
+from store_locator.app.stores.hours import invalid_hours_fields
+from store_locator.app.auth.passwords import password_hasher
+from store_locator.app.admin.pagination import ORDERS, InvalidCursor, keyset_page, store_count
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 
@@ -17,6 +28,7 @@ admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 
 @admin_bp.route('/stores', methods=['GET'])
 @permission_required('view_stores')
+@replica_reads
 def list_stores(current_user):
     """
     获取店铺列表（带分页）
@@ -24,18 +36,29 @@ def list_stores(current_user):
     查询参数:
         page: 页码（默认1）
         per_page: 每页数量（默认20）
+    
+    游标分页（大表/深分页推荐，每页两条SQL，不做OFFSET和COUNT）:
+        cursor: 上一页返回的 next_cursor；第一页传空值（?cursor=）
+        order: id（默认）| updated（最近修改的在前）
+        total: none（默认）| cached | estimate
     """
-    page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
     
-    pagination = Store.query.paginate(
+    if 'cursor' in request.args:
+        return _list_stores_by_cursor(per_page)
+    
+    page = request.args.get('page', 1, type=int)
+    
+    # 只分页主键，再批量序列化（店铺+服务共两条SQL）
+    pagination = db.paginate(
+        db.select(Store.id).order_by(Store.id),
         page=page,
         per_page=per_page,
         error_out=False
     )
     
     return jsonify({
-        'stores': [s.to_dict() for s in pagination.items],
+        'stores': serialize_stores(pagination.items),
         'pagination': {
             'page': page,
             'per_page': per_page,
@@ -44,6 +67,37 @@ def list_stores(current_user):
         }
     }), 200
 
+def _list_stores_by_cursor(per_page):
+    order = request.args.get('order', 'id')
+    if order not in ORDERS:
+        return jsonify({'error': f"order must be one of {', '.join(ORDERS)}"}), 400
+    
+    total_mode = request.args.get('total', 'none')
+    if total_mode not in ('none', 'cached', 'estimate'):
+        return jsonify({'error': 'total must be none, cached or estimate'}), 400
+    
+    per_page = max(1, min(per_page, current_app.config.get('ADMIN_MAX_PER_PAGE', 200)))
+    
+    try:
+        rows, next_cursor = keyset_page(order, request.args.get('cursor'), per_page)
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    
+    pagination = {
+        'per_page': per_page,
+        'order': order,
+        'next_cursor': next_cursor
+    }
+    if total_mode != 'none':
+        total, is_estimate = store_count(total_mode, current_app.config.get('ADMIN_COUNT_CACHE_TTL', 60))
+        pagination['total_items'] = total
+        pagination['total_is_estimate'] = is_estimate
+    
+    return jsonify({
+        'stores': serialize_rows(rows),
+        'pagination': pagination
+    }), 200
+
 @admin_bp.route('/stores', methods=['POST'])
 @permission_required('manage_stores')
 def create_store(current_user):
@@ -74,6 +128,10 @@ def create_store(current_user):
         if field not in data:
             return jsonify({'error': f'Missing required field: {field}'}), 400
     
+    invalid_hours = invalid_hours_fields(data)
+    if invalid_hours:
+        return jsonify({'error': f"Invalid hours format: {', '.join(invalid_hours)}"}), 400
+    
     # 检查store_id是否已存在
     if Store.query.filter_by(store_id=data['store_id']).first():
         return jsonify({'error': 'Store ID already exists'}), 400
@@ -110,11 +168,13 @@ def create_store(current_user):
     
     db.session.add(store)
     db.session.commit()
+    stores_changed.send(current_app._get_current_object(), store_ids=[store.id])
     
     return jsonify(store.to_dict()), 201
 
 @admin_bp.route('/stores/<store_id>', methods=['GET'])
 @permission_required('view_stores')
+@replica_reads
 def get_store(current_user, store_id):
     """获取单个店铺详情"""
     store = Store.query.filter_by(store_id=store_id).first()
@@ -140,6 +200,10 @@ def update_store(current_user, store_id):
     
     data = request.get_json()
     
+    invalid_hours = invalid_hours_fields(data)
+    if invalid_hours:
+        return jsonify({'error': f"Invalid hours format: {', '.join(invalid_hours)}"}), 400
+    
     # 允许更新的字段
     allowed_fields = ['name', 'phone', 'status', 'hours_mon', 'hours_tue',
                       'hours_wed', 'hours_thu', 'hours_fri', 'hours_sat', 'hours_sun']
@@ -159,6 +223,7 @@ def update_store(current_user, store_id):
     
     store.updated_at = datetime.utcnow()
     db.session.commit()
+    stores_changed.send(current_app._get_current_object(), store_ids=[store.id])
     
     return jsonify(store.to_dict()), 200
 
@@ -176,9 +241,82 @@ def delete_store(current_user, store_id):
     
     store.status = 'inactive'
     db.session.commit()
+    stores_changed.send(current_app._get_current_object(), store_ids=[store.id])
     
     return jsonify({'message': 'Store deactivated successfully'}), 200
 
+@admin_bp.route('/stores/bulk', methods=['PATCH'])
+@permission_required('manage_stores')
+def bulk_update_stores(current_user):
+    """
+    批量部分更新店铺（一个事务）
+    
+    请求体:
+    {
+        "stores": [
+            {"store_id": "S0001", "status": "temporarily_closed"},
+            {"store_id": "S0002", "hours_sun": "closed", "services": ["pharmacy"]}
+        ]
+    }
+    允许的字段与 PATCH /stores/<store_id> 相同
+    
+    返回:
+    {
+        "updated": 2,
+        "results": [{"store_id": "S0001", "result": "updated"}, ...]
+    }
+    """
+    data = request.get_json(silent=True) or {}
+    changes = data.get('stores')
+    if not isinstance(changes, list) or not changes:
+        return jsonify({'error': 'stores must be a non-empty list'}), 400
+    
+    max_items = current_app.config.get('ADMIN_BULK_MAX_ITEMS', 1000)
+    if len(changes) > max_items:
+        return jsonify({'error': f'At most {max_items} stores per request'}), 400
+    
+    try:
+        results, store_pks = apply_store_changes(changes)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Bulk update failed: {str(e)}'}), 500
+    
+    if store_pks:
+        stores_changed.send(current_app._get_current_object(), store_ids=store_pks)
+    
+    return jsonify({'updated': len(store_pks), 'results': results}), 200
+
+@admin_bp.route('/stores/bulk', methods=['DELETE'])
+@permission_required('manage_stores')
+def bulk_delete_stores(current_user):
+    """
+    批量软删除店铺（status='inactive'，一条UPDATE）
+    
+    请求体:
+    {"store_ids": ["S0001", "S0002"]}
+    """
+    data = request.get_json(silent=True) or {}
+    store_ids = data.get('store_ids')
+    if not isinstance(store_ids, list) or not store_ids:
+        return jsonify({'error': 'store_ids must be a non-empty list'}), 400
+    
+    max_items = current_app.config.get('ADMIN_BULK_MAX_ITEMS', 1000)
+    if len(store_ids) > max_items:
+        return jsonify({'error': f'At most {max_items} stores per request'}), 400
+    
+    try:
+        results, store_pks = deactivate_stores(store_ids)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Bulk delete failed: {str(e)}'}), 500
+    
+    if store_pks:
+        stores_changed.send(current_app._get_current_object(), store_ids=store_pks)
+    
+    return jsonify({'deactivated': len(store_pks), 'results': results}), 200
+
 # ============================================================
 # CSV导入端点
 # ============================================================
@@ -187,19 +325,22 @@ def delete_store(current_user, store_id):
 @permission_required('import_data')
 def import_csv(current_user):
     """
-    批量导入店铺CSV
+    批量导入店铺CSV（默认作为后台任务执行）
     
     请求:
     - Content-Type: multipart/form-data
     - file: CSV文件
+    - ?mode=atomic  全部通过才写入（经暂存表，默认）
+    - ?mode=stream  失败的行跳过，其余照常导入
+    - ?sync=true    在请求内同步导入（小文件），直接返回导入结果
     
-    返回:
+    返回（202）:
     {
-        "success": true,
-        "total_rows": 50,
-        "created": 30,
-        "updated": 20
+        "job_id": "...",
+        "status": "queued",
+        ...
     }
+    进度通过 GET /api/admin/stores/import/<job_id> 查询
     """
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
@@ -209,12 +350,69 @@ def import_csv(current_user):
     if not file.filename.endswith('.csv'):
         return jsonify({'error': 'File must be CSV format'}), 400
     
-    result = import_stores_from_csv(file)
+    mode = request.args.get('mode')
+    if mode not in (None, 'stream', 'atomic'):
+        return jsonify({'error': 'mode must be stream or atomic'}), 400
+    
+    if request.args.get('sync', 'false').lower() == 'true':
+        if mode is None:
+            result = import_stores_from_csv(file)
+        else:
+            result = import_stores_streaming(file.stream, atomic=(mode == 'atomic'))
+        
+        if 'error' in result:
+            return jsonify(result), 400
+        
+        return jsonify(result), 200
+    
+    job = import_jobs.submit(file, mode=mode or 'atomic', user_id=current_user.id)
+    return jsonify(job.to_dict()), 202
+
+
+@admin_bp.route('/stores/import/<job_id>', methods=['GET'])
+@permission_required('import_data')
+def import_job_status(current_user, job_id):
+    """导入任务状态和行计数（执行它的进程已退出时报告为failed）"""
+    job = db.session.get(ImportJob, job_id)
+    if not job:
+        return jsonify({'error': 'Import job not found'}), 404
     
-    if 'error' in result:
-        return jsonify(result), 400
+    return jsonify(import_jobs.check_alive(job).to_dict()), 200
+
+
+@admin_bp.route('/stores/import/<job_id>/cancel', methods=['POST'])
+@permission_required('import_data')
+def cancel_import_job(current_user, job_id):
+    """
+    取消导入任务
+    - 排队中: 直接取消
+    - 运行中: 当前块处理完后停止（stream模式已导入的块保留，atomic模式不写入任何数据）
+    """
+    job = import_jobs.cancel(job_id)
+    if not job:
+        return jsonify({'error': 'Import job not found'}), 404
     
-    return jsonify(result), 200
+    return jsonify(job.to_dict()), 200
+
+# ============================================================
+# 搜索缓存
+# ============================================================
+
+@admin_bp.route('/search-cache/stats', methods=['GET'])
+@permission_required('view_stores')
+def search_cache_stats(current_user):
+    """搜索结果缓存、店铺JSON片段缓存的命中/未命中计数（当前进程）"""
+    return jsonify({
+        **search_result_cache.stats(),
+        'fragments': store_fragments.stats(),
+        'postal_nearby': postal_nearby.stats()
+    }), 200
+
+@admin_bp.route('/auth/password-hasher/stats', methods=['GET'])
+@permission_required('manage_users')
+def password_hasher_stats(current_user):
+    """bcrypt线程池排队/耗时指标（当前进程）"""
+    return jsonify(password_hasher.stats()), 200
 
 # ============================================================
 # 用户管理端点（Admin Only）
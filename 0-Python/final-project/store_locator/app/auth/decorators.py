@@ -1,7 +1,7 @@
 from functools import wraps
 from flask import jsonify
 from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
-from store_locator.app.models import User
+from store_locator.app.auth.permissions import permission_cache
 
 def jwt_required_custom(fn):
     @wraps(fn)
@@ -9,8 +9,9 @@ def jwt_required_custom(fn):
 
         verify_jwt_in_request(refresh=False)
 
+        # 用户状态和权限集合走进程内缓存（AuthUser），命中时不查数据库
         user_id = int(get_jwt_identity())
-        user = User.query.get(user_id)
+        user = permission_cache.get_user(user_id)
 
         if not user or user.status != 'active':
             return jsonify({'error': 'User not found or inactive'}), 401
@@ -20,6 +21,20 @@ def jwt_required_custom(fn):
     return wrapper
 
 
+def optional_current_user():
+    """公开端点上识别已登录用户: 带有效access token返回 AuthUser，否则返回None（不拒绝请求）"""
+    try:
+        if not verify_jwt_in_request(optional=True):
+            return None
+    except Exception:
+        return None
+
+    user = permission_cache.get_user(int(get_jwt_identity()))
+    if not user or user.status != 'active':
+        return None
+    return user
+
+
 def permission_required(permission_name):
     def decorator(fn):
         @wraps(fn)
@@ -0,0 +1,161 @@
+"""
+bcrypt 哈希/校验
+- 在专用的有界线程池里执行（bcrypt计算时释放GIL），登录高峰不会占满所有请求线程
+- 排队超过上限直接拒绝（PasswordHasherBusy → 503），不无限堆积
+- 记录排队/执行耗时等指标
+- 支持透明重新哈希: 库里的cost与 BCRYPT_ROUNDS 不同时，登录成功后用新cost重新哈希
+- 邮箱不存在时对固定的占位哈希做一次同样cost的校验（verify_dummy），响应时间不暴露邮箱是否注册
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import bcrypt
+
+
+# 占位哈希（默认cost 12），不对应任何用户；BCRYPT_ROUNDS 不是12时按配置的cost另外生成
+DUMMY_HASH = '$2b$12$OrjuXMAVyCM.S3jTjnUQm.W4rr/qwztxMyLYG0d1UoaSpOVsO32hO'
+
+
+class PasswordHasherBusy(Exception):
+    """等待队列已满或排队超时"""
+
+
+def hash_rounds(password_hash):
+    """"$2b$12$..." -> 12，无法识别返回None"""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+
+    def __init__(self):
+        self.rounds = 12
+        self.pool_size = 2
+        self.max_queue = 32
+        self.timeout = 10.0
+        self._executor = None
+        self._slots = None
+        self._dummy_hash = DUMMY_HASH
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+    def init_app(self, app):
+        self.rounds = app.config.get('BCRYPT_ROUNDS', self.rounds)
+        self.pool_size = app.config.get('BCRYPT_POOL_SIZE', self.pool_size)
+        self.max_queue = app.config.get('BCRYPT_MAX_QUEUE', self.max_queue)
+        self.timeout = app.config.get('BCRYPT_TIMEOUT', self.timeout)
+        with self._lock:
+            self._executor = None
+            self._slots = None
+
+    def _reset_stats(self):
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.run_seconds = 0.0
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='bcrypt')
+                # 执行中 + 排队中的总数上限
+                self._slots = threading.BoundedSemaphore(self.pool_size + self.max_queue)
+            return self._executor, self._slots
+
+    # ------------------------------------------------------------
+    # 对外接口
+    # ------------------------------------------------------------
+
+    def verify(self, password, password_hash):
+        """校验密码（在线程池中执行）"""
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), password_hash.encode('utf-8'))
+
+    def hash(self, password, rounds=None):
+        """按配置的cost生成哈希（在线程池中执行）"""
+        hashed = self._run(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(rounds or self.rounds))
+        return hashed.decode('utf-8')
+
+    def verify_dummy(self, password):
+        """
+        用户不存在时调用: 和真实校验一样在线程池里做一次bcrypt，总是返回False
+        cost与 BCRYPT_ROUNDS 不同时按当前cost重新生成一次占位哈希
+        """
+        dummy = self._dummy_hash
+        if hash_rounds(dummy) != self.rounds:
+            dummy = self._dummy_hash = bcrypt.hashpw(b'not-a-user', bcrypt.gensalt(self.rounds)).decode('utf-8')
+        self.verify(password, dummy)
+        return False
+
+    def needs_rehash(self, password_hash):
+        return hash_rounds(password_hash) != self.rounds
+
+    def stats(self):
+        with self._lock:
+            done = self.completed or 1
+            return {
+                'pool_size': self.pool_size,
+                'max_queue': self.max_queue,
+                'rounds': self.rounds,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'in_flight': self.in_flight,
+                'queued': max(self.in_flight - self.pool_size, 0),
+                'max_in_flight': self.max_in_flight,
+                'avg_wait_ms': round(self.wait_seconds / done * 1000, 2),
+                'max_wait_ms': round(self.max_wait_seconds * 1000, 2),
+                'avg_run_ms': round(self.run_seconds / done * 1000, 2)
+            }
+
+    # ------------------------------------------------------------
+
+    def _run(self, fn, *args):
+        executor, slots = self._get_executor()
+        if not slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise PasswordHasherBusy('Too many concurrent password checks')
+
+        submitted_at = time.perf_counter()
+        with self._lock:
+            self.submitted += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+        def task():
+            started_at = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                finished_at = time.perf_counter()
+                with self._lock:
+                    wait = started_at - submitted_at
+                    self.wait_seconds += wait
+                    self.max_wait_seconds = max(self.max_wait_seconds, wait)
+                    self.run_seconds += finished_at - started_at
+                    self.completed += 1
+                    self.in_flight -= 1
+                slots.release()
+
+        future = executor.submit(task)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # 还在排队的任务直接取消并归还名额；已经开始执行的会自己执行完再归还
+            cancelled = future.cancel()
+            with self._lock:
+                self.rejected += 1
+                if cancelled:
+                    self.in_flight -= 1
+            if cancelled:
+                slots.release()
+            raise PasswordHasherBusy('Password check timed out in queue')
+
+
+password_hasher = PasswordHasher()
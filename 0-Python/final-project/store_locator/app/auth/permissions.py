@@ -0,0 +1,175 @@
+"""
+权限缓存
+每个进程一个LRU: user_id -> AuthUser（用户状态 + 权限frozenset），命中时鉴权不查数据库
+
+失效: 共享缓存（Redis）里存一个全局版本号，角色/权限/用户状态变更提交后换一个新版本号，
+各进程发现版本号变了就清空自己的LRU；另有TTL兜底（绕过ORM直接改表的情况）
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from sqlalchemy import select, inspect
+from sqlalchemy.orm import joinedload
+from store_locator.app.extensions import db, cache
+
+VERSION_KEY = 'auth:permissions-version'
+
+
+class AuthUser:
+    """鉴权后传给视图的 current_user（不绑定session，可以跨请求缓存）"""
+
+    __slots__ = ('id', 'email', 'status', 'role_name', 'permissions')
+
+    def __init__(self, id, email, status, role_name, permissions):
+        self.id = id
+        self.email = email
+        self.status = status
+        self.role_name = role_name
+        self.permissions = permissions
+
+    def has_permission(self, perm):
+        return perm in self.permissions
+
+
+class PermissionCache:
+
+    def __init__(self):
+        self.enabled = True
+        self.max_size = 1024
+        self.ttl = 300
+        self.version_check_interval = 1.0
+        self._lock = threading.Lock()
+        self._users = OrderedDict()      # user_id -> (loaded_at, AuthUser)
+        self._version = None
+        self._version_checked_at = 0.0
+
+    def init_app(self, app):
+        self.enabled = app.config.get('PERMISSION_CACHE_ENABLED', True)
+        self.max_size = app.config.get('PERMISSION_CACHE_SIZE', self.max_size)
+        self.ttl = app.config.get('PERMISSION_CACHE_TTL', self.ttl)
+        self.version_check_interval = app.config.get(
+            'PERMISSION_VERSION_CHECK_INTERVAL', self.version_check_interval
+        )
+
+    # ------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------
+
+    def get_user(self, user_id):
+        """返回 AuthUser，用户不存在返回None（不区分active，由调用方判断status）"""
+        if not self.enabled or not self._check_version():
+            return self._load(user_id)
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry and now - entry[0] < self.ttl:
+                self._users.move_to_end(user_id)
+                return entry[1]
+
+        user = self._load(user_id)
+        if user is not None:
+            with self._lock:
+                self._users[user_id] = (now, user)
+                self._users.move_to_end(user_id)
+                while len(self._users) > self.max_size:
+                    self._users.popitem(last=False)
+        return user
+
+    def _load(self, user_id):
+        """一条查询: 用户 + 角色 + 权限"""
+        from store_locator.app.models import User, Role
+
+        user = db.session.execute(
+            select(User).where(User.id == user_id)
+            .options(joinedload(User.role).joinedload(Role.permissions))
+        ).unique().scalar_one_or_none()
+        if user is None:
+            return None
+
+        role = user.role
+        return AuthUser(
+            id=user.id,
+            email=user.email,
+            status=user.status,
+            role_name=role.name if role else None,
+            permissions=frozenset(p.name for p in role.permissions) if role else frozenset()
+        )
+
+    def _check_version(self):
+        """
+        和共享缓存里的版本号比较，变了就清空本地LRU
+        共享缓存不可用时返回False（不使用本地缓存，每次查库）
+        """
+        now = time.monotonic()
+        if now - self._version_checked_at < self.version_check_interval:
+            return True
+
+        try:
+            version = cache.get(VERSION_KEY)
+            if version is None:
+                version = uuid.uuid4().hex[:12]
+                cache.set(VERSION_KEY, version, timeout=0)
+        except Exception as e:
+            print(f"[Permission cache] unavailable: {e}")
+            self.clear()
+            return False
+
+        with self._lock:
+            if version != self._version:
+                self._users.clear()
+                self._version = version
+            self._version_checked_at = now
+        return True
+
+    # ------------------------------------------------------------
+    # 失效
+    # ------------------------------------------------------------
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+            self._version = None
+            self._version_checked_at = 0.0
+
+    def invalidate(self):
+        """所有进程的权限缓存失效（换一个新版本号）"""
+        self.clear()
+        try:
+            cache.set(VERSION_KEY, uuid.uuid4().hex[:12], timeout=0)
+        except Exception as e:
+            print(f"[Permission cache] invalidation failed: {e}")
+
+
+permission_cache = PermissionCache()
+
+
+# ------------------------------------------------------------
+# ORM钩子: 角色/权限/用户状态有变化的事务提交后失效
+# ------------------------------------------------------------
+
+def track_auth_changes(session, flush_context):
+    """after_flush: 标记本事务改过鉴权相关的数据（改last_login等字段不算）"""
+    from store_locator.app.models import User, Role, Permission
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (Role, Permission)):
+            session.info['auth_changed'] = True
+            return
+        if isinstance(obj, User) and obj not in session.new:
+            attrs = inspect(obj).attrs
+            if obj in session.deleted or any(
+                attrs[name].history.has_changes() for name in ('status', 'role_id', 'role')
+            ):
+                session.info['auth_changed'] = True
+                return
+
+
+def invalidate_after_commit(session):
+    if session.info.pop('auth_changed', False):
+        permission_cache.invalidate()
+
+
+def discard_after_rollback(session):
+    session.info.pop('auth_changed', None)
@@ -2,13 +2,15 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import (
     create_access_token,
-    create_refresh_token,
     jwt_required,
     get_jwt_identity
 )
 from store_locator.app.models import User, RefreshToken
 from store_locator.app.extensions import db
-from datetime import datetime, timedelta
+from store_locator.app.auth.passwords import password_hasher, PasswordHasherBusy
+from store_locator.app.auth.permissions import permission_cache
+from store_locator.app.auth.tokens import issue_refresh_token
+from datetime import datetime
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 
@@ -25,38 +27,37 @@ def login():
 
     # 查找用户
     user = User.query.filter_by(email=email).first()
-    print("Password hash in DB:", user.password_hash)
-    print("Check password result:", user.check_password(password))
-
     
-    # 验证密码
-    if not user or not user.check_password(data['password']):
-        print("Trying login for:", email, password)
+    # 验证密码（只做一次bcrypt，在有界线程池中执行）
+    # 邮箱不存在时也做一次同样cost的bcrypt，两种401的响应时间相同
+    try:
+        if user is None:
+            valid = password_hasher.verify_dummy(password)
+        else:
+            valid = user.check_password(password)
+    except PasswordHasherBusy:
+        response = jsonify({'error': 'Too many login attempts in progress, please retry'})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    
+    if not valid:
         return jsonify({'error': 'Invalid email or password'}), 401
-    if not user:
-        print("User not found")
-    else:
-        print("User found. Password check:", user.check_password(data['password']))
-        print("User status:", user.status)
-
 
     if user.status != 'active':
         return jsonify({'error': 'Account is inactive'}), 403
 
     # 生成tokens
     access_token = create_access_token(identity=str(user.id))
-    refresh_token = create_refresh_token(identity=str(user.id))
+    refresh_token = issue_refresh_token(user.id)
     
 
-    token_hash = RefreshToken.hash_token(refresh_token)
-    rt = RefreshToken(
-        token_hash=token_hash,
-        user_id=user.id,
-        expires_at=datetime.utcnow() + timedelta(days=7)
-    )
-    db.session.add(rt)
+    # cost与 BCRYPT_ROUNDS 不一致时用新cost重新哈希（调整登录延迟用）
+    if password_hasher.needs_rehash(user.password_hash):
+        try:
+            user.set_password(password)
+        except PasswordHasherBusy:
+            pass
     
-
     user.last_login = datetime.utcnow()
     db.session.commit()
     
@@ -74,10 +75,11 @@ def login():
 @jwt_required(refresh=True)
 def refresh():
 
+    # 已登出/过期的refresh token在 jwt_required 里就被拒绝（auth/tokens.py is_token_revoked）
     user_id = int(get_jwt_identity())
     
 
-    user = User.query.get(user_id)
+    user = permission_cache.get_user(user_id)
     if not user or user.status != 'active':
         return jsonify({'error': 'Invalid user'}), 401
     
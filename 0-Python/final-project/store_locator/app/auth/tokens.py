@@ -0,0 +1,116 @@
+"""
+Refresh token 生命周期
+- 登录时记录 sha256(jti) + 过期时间（不存整个token，表和唯一索引都更小）
+- /refresh 时按 token_hash 唯一索引查一次: 行不存在（已登出/已清理）或已过期即视为吊销
+- 过期行按 expires_at 索引分批删除（脚本 scripts/purge_refresh_tokens.py 或进程内定时线程）
+access token 不查表，鉴权仍然零查询
+"""
+import threading
+import time
+from datetime import datetime, timezone
+from flask_jwt_extended import create_refresh_token, decode_token
+from sqlalchemy import select, delete
+from store_locator.app.extensions import db, jwt
+
+
+def issue_refresh_token(user_id):
+    """生成refresh token并登记（由调用方提交）"""
+    from store_locator.app.models import RefreshToken
+
+    token = create_refresh_token(identity=str(user_id))
+    claims = decode_token(token)
+    db.session.add(RefreshToken(
+        token_hash=RefreshToken.hash_token(claims['jti']),
+        user_id=user_id,
+        expires_at=datetime.fromtimestamp(claims['exp'], tz=timezone.utc).replace(tzinfo=None)
+    ))
+    return token
+
+
+@jwt.token_in_blocklist_loader
+def is_token_revoked(jwt_header, jwt_payload):
+    """只检查refresh token: 表里没有或已过期即吊销"""
+    if jwt_payload.get('type') != 'refresh':
+        return False
+
+    from store_locator.app.models import RefreshToken
+
+    found = db.session.execute(
+        select(RefreshToken.id).where(
+            RefreshToken.token_hash == RefreshToken.hash_token(jwt_payload['jti']),
+            RefreshToken.expires_at > datetime.utcnow()
+        )
+    ).first()
+    return found is None
+
+
+def purge_expired_tokens(batch_size=1000, pause=0.0, max_batches=None):
+    """
+    分批删除过期的refresh token（每批一个短事务，不长时间锁表）
+
+    参数:
+        batch_size: 每批删除的行数
+        pause: 每批之间休眠秒数（给线上写入让路）
+        max_batches: 最多删除几批，None表示删完为止
+    返回: 删除的总行数
+    """
+    from store_locator.app.models import RefreshToken
+
+    table = RefreshToken.__table__
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = db.session.execute(
+            select(table.c.id)
+            .where(table.c.expires_at <= datetime.utcnow())
+            .order_by(table.c.expires_at)
+            .limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+
+        db.session.execute(delete(table).where(table.c.id.in_(ids)))
+        db.session.commit()
+        total += len(ids)
+        batches += 1
+        if pause:
+            time.sleep(pause)
+
+    return total
+
+
+class TokenPurger:
+    """进程内定时清理（REFRESH_TOKEN_PURGE_INTERVAL > 0 时启用；多进程部署建议改用cron跑脚本）"""
+
+    def __init__(self):
+        self._app = None
+        self._started = False
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self._app = app
+        self.interval = app.config.get('REFRESH_TOKEN_PURGE_INTERVAL', 0)
+        self.batch_size = app.config.get('REFRESH_TOKEN_PURGE_BATCH', 1000)
+        if self.interval > 0:
+            self.start()
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._loop, daemon=True, name='refresh-token-purge').start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                with self._app.app_context():
+                    deleted = purge_expired_tokens(self.batch_size, pause=0.1)
+                    if deleted:
+                        print(f"[Token purge] deleted {deleted} expired refresh tokens")
+            except Exception as e:
+                print(f"[Token purge] failed: {e}")
+
+
+token_purger = TokenPurger()
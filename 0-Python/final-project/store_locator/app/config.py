@@ -1,5 +1,7 @@
 
+import json
 import os
+import tempfile
 from datetime import timedelta
 from dotenv import load_dotenv
 
@@ -12,11 +14,38 @@ class Config:
 
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_BINDS = json.loads(os.getenv('SQLALCHEMY_BINDS', '{}'))        # 分片库 {"us_east": "sqlite:///east.db"}
+    STORE_SHARDS = json.loads(os.getenv('STORE_SHARDS', '{}'))                # 分片包含的州/国家/geohash前缀，见 stores/shards.py
+    STORE_DEFAULT_SHARD = os.getenv('STORE_DEFAULT_SHARD')                     # 都不匹配的店铺写到这个分片
+    STORE_SHARD_WORKERS = int(os.getenv('STORE_SHARD_WORKERS', 8))            # 并发查询分片的线程数
+    STORE_SHARD_EXTENT_TTL = int(os.getenv('STORE_SHARD_EXTENT_TTL', 300))    # 分片覆盖范围多久重新汇总一次（秒）
+    STORE_SHARD_LAYOUT_CHECK_INTERVAL = float(os.getenv('STORE_SHARD_LAYOUT_CHECK_INTERVAL', 5))  # 多久检查一次是否重新拆分过（秒）
+    SQLALCHEMY_ENGINE_OPTIONS = {                                             # 主库连接池（写入、导入、登录）
+        'pool_size': int(os.getenv('DB_POOL_SIZE')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10))
+    } if os.getenv('DB_POOL_SIZE') else {}
+    DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')                   # 只读副本（搜索、管理后台GET），空表示不启用
+    REPLICA_POOL_SIZE = int(os.getenv('REPLICA_POOL_SIZE', 10))                # 副本库独立的连接池
+    REPLICA_MAX_OVERFLOW = int(os.getenv('REPLICA_MAX_OVERFLOW', 10))
+    REPLICA_POOL_TIMEOUT = float(os.getenv('REPLICA_POOL_TIMEOUT', 1.0))       # 等不到副本连接时改走主库
+    REPLICA_MAX_LAG_SECONDS = float(os.getenv('REPLICA_MAX_LAG_SECONDS', 10))  # 容忍的副本延迟，超过走主库
+    REPLICA_CHECK_INTERVAL = float(os.getenv('REPLICA_CHECK_INTERVAL', 2.0))   # 多久检查一次延迟（秒）
+    REPLICA_RETRY_INTERVAL = float(os.getenv('REPLICA_RETRY_INTERVAL', 10.0))  # 副本出错后多久再试
     
 
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=15)    
     JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=7)      
+    REFRESH_TOKEN_PURGE_INTERVAL = int(os.getenv('REFRESH_TOKEN_PURGE_INTERVAL', 0))  # 秒，0表示不在进程内清理
+    REFRESH_TOKEN_PURGE_BATCH = int(os.getenv('REFRESH_TOKEN_PURGE_BATCH', 1000))
+    BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))                        # 调整后登录时自动重新哈希
+    BCRYPT_POOL_SIZE = int(os.getenv('BCRYPT_POOL_SIZE', 2))                   # 每个进程同时计算的bcrypt数
+    BCRYPT_MAX_QUEUE = int(os.getenv('BCRYPT_MAX_QUEUE', 32))                  # 超过则返回503
+    BCRYPT_TIMEOUT = float(os.getenv('BCRYPT_TIMEOUT', 10))
+    PERMISSION_CACHE_ENABLED = os.getenv('PERMISSION_CACHE_ENABLED', 'true').lower() == 'true'
+    PERMISSION_CACHE_SIZE = int(os.getenv('PERMISSION_CACHE_SIZE', 1024))      # 每个进程缓存的用户数
+    PERMISSION_CACHE_TTL = int(os.getenv('PERMISSION_CACHE_TTL', 300))         # 兜底过期（秒）
+    PERMISSION_VERSION_CHECK_INTERVAL = float(os.getenv('PERMISSION_VERSION_CHECK_INTERVAL', 1.0))
     
 
     REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
@@ -29,7 +58,64 @@ class Config:
 
     RATELIMIT_STORAGE_URL = REDIS_URL
     RATELIMIT_HEADERS_ENABLED = True
+    RATE_LIMIT_SYNC_INTERVAL = float(os.getenv('RATE_LIMIT_SYNC_INTERVAL', 0.5))    # 本地计数批量同步到Redis的间隔
+    RATE_LIMIT_RETRY_INTERVAL = float(os.getenv('RATE_LIMIT_RETRY_INTERVAL', 5.0))  # Redis不可用时重试间隔
+    RATE_LIMIT_BACKEND_TIMEOUT = float(os.getenv('RATE_LIMIT_BACKEND_TIMEOUT', 0.2))
     
 
     GEOCODING_SERVICE = os.getenv('GEOCODING_SERVICE', 'nominatim')
-    NOMINATIM_USER_AGENT = os.getenv('NOMINATIM_USER_AGENT', 'store-locator/1.0')
\ No newline at end of file
+    NOMINATIM_USER_AGENT = os.getenv('NOMINATIM_USER_AGENT', 'store-locator/1.0')
+    NOMINATIM_DOMAIN = os.getenv('NOMINATIM_DOMAIN', 'nominatim.openstreetmap.org')  # 自建Nominatim时改成自己的域名
+    NOMINATIM_SCHEME = os.getenv('NOMINATIM_SCHEME', 'https')
+    GEOCODE_TIMEOUT = int(os.getenv('GEOCODE_TIMEOUT', 10))
+    GEOCODER_POOL_SIZE = int(os.getenv('GEOCODER_POOL_SIZE', 10))            # HTTP连接池大小
+    GEOCODE_CACHE_TTL = 30 * 24 * 60 * 60                                    # 成功结果30天
+    GEOCODE_NEGATIVE_TTL = int(os.getenv('GEOCODE_NEGATIVE_TTL', 60 * 60))    # 地址找不到
+    GEOCODE_ERROR_TTL = int(os.getenv('GEOCODE_ERROR_TTL', 60))               # 超时/网络错误
+    GEOCODE_BULK_DELAY = float(os.getenv('GEOCODE_BULK_DELAY', 1.0))          # Nominatim限制每秒1次
+    POSTAL_CENTROIDS_DB = os.getenv(
+        'POSTAL_CENTROIDS_DB',
+        os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'postal_centroids.sqlite')
+    )
+
+
+    SEARCH_CACHE_ENABLED = os.getenv('SEARCH_CACHE_ENABLED', 'true').lower() == 'true'
+    SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', 300))                # 搜索结果缓存5分钟
+    SEARCH_CACHE_GRID_DEGREES = 0.01                                          # 中心点吸附网格（约0.7英里）
+    SEARCH_CACHE_TILE_DEGREES = 1.0                                           # 失效粒度
+    STORE_FRAGMENT_CACHE_ENABLED = os.getenv('STORE_FRAGMENT_CACHE_ENABLED', 'true').lower() == 'true'
+    STORE_FRAGMENT_CACHE_SIZE = int(os.getenv('STORE_FRAGMENT_CACHE_SIZE', 20000))  # 每个进程缓存的店铺JSON片段数
+    POSTAL_NEARBY_ENABLED = os.getenv('POSTAL_NEARBY_ENABLED', 'true').lower() == 'true'  # 邮编搜索读预计算表
+    POSTAL_NEARBY_MAX_MILES = float(os.getenv('POSTAL_NEARBY_MAX_MILES', 50))  # 预计算到的最大半径
+    POSTAL_NEARBY_MAX_STORES = int(os.getenv('POSTAL_NEARBY_MAX_STORES', 100))  # 每个邮编最多保存的店铺数
+    POSTAL_NEARBY_SYNC_LIMIT = int(os.getenv('POSTAL_NEARBY_SYNC_LIMIT', 100))  # 一次变更不超过这么多家时当场刷新，否则交给后台线程
+    POSTAL_NEARBY_REFRESH_BATCH = int(os.getenv('POSTAL_NEARBY_REFRESH_BATCH', 1000))  # 后台刷新每批店铺数（一个事务）
+
+
+    DISTANCE_METHOD = os.getenv('DISTANCE_METHOD', 'haversine')               # haversine | geodesic
+
+
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'  # /metrics（Prometheus）
+
+
+    SPATIAL_INDEX_ENABLED = os.getenv('SPATIAL_INDEX_ENABLED', 'true').lower() == 'true'
+    SPATIAL_INDEX_MAX_AGE = int(os.getenv('SPATIAL_INDEX_MAX_AGE', 300))       # 秒，0表示永不过期
+    SPATIAL_INDEX_CELL_DEGREES = float(os.getenv('SPATIAL_INDEX_CELL_DEGREES', 0.5))
+
+
+    IMPORT_CHUNK_SIZE = int(os.getenv('IMPORT_CHUNK_SIZE', 1000))              # 每条upsert语句的行数
+    IMPORT_VALIDATION_WORKERS = int(os.getenv('IMPORT_VALIDATION_WORKERS', os.cpu_count() or 1))
+    IMPORT_VALIDATION_PARALLEL_ROWS = int(os.getenv('IMPORT_VALIDATION_PARALLEL_ROWS', 50000))  # 超过才用进程池
+    IMPORT_VALIDATION_START_METHOD = os.getenv('IMPORT_VALIDATION_START_METHOD', 'spawn')  # 校验子进程启动方式（spawn/forkserver）
+    IMPORT_WORKERS = int(os.getenv('IMPORT_WORKERS', 2))                      # 每个进程的后台导入线程数
+    IMPORT_JOB_HEARTBEAT_INTERVAL = int(os.getenv('IMPORT_JOB_HEARTBEAT_INTERVAL', 10))  # 后台导入任务心跳间隔（秒）
+    IMPORT_JOB_STALE_SECONDS = int(os.getenv('IMPORT_JOB_STALE_SECONDS', 60))    # 超过这么久没有心跳视为进程已退出
+    IMPORT_SPOOL_DIR = os.getenv(
+        'IMPORT_SPOOL_DIR',
+        os.path.join(tempfile.gettempdir(), 'store_locator_imports')
+    )
+
+
+    ADMIN_MAX_PER_PAGE = int(os.getenv('ADMIN_MAX_PER_PAGE', 200))
+    ADMIN_BULK_MAX_ITEMS = int(os.getenv('ADMIN_BULK_MAX_ITEMS', 1000))        # 批量修改每次最多店铺数
+    ADMIN_COUNT_CACHE_TTL = int(os.getenv('ADMIN_COUNT_CACHE_TTL', 60))       # 店铺总数缓存（游标分页）
@@ -0,0 +1,255 @@
+"""
+读写分离: 只读请求走副本库
+公开搜索和管理后台的店铺GET端点用 @replica_reads 标记，其余请求（写入、CSV导入、登录、用户/角色）都走主库
+（延迟只按 stores.updated_at 检测，用户/角色表的延迟看不到，所以不放到副本上读）
+
+- 副本库有自己的连接池（REPLICA_POOL_SIZE），搜索流量不会占满主库的连接池
+- 延迟检查: 每 REPLICA_CHECK_INTERVAL 秒比较一次两边的 stores.updated_at，
+  延迟 = 主库上副本还没看到的最早一次修改距今多久；超过 REPLICA_MAX_LAG_SECONDS 时回退到主库
+  （硬删除不改updated_at，检测不到；店铺下线是改status，能检测到）
+- 副本不可用（连接失败、查询出错）: 本次请求在主库上重试一次，之后 REPLICA_RETRY_INTERVAL 秒内都走主库
+- 副本连接池等待超时（REPLICA_POOL_TIMEOUT）: 本次请求改走主库，不标记副本故障
+- 标记的请求里一旦有写入（flush），同一个session后续的读也留在主库（读到自己的写入）
+- 本进程有店铺写入（stores_changed）后下一个请求立即重新检查延迟；
+  在副本上算出的搜索结果只有延迟为0时才写入共享的结果缓存（replica_reads_stale，见 result_cache.py）
+
+两边的连接池使用情况在 /metrics 导出（db_pool_*{bind="primary|replica"}）
+"""
+import contextvars
+import threading
+import time
+from datetime import datetime
+from functools import wraps
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, select, func
+from sqlalchemy.exc import DBAPIError, TimeoutError as PoolTimeoutError
+from store_locator.app.stores.signals import stores_changed
+
+_reads_on_replica = contextvars.ContextVar('reads_on_replica', default=False)
+_replica_used = contextvars.ContextVar('replica_used', default=False)
+
+
+class RoutingSession(Session):
+    """标记为只读的请求里，没有写入的查询绑定到副本库"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and _reads_on_replica.get() and not self._flushing
+                and not self.info.get('has_writes') and not getattr(clause, 'is_dml', False)):
+            engine = db_router.replica_engine
+            if engine is not None:
+                _replica_used.set(True)
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def mark_session_writes(session, flush_context):
+    """flush之后本session的读都走主库"""
+    session.info['has_writes'] = True
+
+
+def replica_reads_stale():
+    """本次请求已经在副本上读过，且副本不确定已追上主库（延迟非0或未知）"""
+    return _replica_used.get() and db_router.lag != 0
+
+
+class ReadReplicaRouter:
+
+    def __init__(self):
+        self.enabled = False
+        self.replica_engine = None
+        self.max_lag = 10.0
+        self.check_interval = 2.0
+        self.retry_interval = 10.0
+        self.healthy = False
+        self.lag = None
+        self._next_check = 0.0
+        self._check_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.replica_requests = 0
+        self.primary_requests = 0
+        self.fallbacks = {'lag': 0, 'unavailable': 0, 'error': 0, 'pool_timeout': 0}
+
+    def init_app(self, app):
+        if self.replica_engine is not None:
+            self.replica_engine.dispose()
+            self.replica_engine = None
+
+        url = app.config.get('DATABASE_REPLICA_URL')
+        self.enabled = bool(url)
+        self.max_lag = app.config.get('REPLICA_MAX_LAG_SECONDS', self.max_lag)
+        self.check_interval = app.config.get('REPLICA_CHECK_INTERVAL', self.check_interval)
+        self.retry_interval = app.config.get('REPLICA_RETRY_INTERVAL', self.retry_interval)
+        self.healthy = False
+        self.lag = None
+        self._next_check = 0.0
+        self._reset_stats()
+
+        if self.enabled:
+            stores_changed.connect(self._on_stores_changed, sender=app)
+            self.replica_engine = create_engine(
+                url,
+                pool_size=app.config.get('REPLICA_POOL_SIZE', 10),
+                max_overflow=app.config.get('REPLICA_MAX_OVERFLOW', 10),
+                pool_timeout=app.config.get('REPLICA_POOL_TIMEOUT', 1.0),
+                pool_pre_ping=True
+            )
+
+    def stats(self):
+        with self._stats_lock:
+            stats = {
+                'enabled': self.enabled,
+                'healthy': self.healthy,
+                'lag_seconds': self.lag,
+                'replica_requests': self.replica_requests,
+                'primary_requests': self.primary_requests
+            }
+            stats.update({f'fallbacks_{reason}': count for reason, count in self.fallbacks.items()})
+        return stats
+
+    # ------------------------------------------------------------
+    # 路由
+    # ------------------------------------------------------------
+
+    def replica_available(self):
+        """副本是否可用；到了检查时间由一个请求线程顺带检查延迟，其他线程用上次的结果"""
+        if not self.enabled:
+            return False
+        now = time.monotonic()
+        if now >= self._next_check and self._check_lock.acquire(blocking=False):
+            try:
+                self._check(now)
+            finally:
+                self._check_lock.release()
+        return self.healthy
+
+    def _check(self, now):
+        try:
+            lag = self.measure_lag()
+        except Exception as e:
+            if self.healthy or self.lag is not None:
+                print(f"[Replica] unavailable, reading from primary: {e}")
+            self.healthy, self.lag = False, None
+            self._next_check = now + self.retry_interval
+            return
+
+        healthy = lag <= self.max_lag
+        if healthy != self.healthy:
+            print(f"[Replica] lag {lag:.1f}s, {'reading from replica' if healthy else 'reading from primary'}")
+        self.healthy, self.lag = healthy, lag
+        self._next_check = now + self.check_interval
+
+    def measure_lag(self):
+        """主库上副本还没看到的最早一次店铺修改距今的秒数（都已同步时为0）"""
+        from store_locator.app.extensions import db
+        from store_locator.app.models import Store
+
+        updated_at = Store.__table__.c.updated_at
+        with self.replica_engine.connect() as conn:
+            replica_newest = conn.execute(select(func.max(updated_at))).scalar()
+
+        stmt = select(func.min(updated_at))
+        if replica_newest is not None:
+            stmt = stmt.where(updated_at > replica_newest)
+        with db.engine.connect() as conn:
+            oldest_missing = conn.execute(stmt).scalar()
+
+        if oldest_missing is None:
+            return 0.0
+        return max((datetime.utcnow() - oldest_missing).total_seconds(), 0.0)
+
+    def _on_stores_changed(self, sender, **extra):
+        """刚写入主库，副本多半还没追上: 下一个请求重新测量延迟"""
+        self._next_check = 0.0
+
+    def mark_failed(self, error):
+        print(f"[Replica] query failed, reading from primary for {self.retry_interval}s: {error}")
+        self.healthy, self.lag = False, None
+        self._next_check = time.monotonic() + self.retry_interval
+
+    def _count(self, replica, reason=None):
+        with self._stats_lock:
+            if replica:
+                self.replica_requests += 1
+            else:
+                self.primary_requests += 1
+            if reason:
+                self.fallbacks[reason] += 1
+
+    # ------------------------------------------------------------
+    # 连接池指标
+    # ------------------------------------------------------------
+
+    def pool_samples(self):
+        """[(name, type, help, value, labels)]，每个bind一组"""
+        from store_locator.app.extensions import db
+
+        pools = {'primary': db.engine.pool}
+        if self.replica_engine is not None:
+            pools['replica'] = self.replica_engine.pool
+
+        samples = []
+        for bind, pool in pools.items():
+            labels = {'bind': bind}
+            if not hasattr(pool, 'checkedout'):       # StaticPool等没有计数
+                continue
+            checked_out = pool.checkedout()
+            samples.append(('db_pool_checked_out', 'gauge', 'Connections in use', checked_out, labels))
+            if hasattr(pool, 'size'):
+                capacity = pool.size() + max(pool._max_overflow, 0)
+                samples.append(('db_pool_size', 'gauge', 'Configured pool size', pool.size(), labels))
+                samples.append(('db_pool_overflow', 'gauge', 'Connections opened beyond pool_size',
+                                max(pool.overflow(), 0), labels))
+                samples.append(('db_pool_capacity', 'gauge', 'pool_size + max_overflow', capacity, labels))
+                if capacity:
+                    samples.append(('db_pool_utilization', 'gauge', 'checked_out / capacity',
+                                    round(checked_out / capacity, 4), labels))
+        return samples
+
+
+db_router = ReadReplicaRouter()
+
+
+def replica_reads(fn):
+    """
+    只读视图: 查询走副本库（副本延迟过大/不可用时走主库）
+    副本出错时在主库上重新执行一次视图，所以只能用在没有副作用的端点上
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not db_router.enabled:
+            return fn(*args, **kwargs)
+
+        if not db_router.replica_available():
+            db_router._count(False, 'lag' if db_router.lag is not None else 'unavailable')
+            return fn(*args, **kwargs)
+
+        reads_token = _reads_on_replica.set(True)
+        used_token = _replica_used.set(False)
+        try:
+            try:
+                response = fn(*args, **kwargs)
+                db_router._count(True)
+                return response
+            except (DBAPIError, PoolTimeoutError) as e:
+                if not _replica_used.get():
+                    raise
+                from store_locator.app.extensions import db
+
+                if isinstance(e, PoolTimeoutError):
+                    reason = 'pool_timeout'
+                else:
+                    reason = 'error'
+                    db_router.mark_failed(e)
+                db.session.rollback()
+                _reads_on_replica.set(False)
+                response = fn(*args, **kwargs)
+                db_router._count(False, reason)
+                return response
+        finally:
+            _replica_used.reset(used_token)
+            _reads_on_replica.reset(reads_token)
+
+    return wrapper
@@ -5,9 +5,10 @@ from flask_migrate import Migrate
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_caching import Cache
+from store_locator.app.db_routing import RoutingSession
 
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})    # 只读请求路由到副本库，见 db_routing.py
 
 
 jwt = JWTManager()
@@ -0,0 +1,239 @@
+"""
+轻量指标（Prometheus文本格式，不依赖prometheus_client）
+- Counter / Histogram，带标签，线程安全
+- 其他组件的 stats()（缓存命中、限流、bcrypt队列）通过 register_stats 在导出时读取
+- 搜索分阶段计时: SearchTimings 用 contextvars 绑定到当前请求，各阶段用 stage() 计时
+
+指标是每个进程各自的（gunicorn多worker时每次抓取只看到一个worker）
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ''
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}     # labels -> [每个桶的计数..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def totals(self):
+        """{标签值元组: (count, sum)}，benchmark用来计算两次快照之间的均值"""
+        with self._lock:
+            return {key: (data[-1], data[-2]) for key, data in self._values.items()}
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, data in sorted(self._values.items()):
+                for bound, count in zip(self.buckets + (float('inf'),), data[:len(self.buckets)] + [data[-1]]):
+                    labels = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+                    lines.append(f'{self.name}_bucket{labels} {count}')
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f'{self.name}_sum{labels} {_format_value(round(data[-2], 6))}')
+                lines.append(f'{self.name}_count{labels} {data[-1]}')
+        return lines
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def counter(self, *args, **kwargs):
+        return self._add(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self._add(Histogram(*args, **kwargs))
+
+    def _add(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, name, fn):
+        """
+        fn() -> [(name, type, help, value[, labels]), ...]（gauge/counter，导出时调用；labels是dict）
+        同名重复注册会覆盖（测试/benchmark里多次create_app）
+        """
+        with self._lock:
+            self._collectors[name] = fn
+
+    def register_stats(self, prefix, stats_fn, counters=()):
+        """把组件的 stats() 字典导出为 <prefix>_<key>；只导出数值/布尔，counters里的键标为counter"""
+        def collect():
+            samples = []
+            for key, value in stats_fn().items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                kind = 'counter' if key in counters else 'gauge'
+                samples.append((f'{prefix}_{key}', kind, f'{prefix} {key}', value))
+            return samples
+
+        self.register_collector(prefix, collect)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics):
+            lines.extend(metric.render())
+        for fn in list(self._collectors.values()):
+            try:
+                samples = fn()
+            except Exception as e:
+                print(f"[Metrics] collector failed: {e}")
+                continue
+            families = {}       # 同名（不同标签）的样本要连续输出
+            for name, kind, help_text, value, *labels in samples:
+                if value is not None:
+                    families.setdefault((name, kind, help_text), []).append((labels[0] if labels else {}, value))
+            for (name, kind, help_text), values in families.items():
+                lines.extend([f'# HELP {name} {help_text}', f'# TYPE {name} {kind}'])
+                for labels, value in values:
+                    lines.append(f'{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+SEARCH_STAGE_SECONDS = metrics.histogram(
+    'store_search_stage_seconds', 'Time spent in each store search stage', ['stage']
+)
+SEARCH_REQUEST_SECONDS = metrics.histogram(
+    'store_search_request_seconds', 'Total store search time', ['mode']
+)
+SEARCH_CANDIDATE_ROWS = metrics.histogram(
+    'store_search_candidate_rows', 'Candidate rows fetched per search', buckets=ROW_BUCKETS
+)
+SEARCH_RETURNED_ROWS = metrics.histogram(
+    'store_search_returned_rows', 'Stores returned per search', buckets=ROW_BUCKETS
+)
+SEARCH_ROWS_TOTAL = metrics.counter(
+    'store_search_rows_total', 'Candidate rows fetched vs stores returned', ['kind']
+)
+
+
+# ------------------------------------------------------------
+# 搜索分阶段计时
+# ------------------------------------------------------------
+
+_current_timings = contextvars.ContextVar('search_timings', default=None)
+
+
+class SearchTimings:
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages = {}
+        self.candidates = 0
+        self.returned = 0
+        self.total = None
+
+    def to_dict(self):
+        return {
+            'total_ms': round((self.total or 0) * 1000, 3),
+            'stages_ms': {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()},
+            'candidate_rows': self.candidates,
+            'returned_rows': self.returned
+        }
+
+
+def start_search_timings():
+    timings = SearchTimings()
+    return timings, _current_timings.set(timings)
+
+
+def finish_search_timings(timings, token, mode='radius'):
+    """记录本次搜索的所有指标并解除绑定"""
+    _current_timings.reset(token)
+    timings.total = time.perf_counter() - timings.started_at
+
+    SEARCH_REQUEST_SECONDS.observe(timings.total, mode=mode)
+    for name, seconds in timings.stages.items():
+        SEARCH_STAGE_SECONDS.observe(seconds, stage=name)
+    SEARCH_CANDIDATE_ROWS.observe(timings.candidates)
+    SEARCH_RETURNED_ROWS.observe(timings.returned)
+    SEARCH_ROWS_TOTAL.inc(timings.candidates, kind='candidate')
+    SEARCH_ROWS_TOTAL.inc(timings.returned, kind='returned')
+    return timings
+
+
+@contextmanager
+def stage(name):
+    """给当前搜索的某个阶段计时（同名阶段累加，例如nearest模式的多轮查询）；没有绑定时不计时"""
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.stages[name] = timings.stages.get(name, 0.0) + time.perf_counter() - started
+
+
+def count_candidates(n):
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.candidates += n
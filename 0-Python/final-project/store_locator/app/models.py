@@ -1,7 +1,13 @@
 
 from datetime import datetime
 from store_locator.app.extensions import db
-import bcrypt
+from store_locator.app.stores.hours import DAY_COLUMNS, pack_week, is_open_at, day_window, format_minute
+from store_locator.app.stores.service_mask import sync_services_mask
+from store_locator.app.auth.passwords import password_hasher
+from store_locator.app.auth.permissions import track_auth_changes, invalidate_after_commit, discard_after_rollback
+from store_locator.app.stores.fragments import track_store_changes, drop_fragments_after_commit, forget_store_changes
+from store_locator.app.db_routing import mark_session_writes
+from sqlalchemy.orm import Session
 import hashlib
 
 store_services = db.Table('store_services',
@@ -14,6 +20,13 @@ role_permissions = db.Table('role_permissions',
     db.Column('permission_id', db.Integer, db.ForeignKey('permissions.id'), primary_key=True)
 )
 
+# CSV导入暂存表（全部或全不导入模式）: 校验通过的行先写到这里，最后一个事务合并进stores
+store_import_rows = db.Table('store_import_rows',
+    db.Column('import_id', db.String(36), primary_key=True),
+    db.Column('row_number', db.Integer, primary_key=True),
+    db.Column('data', db.JSON, nullable=False)
+)
+
 
 
 class Store(db.Model):
@@ -46,73 +59,77 @@ class Store(db.Model):
     hours_fri = db.Column(db.String(20))
     hours_sat = db.Column(db.String(20))
     hours_sun = db.Column(db.String(20))
+    # 写入时由hours_*预编译（见stores/hours.py），7天 x (开门分钟, 关门分钟)
+    hours_packed = db.Column(db.LargeBinary(28))
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
 
     services = db.relationship('Service', secondary=store_services, backref='stores')
+    # store_services 的反范式位图（bit = Service.id - 1），flush后自动同步，见stores/service_mask.py
+    services_mask = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
     
 
     __table_args__ = (
         db.Index('idx_store_coordinates', 'latitude', 'longitude'),
+        # 管理端按 (updated_at, id) 游标分页
+        db.Index('idx_store_updated_at_id', 'updated_at', 'id'),
     )
     
     def to_dict(self, include_distance=False, distance=None):
+        """单个店铺序列化；批量场景请用 stores.serializers.serialize_stores"""
+        from store_locator.app.stores.serializers import build_store_dict
 
-        return {
-            'id': self.store_id,
-            'name': self.name,
-            'type': self.store_type,
-            'status': self.status,
-            'address': {
-                'street': self.address_street,
-                'city': self.address_city,
-                'state': self.address_state,
-                'postal_code': self.address_postal_code,
-                'country': self.address_country
-            },
-            'phone': self.phone,
-            'coordinates': {
-                'latitude': float(self.latitude),
-                'longitude': float(self.longitude)
-            },
-            'services': [s.name for s in self.services],
-            'hours': {
-                'monday': self.hours_mon,
-                'tuesday': self.hours_tue,
-                'wednesday': self.hours_wed,
-                'thursday': self.hours_thu,
-                'friday': self.hours_fri,
-                'saturday': self.hours_sat,
-                'sunday': self.hours_sun
-            },
-            'distance_miles': round(distance, 2) if include_distance and distance else None,
-            'is_open_now': self.is_open_now()
-        }
+        return build_store_dict(
+            self,
+            [s.name for s in self.services],
+            distance if include_distance else None,
+            self.is_open_now()
+        )
     
-    def is_open_now(self):
+    @property
+    def packed_hours(self):
+        """预编译的营业时间；老数据还没回填时现场编码"""
+        return self.hours_packed or pack_week([getattr(self, col) for col in DAY_COLUMNS])
+    
+    def is_open_now(self, now=None):
 
         if self.status != 'active':
             return False
         
-        now = datetime.utcnow()
-        weekday = now.weekday()
-        hours_map = [self.hours_mon, self.hours_tue, self.hours_wed,
-                     self.hours_thu, self.hours_fri, self.hours_sat, self.hours_sun]
-        today_hours = hours_map[weekday]
-        
-        if not today_hours or today_hours.lower() == 'closed':
-            return False
-        
-        try:
-            open_time, close_time = today_hours.split('-')
-            oh, om = map(int, open_time.split(':'))
-            ch, cm = map(int, close_time.split(':'))
-            current = now.hour * 60 + now.minute
-            return (oh * 60 + om) <= current <= (ch * 60 + cm)
-        except:
-            return False
+        now = now or datetime.utcnow()
+        return is_open_at(self.packed_hours, now.weekday(), now.hour * 60 + now.minute)
+    
+    def todays_hours(self, now=None):
+        """
+        今天几点开门/关门
+        返回: {'opens_at': '08:00', 'closes_at': '22:00'}，今天休息返回None
+        """
+        now = now or datetime.utcnow()
+        window = day_window(self.packed_hours, now.weekday())
+        if window is None:
+            return None
+        return {'opens_at': format_minute(window[0]), 'closes_at': format_minute(window[1])}
+
+
+@db.event.listens_for(Store, 'before_insert')
+@db.event.listens_for(Store, 'before_update')
+def _pack_store_hours(mapper, connection, target):
+    """每次写入店铺时重新编码营业时间"""
+    target.hours_packed = pack_week([getattr(target, col) for col in DAY_COLUMNS])
+
+
+# services关系变化后同步 services_mask
+db.event.listen(Session, 'after_flush', sync_services_mask)
+
+# 店铺修改/删除提交后丢弃预编码的JSON片段（见stores/fragments.py）
+db.event.listen(Session, 'after_flush', track_store_changes)
+db.event.listen(Session, 'after_commit', drop_fragments_after_commit)
+db.event.listen(Session, 'after_rollback', forget_store_changes)
+
+# 有写入的session之后的读都留在主库（见db_routing.py）
+db.event.listen(Session, 'after_flush', mark_session_writes)
 
 
 class Service(db.Model):
@@ -122,6 +139,32 @@ class Service(db.Model):
     name = db.Column(db.String(50), unique=True, nullable=False, index=True)
 
 
+class PostalNearbyCode(db.Model):
+    """已预计算的邮编（见stores/postal_nearby.py），没有这一行的邮编走实时搜索"""
+
+    __tablename__ = 'postal_nearby_codes'
+
+    postal_code = db.Column(db.String(10), primary_key=True)
+    # 列表在这个半径内是完整的（截断到 POSTAL_NEARBY_MAX_STORES 家时小于最大半径）
+    complete_miles = db.Column(db.Float, nullable=False)
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class PostalNearbyStore(db.Model):
+    """邮编质心 -> 附近店铺及距离"""
+
+    __tablename__ = 'postal_nearby_stores'
+
+    postal_code = db.Column(db.String(10), primary_key=True)
+    store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), primary_key=True, index=True)
+    distance_miles = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        # 按邮编顺序读出最近的店铺
+        db.Index('idx_postal_nearby_distance', 'postal_code', 'distance_miles'),
+    )
+
+
 class User(db.Model):
 
     __tablename__ = 'users'
@@ -136,10 +179,11 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def set_password(self, password):
-        self.password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
-        return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
+        """在bcrypt线程池中校验；排队已满时抛 PasswordHasherBusy"""
+        return password_hasher.verify(password, self.password_hash)
 
     def has_permission(self, perm):
 
@@ -159,18 +203,71 @@ class Permission(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(50), unique=True, nullable=False)
 
+# 角色/权限/用户状态变更提交后让权限缓存失效（见auth/permissions.py）
+db.event.listen(Session, 'after_flush', track_auth_changes)
+db.event.listen(Session, 'after_commit', invalidate_after_commit)
+db.event.listen(Session, 'after_rollback', discard_after_rollback)
+
 
 class RefreshToken(db.Model):
 
     __tablename__ = 'refresh_tokens'
     
     id = db.Column(db.Integer, primary_key=True)
-    token_hash = db.Column(db.String(255), unique=True, nullable=False, index=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
-    expires_at = db.Column(db.DateTime, nullable=False)
+    # sha256(jti) 的十六进制（见 auth/tokens.py）
+    token_hash = db.Column(db.String(64), unique=True, nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    # 过期清理按这个索引分批删除
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     @staticmethod
     def hash_token(token):
         """对token进行SHA256哈希"""
-        return hashlib.sha256(token.encode()).hexdigest()
\ No newline at end of file
+        return hashlib.sha256(token.encode()).hexdigest()
+
+
+class ImportJob(db.Model):
+    """后台CSV导入任务（状态、行计数写在库里，多个worker进程都能查询/取消）"""
+
+    __tablename__ = 'import_jobs'
+
+    id = db.Column(db.String(36), primary_key=True)
+    filename = db.Column(db.String(255))
+    mode = db.Column(db.String(10), nullable=False, default='atomic')         # stream | atomic
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    # queued → running → succeeded / failed / cancelled
+    total_rows = db.Column(db.Integer, nullable=False, default=0)
+    created = db.Column(db.Integer, nullable=False, default=0)
+    updated = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    failed_rows = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    file_path = db.Column(db.String(500))
+    # 执行任务的进程（主机名:pid）和它最近一次心跳，进程退出后据此判断任务已中断（见 import_jobs.py）
+    worker = db.Column(db.String(100))
+    heartbeat_at = db.Column(db.DateTime)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'filename': self.filename,
+            'mode': self.mode,
+            'status': self.status,
+            'total_rows': self.total_rows,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'failed_rows': self.failed_rows or [],
+            'error': self.error,
+            'cancel_requested': self.cancel_requested,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'heartbeat_at': self.heartbeat_at.isoformat() if self.heartbeat_at else None
+        }
@@ -0,0 +1,277 @@
+"""
+混合限流（进程内令牌桶 + 批量同步到共享计数）
+
+每个 (限制, 客户端) 在进程内维护:
+- 令牌桶: 容量N，每period补满，挡住本进程内的突发
+- 固定窗口计数: synced（上次同步时的全局计数）+ pending（本进程尚未同步的请求数）
+判断只在内存里完成；后台线程每 RATE_LIMIT_SYNC_INTERVAL 秒用一次pipeline
+把所有 pending 批量 INCRBY 到共享后端（Redis），并取回最新全局计数
+
+共享后端不可用时降级为只用本地令牌桶（每个进程各自限流），恢复后自动继续同步
+代价: 多进程之间最多有一个同步周期的超发
+"""
+import re
+import threading
+import time
+from functools import wraps
+from flask import current_app, jsonify, request
+from flask_limiter.util import get_remote_address
+
+KEY_PREFIX = 'rl:v1:'
+
+_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_limit(text):
+    """"10 per minute" / "100/hour" -> (10, 60)"""
+    match = re.match(r'^\s*(\d+)\s*(?:per|/)\s*(second|minute|hour|day)s?\s*$', text)
+    if not match:
+        raise ValueError(f'Invalid rate limit: {text!r}')
+    return int(match.group(1)), _PERIODS[match.group(2)]
+
+
+class RedisCounterBackend:
+    """Redis计数: 一次pipeline完成所有 INCRBY + EXPIRE"""
+
+    def __init__(self, url, timeout=0.2):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+
+    def incr_many(self, items):
+        """items: [(key, amount, ttl)] -> [全局计数]"""
+        pipe = self.client.pipeline(transaction=False)
+        for key, amount, ttl in items:
+            pipe.incrby(key, amount)
+            pipe.expire(key, ttl)
+        results = pipe.execute()
+        return [int(v) for v in results[0::2]]
+
+
+class MemoryCounterBackend:
+    """进程内计数（memory:// 配置、单进程开发环境和benchmark使用）"""
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def incr_many(self, items):
+        now = time.time()
+        totals = []
+        with self._lock:
+            for key, amount, ttl in items:
+                value, expires = self._counts.get(key, (0, 0))
+                if expires < now:
+                    value = 0
+                value += amount
+                self._counts[key] = (value, now + ttl)
+                totals.append(value)
+        return totals
+
+
+class _Counter:
+    __slots__ = ('limit', 'period', 'tokens', 'refilled_at', 'window', 'synced', 'pending', 'used_at')
+
+    def __init__(self, limit, period, now):
+        self.limit = limit
+        self.period = period
+        self.tokens = float(limit)
+        self.refilled_at = now
+        self.window = int(now // period)
+        self.synced = 0
+        self.pending = 0
+        self.used_at = now
+
+
+class HybridRateLimiter:
+
+    def __init__(self):
+        self.enabled = True
+        self.headers_enabled = True
+        self.sync_interval = 0.5
+        self.backend = None
+        self.degraded = False
+        self._retry_at = 0.0
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._sync_thread = None
+        self.allowed = 0
+        self.rejected = 0
+        self.sync_failures = 0
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RATELIMIT_ENABLED', True)
+        self.headers_enabled = app.config.get('RATELIMIT_HEADERS_ENABLED', True)
+        self.sync_interval = app.config.get('RATE_LIMIT_SYNC_INTERVAL', self.sync_interval)
+        self.retry_interval = app.config.get('RATE_LIMIT_RETRY_INTERVAL', 5.0)
+
+        url = app.config.get('RATELIMIT_STORAGE_URL') or 'memory://'
+        if url.startswith('memory://'):
+            self.backend = MemoryCounterBackend()
+        else:
+            self.backend = RedisCounterBackend(url, timeout=app.config.get('RATE_LIMIT_BACKEND_TIMEOUT', 0.2))
+
+    # ------------------------------------------------------------
+    # 判断（只访问内存）
+    # ------------------------------------------------------------
+
+    def hit(self, key, limits, now=None):
+        """
+        记一次请求
+
+        参数:
+            key: 客户端标识
+            limits: [(N, period秒), ...]
+        返回: (allowed, retry_after秒, 剩余次数)
+        """
+        now = now if now is not None else time.time()
+        with self._lock:
+            counters = []
+            for limit, period in limits:
+                ckey = f'{KEY_PREFIX}{limit}:{period}:{key}'
+                counter = self._counters.get(ckey)
+                if counter is None:
+                    counter = self._counters[ckey] = _Counter(limit, period, now)
+                self._roll(counter, now)
+                counters.append((ckey, counter))
+
+            for _, counter in counters:
+                if counter.tokens < 1 or (not self.degraded and counter.synced + counter.pending >= counter.limit):
+                    self.rejected += 1
+                    retry_after = min(
+                        (1 - counter.tokens) * counter.period / counter.limit if counter.tokens < 1
+                        else counter.period, (counter.window + 1) * counter.period - now
+                    )
+                    return False, max(retry_after, 0), 0
+
+            remaining = None
+            for _, counter in counters:
+                counter.tokens -= 1
+                counter.pending += 1
+                counter.used_at = now
+                left = int(min(counter.tokens, counter.limit - counter.synced - counter.pending))
+                remaining = left if remaining is None else min(remaining, left)
+            self.allowed += 1
+
+        self._ensure_sync_thread()
+        return True, 0, max(remaining or 0, 0)
+
+    @staticmethod
+    def _roll(counter, now):
+        # 令牌桶按时间补充
+        elapsed = now - counter.refilled_at
+        if elapsed > 0:
+            counter.tokens = min(counter.limit, counter.tokens + elapsed * counter.limit / counter.period)
+            counter.refilled_at = now
+        # 进入新窗口: 全局计数清零（未同步的旧窗口请求丢弃）
+        window = int(now // counter.period)
+        if window != counter.window:
+            counter.window = window
+            counter.synced = 0
+            counter.pending = 0
+
+    # ------------------------------------------------------------
+    # 批量同步
+    # ------------------------------------------------------------
+
+    def _ensure_sync_thread(self):
+        if self._sync_thread is None and self.backend is not None:
+            with self._lock:
+                if self._sync_thread is None:
+                    self._sync_thread = threading.Thread(target=self._sync_loop, daemon=True, name='rate-limit-sync')
+                    self._sync_thread.start()
+
+    def _sync_loop(self):
+        while True:
+            time.sleep(self.sync_interval)
+            self.sync()
+
+    def sync(self, now=None):
+        """把所有计数器的 pending 一次pipeline写入后端，并取回全局计数"""
+        now = now if now is not None else time.time()
+        if self.degraded and now < self._retry_at:
+            return
+
+        with self._lock:
+            batch = []
+            for ckey, counter in list(self._counters.items()):
+                # 两个窗口都没用过的计数器直接丢掉
+                if now - counter.used_at > 2 * counter.period:
+                    del self._counters[ckey]
+                    continue
+                window = int(now // counter.period)
+                if window != counter.window:
+                    continue
+                # pending为0的也同步（INCRBY 0），用来读取其他进程的计数
+                batch.append((ckey, counter, counter.window, counter.pending))
+            if not batch:
+                return
+
+        try:
+            totals = self.backend.incr_many([
+                (f'{ckey}:{window}', pending, counter.period + 1) for ckey, counter, window, pending in batch
+            ])
+        except Exception as e:
+            self.sync_failures += 1
+            if not self.degraded:
+                print(f"[RateLimit] backend unavailable, using local buckets only: {e}")
+            self.degraded = True
+            self._retry_at = now + self.retry_interval
+            return
+
+        with self._lock:
+            for (ckey, counter, window, pending), total in zip(batch, totals):
+                if counter.window == window:
+                    counter.pending -= pending
+                    counter.synced = total
+            if self.degraded:
+                print("[RateLimit] backend recovered")
+            self.degraded = False
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'degraded': self.degraded,
+            'allowed': self.allowed,
+            'rejected': self.rejected,
+            'sync_failures': self.sync_failures,
+            'tracked_keys': len(self._counters)
+        }
+
+    # ------------------------------------------------------------
+    # 装饰器
+    # ------------------------------------------------------------
+
+    def limit(self, *limit_strings, key_func=get_remote_address):
+        """
+        @rate_limiter.limit("10 per minute", "100 per hour")
+        超限返回429 JSON + Retry-After
+        """
+        limits = [parse_limit(text) for text in limit_strings]
+
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+
+                allowed, retry_after, remaining = self.hit(f'{request.endpoint}:{key_func()}', limits)
+                if not allowed:
+                    response = jsonify({
+                        'error': 'Rate limit exceeded',
+                        'limits': list(limit_strings)
+                    })
+                    response.status_code = 429
+                    response.headers['Retry-After'] = str(max(int(retry_after + 0.999), 1))
+                    return response
+
+                response = current_app.make_response(fn(*args, **kwargs))
+                if self.headers_enabled:
+                    response.headers['X-RateLimit-Remaining'] = str(remaining)
+                return response
+
+            return wrapper
+        return decorator
+
+
+rate_limiter = HybridRateLimiter()
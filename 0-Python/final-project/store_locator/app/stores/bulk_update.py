@@ -0,0 +1,151 @@
+"""
+批量修改/停用店铺（管理端批量接口）
+- 一次查询取出所有涉及的店铺和服务
+- 修改相同字段的店铺合成一组: 值完全相同 → 一条 UPDATE ... WHERE id IN (...)，
+  否则一条 executemany UPDATE
+- 服务关联一次性重写（一条DELETE + 一条批量INSERT），services_mask / hours_packed 随UPDATE一起写入
+整批在一个事务里完成，由调用方提交
+"""
+from datetime import datetime
+from sqlalchemy import select, update, bindparam
+from store_locator.app.extensions import db
+from store_locator.app.stores.hours import DAY_COLUMNS, pack_week, invalid_hours_fields
+from store_locator.app.stores.service_mask import mask_for_ids
+from store_locator.app.stores.bulk_upsert import StoreBulkUpserter
+from store_locator.app.stores.serializers import IN_CHUNK_SIZE
+
+# 与单个 PATCH /stores/<store_id> 允许的字段一致
+UPDATABLE_FIELDS = ['name', 'phone', 'status'] + DAY_COLUMNS
+
+
+def _group_update(table, pks_values):
+    """
+    同一字段组的店铺写成一条语句
+    pks_values: [(pk, {column: value}), ...]，字典的key相同
+    """
+    first = pks_values[0][1]
+    if all(values == first for _, values in pks_values):
+        pks = [pk for pk, _ in pks_values]
+        for i in range(0, len(pks), IN_CHUNK_SIZE):
+            db.session.execute(update(table).where(table.c.id.in_(pks[i:i + IN_CHUNK_SIZE])).values(**first))
+        return
+
+    db.session.execute(
+        update(table).where(table.c.id == bindparam('pk'))
+        .values({col: bindparam(col) for col in first}),
+        [{'pk': pk, **values} for pk, values in pks_values]
+    )
+
+
+def _load_stores(store_ids):
+    """{store_id: Row(id, hours_*)}"""
+    from store_locator.app.models import Store
+
+    table = Store.__table__
+    columns = [table.c.store_id, table.c.id] + [table.c[col] for col in DAY_COLUMNS]
+    found = {}
+    ids = list(store_ids)
+    for i in range(0, len(ids), IN_CHUNK_SIZE):
+        for row in db.session.execute(select(*columns).where(table.c.store_id.in_(ids[i:i + IN_CHUNK_SIZE]))):
+            found[row.store_id] = row
+    return found
+
+
+def apply_store_changes(changes):
+    """
+    批量修改店铺
+
+    参数:
+        changes: [{"store_id": "S0001", "status": "inactive", "hours_mon": "09:00-21:00",
+                   "services": ["pharmacy"]}, ...]
+                 只处理 UPDATABLE_FIELDS 和 services，其他字段忽略（与单个PATCH一致）
+    返回:
+        (results, store_pks)
+        results: [{"store_id": ..., "result": "updated" / "not_found" / "invalid", "error": ...}, ...]
+                 顺序与输入一致
+        store_pks: 实际修改的店铺主键
+    """
+    from store_locator.app.models import Store, Service
+
+    results = [None] * len(changes)
+    valid = {}
+    for i, change in enumerate(changes):
+        store_id = change.get('store_id') if isinstance(change, dict) else None
+        if not store_id:
+            results[i] = {'store_id': None, 'result': 'invalid', 'error': 'store_id is required'}
+        elif store_id in valid:
+            results[i] = {'store_id': store_id, 'result': 'invalid', 'error': 'Duplicate store_id in request'}
+        elif 'services' in change and not isinstance(change['services'], list):
+            results[i] = {'store_id': store_id, 'result': 'invalid', 'error': 'services must be a list'}
+        elif invalid_hours_fields(change):
+            results[i] = {'store_id': store_id, 'result': 'invalid',
+                          'error': f"Invalid hours: {', '.join(invalid_hours_fields(change))}"}
+        else:
+            valid[store_id] = i
+
+    # Step 1: 一次查询所有店铺、一次查询所有服务
+    stores = _load_stores(valid)
+    names = {name for store_id in valid for name in changes[valid[store_id]].get('services') or []}
+    service_ids = dict(db.session.execute(
+        select(Service.name, Service.id).where(Service.name.in_(names))
+    ).all()) if names else {}
+
+    # Step 2: 计算每个店铺的新值，按修改的字段分组
+    now = datetime.utcnow()
+    groups = {}
+    links = {}
+    for store_id, i in valid.items():
+        row = stores.get(store_id)
+        if row is None:
+            results[i] = {'store_id': store_id, 'result': 'not_found', 'error': 'Store not found'}
+            continue
+
+        change = changes[i]
+        values = {field: change[field] for field in UPDATABLE_FIELDS if field in change}
+        if any(col in values for col in DAY_COLUMNS):
+            values['hours_packed'] = pack_week([values.get(col, getattr(row, col)) for col in DAY_COLUMNS])
+        if 'services' in change:
+            # 不存在的服务名忽略（与单个PATCH一致）
+            known = [name for name in dict.fromkeys(change['services']) if name in service_ids]
+            links[row.id] = known
+            values['services_mask'] = mask_for_ids(service_ids[name] for name in known)
+        values['updated_at'] = now
+
+        groups.setdefault(tuple(sorted(values)), []).append((row.id, values))
+        results[i] = {'store_id': store_id, 'result': 'updated'}
+
+    # Step 3: 每组一条UPDATE，服务关联一次重写
+    table = Store.__table__
+    for pks_values in groups.values():
+        _group_update(table, pks_values)
+
+    if links:
+        upserter = StoreBulkUpserter()
+        upserter.service_ids = service_ids
+        upserter.rewrite_links(links)
+
+    store_pks = [pk for pks_values in groups.values() for pk, _ in pks_values]
+    return results, store_pks
+
+
+def deactivate_stores(store_ids):
+    """
+    批量软删除（status='inactive'），一条UPDATE
+    返回: (results, store_pks)
+    """
+    from store_locator.app.models import Store
+
+    store_ids = list(dict.fromkeys(store_ids))
+    stores = _load_stores(store_ids)
+    pks = [stores[store_id].id for store_id in store_ids if store_id in stores]
+
+    if pks:
+        now = datetime.utcnow()
+        _group_update(Store.__table__, [(pk, {'status': 'inactive', 'updated_at': now}) for pk in pks])
+
+    results = [
+        {'store_id': store_id, 'result': 'deactivated'} if store_id in stores
+        else {'store_id': store_id, 'result': 'not_found', 'error': 'Store not found'}
+        for store_id in store_ids
+    ]
+    return results, pks
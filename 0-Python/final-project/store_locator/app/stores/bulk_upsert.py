@@ -0,0 +1,182 @@
+"""
+店铺批量Upsert引擎
+- 已有store_id、服务各一条查询预加载
+- 每块一条 INSERT ... ON CONFLICT (store_id) DO UPDATE ... RETURNING
+- store_services 按块先删后批量插入
+不经过ORM对象，hours_packed / services_mask 在这里直接计算
+"""
+from datetime import datetime
+from sqlalchemy import select, insert, update, delete, bindparam
+from sqlalchemy.dialects import postgresql, sqlite
+from store_locator.app.extensions import db
+from store_locator.app.stores.hours import DAY_COLUMNS, pack_week
+from store_locator.app.stores.service_mask import mask_for_ids
+
+# 已存在的店铺只更新这些字段（与原来逐行导入的UPDATE逻辑一致）
+UPDATE_COLUMNS = ['name', 'store_type', 'status', 'phone'] + DAY_COLUMNS + [
+    'hours_packed', 'services_mask', 'updated_at'
+]
+
+INSERT_COLUMNS = [
+    'store_id', 'name', 'store_type', 'status', 'latitude', 'longitude',
+    'address_street', 'address_city', 'address_state', 'address_postal_code',
+    'address_country', 'phone'
+] + DAY_COLUMNS
+
+_UPSERT_DIALECTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+def parse_services(value):
+    """"pharmacy|pickup" -> ['pharmacy', 'pickup']（去重，保持顺序）"""
+    if not value or not isinstance(value, str):
+        return []
+    names = [name.strip() for name in value.split('|')]
+    return list(dict.fromkeys(name for name in names if name))
+
+
+class StoreBulkUpserter:
+    """
+    用法:
+        upserter = StoreBulkUpserter()
+        upserter.preload()
+        report = upserter.upsert(records)   # records: CSV行dict列表
+        ...
+        db.session.commit()
+
+    不负责提交事务，由调用方决定commit/rollback
+    """
+
+    def __init__(self, session=None, chunk_size=1000):
+        self.session = session or db.session
+        self.chunk_size = chunk_size
+        self.existing = set()
+        self.service_ids = {}
+        self.store_pks = []
+
+    def preload(self):
+        """一次查询已有store_id，一次查询所有服务"""
+        from store_locator.app.models import Store, Service
+
+        self.existing = set(self.session.execute(select(Store.store_id)).scalars())
+        self.service_ids = dict(self.session.execute(select(Service.name, Service.id)).all())
+
+    def ensure_services(self, names):
+        """CSV中出现的新服务一次批量创建"""
+        from store_locator.app.models import Service
+
+        missing = sorted(set(names) - set(self.service_ids))
+        if not missing:
+            return
+        self.session.execute(insert(Service), [{'name': name} for name in missing])
+        self.service_ids = dict(self.session.execute(select(Service.name, Service.id)).all())
+
+    def upsert(self, records):
+        """
+        分块写入一批记录
+
+        返回: {'created': n, 'updated': n}（同一store_id第一次出现按created计，之后按updated计）
+        写入的店铺主键累计在 self.store_pks
+        """
+        created = updated = 0
+        for start in range(0, len(records), self.chunk_size):
+            chunk = records[start:start + self.chunk_size]
+
+            new_ids = set()
+            for record in chunk:
+                if record['store_id'] in self.existing or record['store_id'] in new_ids:
+                    updated += 1
+                else:
+                    created += 1
+                    new_ids.add(record['store_id'])
+
+            # 同一块内重复的store_id只保留最后一次（ON CONFLICT不允许一条语句更新同一行两次）
+            latest = {}
+            for record in chunk:
+                latest[record['store_id']] = record
+            pks = self._write_chunk(list(latest.values()))
+
+            # 写入成功后才记入状态（外层savepoint回滚时调用方重新preload即可）
+            self.existing |= new_ids
+            self.store_pks.extend(pks)
+
+        return {'created': created, 'updated': updated}
+
+    # ------------------------------------------------------------
+
+    def _write_chunk(self, records):
+        services = {r['store_id']: parse_services(r.get('services')) for r in records}
+        self.ensure_services(name for names in services.values() for name in names)
+
+        now = datetime.utcnow()
+        rows = []
+        for record in records:
+            row = {col: record.get(col) for col in INSERT_COLUMNS}
+            row['address_country'] = row['address_country'] or 'USA'
+            row['hours_packed'] = pack_week([row[col] for col in DAY_COLUMNS])
+            row['services_mask'] = mask_for_ids(self.service_ids[n] for n in services[row['store_id']])
+            row['created_at'] = now
+            row['updated_at'] = now
+            rows.append(row)
+
+        pk_map = self._upsert_rows(rows)
+        self._rewrite_links(pk_map, services)
+        return list(pk_map.values())
+
+    def _upsert_rows(self, rows):
+        """返回 {store_id: Store.id}"""
+        from store_locator.app.models import Store
+
+        table = Store.__table__
+        dialect = self.session.get_bind().dialect.name
+        make_insert = _UPSERT_DIALECTS.get(dialect)
+
+        if make_insert is not None:
+            # 参数以executemany形式传入: 语句只编译一次（走编译缓存），
+            # 由SQLAlchemy的insertmanyvalues拼成多行VALUES批量执行并收集RETURNING
+            stmt = make_insert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.store_id],
+                set_={col: stmt.excluded[col] for col in UPDATE_COLUMNS}
+            ).returning(table.c.store_id, table.c.id)
+            return dict(self.session.execute(stmt, rows).all())
+
+        # 其他数据库: 先查出已存在的，再分别批量INSERT / executemany UPDATE
+        store_ids = [row['store_id'] for row in rows]
+        found = dict(self.session.execute(
+            select(table.c.store_id, table.c.id).where(table.c.store_id.in_(store_ids))
+        ).all())
+        new_rows = [row for row in rows if row['store_id'] not in found]
+        old_rows = [{**row, 'key': row['store_id']} for row in rows if row['store_id'] in found]
+        if new_rows:
+            self.session.execute(insert(table), new_rows)
+        if old_rows:
+            self.session.execute(
+                update(table).where(table.c.store_id == bindparam('key'))
+                .values({col: bindparam(col) for col in UPDATE_COLUMNS}),
+                old_rows
+            )
+        return dict(self.session.execute(
+            select(table.c.store_id, table.c.id).where(table.c.store_id.in_(store_ids))
+        ).all())
+
+    def rewrite_links(self, services_by_pk):
+        """
+        重写一批店铺的服务关联: 一条DELETE + 一条批量INSERT
+        services_by_pk: {Store.id: [service_name, ...]}
+        """
+        from store_locator.app.models import store_services
+
+        if not services_by_pk:
+            return
+        self.session.execute(
+            delete(store_services).where(store_services.c.store_id.in_(list(services_by_pk)))
+        )
+        links = [
+            {'store_id': pk, 'service_id': self.service_ids[name]}
+            for pk, names in services_by_pk.items() for name in names
+        ]
+        if links:
+            self.session.execute(insert(store_services), links)
+
+    def _rewrite_links(self, pk_map, services):
+        self.rewrite_links({pk: services[store_id] for store_id, pk in pk_map.items()})
@@ -0,0 +1,238 @@
+"""
+店铺JSON片段缓存
+搜索响应里同一家热门店铺反复出现，地址/营业时间/服务这部分每次都一样
+
+- 每家店铺的静态部分预先编码成bytes（orjson），带上 updated_at 作为版本戳
+- 响应直接拼接片段，只在末尾补上每次请求不同的 distance_miles / is_open_now
+- 调用方带着 updated_at 来取（搜索查询本来就读这一列），版本戳不一致或未缓存的才查库重建，
+  其他进程的写入也不会读到旧片段
+- 本进程内的写入通过 Store 的 flush/commit 钩子和 stores_changed 信号立即丢弃旧片段
+
+缓存是每个进程的LRU（STORE_FRAGMENT_CACHE_SIZE）
+分片库的店铺用 (分片, Store.id) 作为key（见 shards.py）
+"""
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import select
+from store_locator.app.extensions import db
+from store_locator.app.stores.hours import DAY_COLUMNS, pack_week, is_open_at
+from store_locator.app.stores.serializers import build_store_dict, load_service_names, _chunks
+from store_locator.app.stores.signals import stores_changed
+
+try:
+    import orjson
+except ImportError:                       # 没装orjson时退回标准库（慢，但结果相同）
+    orjson = None
+
+
+def dumps(value):
+    """对象 -> JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class StoreFragment:
+    """一家店铺的预编码片段: body 是去掉结尾 } 的JSON对象"""
+    __slots__ = ('pk', 'updated_at', 'status', 'packed', 'body')
+
+    def __init__(self, pk, updated_at, status, packed, body):
+        self.pk = pk
+        self.updated_at = updated_at
+        self.status = status
+        self.packed = packed
+        self.body = body
+
+    def render(self, distance, is_open):
+        distance = round(distance, 2) if distance else None
+        return b''.join((
+            self.body,
+            b',"distance_miles":', dumps(distance),
+            b',"is_open_now":', b'true' if is_open else b'false',
+            b'}'
+        ))
+
+
+def build_fragment(row, service_names, key=None):
+    """店铺行（select(Store.__table__) 的结果）-> StoreFragment；key 默认是 row.id"""
+    data = build_store_dict(row, service_names)
+    del data['distance_miles'], data['is_open_now']
+    body = dumps(data)[:-1]
+    packed = row.hours_packed or pack_week([getattr(row, col) for col in DAY_COLUMNS])
+    return StoreFragment(row.id if key is None else key, row.updated_at, row.status, packed, body)
+
+
+class StoreFragmentCache:
+
+    def __init__(self):
+        self.enabled = True
+        self.max_size = 20000
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        self.enabled = app.config.get('STORE_FRAGMENT_CACHE_ENABLED', True)
+        self.max_size = app.config.get('STORE_FRAGMENT_CACHE_SIZE', self.max_size)
+        self.clear()
+        stores_changed.connect(self._on_stores_changed, sender=app)
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'size': len(self._fragments),
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations
+        }
+
+    # ------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------
+
+    def get_many(self, stamps):
+        """
+        stamps: {Store.id: updated_at}（调用方已知的版本；None表示不知道，总是查库）
+        返回: {Store.id: StoreFragment}，库里已不存在的店铺不在结果里
+        """
+        found = {}
+        missing = []
+        with self._lock:
+            for pk, updated_at in stamps.items():
+                fragment = self._fragments.get(pk) if self.enabled else None
+                if fragment is not None and updated_at is not None and fragment.updated_at == updated_at:
+                    self._fragments.move_to_end(pk)
+                    found[pk] = fragment
+                else:
+                    missing.append(pk)
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        if missing:
+            loaded = self._load(missing)
+            found.update(loaded)
+            if self.enabled:
+                with self._lock:
+                    for pk, fragment in loaded.items():
+                        self._fragments[pk] = fragment
+                        self._fragments.move_to_end(pk)
+                    while len(self._fragments) > self.max_size:
+                        self._fragments.popitem(last=False)
+        return found
+
+    def _load(self, keys):
+        """未命中的店铺: 每个库一条店铺查询 + 一条服务查询"""
+        from store_locator.app.stores.shards import shard_router
+
+        by_shard = {}
+        for key in keys:
+            shard, pk = key if isinstance(key, tuple) else (None, key)
+            by_shard.setdefault(shard, []).append(pk)
+
+        fragments = {}
+        for shard, pks in by_shard.items():
+            if shard is None:
+                fragments.update(self._load_rows(pks, db.session.execute))
+            else:
+                with shard_router.engine(shard).connect() as conn:
+                    fragments.update(self._load_rows(pks, conn.execute, shard))
+        return fragments
+
+    @staticmethod
+    def _load_rows(store_pks, execute, shard=None):
+        from store_locator.app.models import Store
+
+        table = Store.__table__
+        services = load_service_names(store_pks, execute)
+        fragments = {}
+        for chunk in _chunks(list(store_pks)):
+            for row in execute(select(table).where(table.c.id.in_(chunk))):
+                key = row.id if shard is None else (shard, row.id)
+                fragments[key] = build_fragment(row, services.get(row.id, []), key)
+        return fragments
+
+    def render(self, entries, now=None):
+        """
+        entries: [(Store.id 或 (分片, Store.id), updated_at, distance), ...]（已排好序）
+        返回: [bytes, ...] 每家店铺一个完整的JSON对象，顺序不变
+        """
+        if not entries:
+            return []
+
+        now = now or datetime.utcnow()
+        weekday, minute = now.weekday(), now.hour * 60 + now.minute
+        fragments = self.get_many({pk: updated_at for pk, updated_at, _ in entries})
+
+        rendered = []
+        for pk, _, distance in entries:
+            fragment = fragments.get(pk)
+            if fragment is None:
+                continue
+            is_open = fragment.status == 'active' and is_open_at(fragment.packed, weekday, minute)
+            rendered.append(fragment.render(distance, is_open))
+        return rendered
+
+    # ------------------------------------------------------------
+    # 失效
+    # ------------------------------------------------------------
+
+    def invalidate(self, store_pks):
+        from store_locator.app.stores.shards import shard_router
+
+        shards = list(shard_router.shards) if shard_router.enabled else []
+        with self._lock:
+            for pk in store_pks:
+                for key in [pk] + [(shard, pk) for shard in shards]:
+                    if self._fragments.pop(key, None) is not None:
+                        self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._fragments.clear()
+
+    def _on_stores_changed(self, sender, store_ids=None, **extra):
+        """Core批量写入（导入、批量修改）不经过ORM钩子，靠这个信号"""
+        if store_ids:
+            self.invalidate(store_ids)
+
+
+store_fragments = StoreFragmentCache()
+
+
+def render_response(payload, fragments):
+    """
+    拼接搜索响应: {"stores":[片段,...], 其余字段...}
+    payload 是去掉 stores 之后的其余字段（dict）
+    """
+    rest = dumps(payload)
+    stores = b'{"stores":[' + b','.join(fragments) + b']'
+    if rest == b'{}':
+        return stores + b'}'
+    return stores + b',' + rest[1:]
+
+
+# ------------------------------------------------------------
+# Session 监听: ORM修改店铺（含只改services关系）提交后丢弃片段
+# ------------------------------------------------------------
+
+def track_store_changes(session, flush_context):
+    from store_locator.app.models import Store
+
+    pks = session.info.setdefault('fragment_dirty_stores', set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Store) and obj.id is not None:
+            pks.add(obj.id)
+
+
+def drop_fragments_after_commit(session):
+    pks = session.info.pop('fragment_dirty_stores', None)
+    if pks:
+        store_fragments.invalidate(pks)
+
+
+def forget_store_changes(session):
+    session.info.pop('fragment_dirty_stores', None)
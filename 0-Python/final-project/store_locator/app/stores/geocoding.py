@@ -0,0 +1,288 @@
+"""
+地理编码缓存层
+查询顺序:
+1. 本地SQLite邮编质心库（离线预加载，只读，开启mmap）
+2. 共享缓存（flask_caching / Redis）: 成功结果30天，失败结果短TTL（负缓存）
+3. 远程地理编码（Nominatim），同一个key的并发请求只发一次（single-flight）
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from store_locator.app.extensions import cache
+
+CACHE_PREFIX = 'geocode:v1:'
+# 负缓存标记（flask_caching 的 get 未命中时返回None，不能直接缓存None）
+NOT_FOUND = 'not_found'
+# 美国邮编: 5位（CSV读成数字时可能少了前导0）+ 可选的 -4位扩展
+US_POSTAL_PATTERN = re.compile(r'^(\d{1,5})(?:-\d{4})?$')
+
+
+def normalize_query(query):
+    """缓存key规范化: 小写、合并空白"""
+    return re.sub(r'\s+', ' ', str(query).strip().lower())
+
+
+def normalize_postal_code(postal):
+    """
+    美国邮编规范化: "02101-1234" -> "02101"，"2101" -> "02101"（CSV读成数字时会丢前导0）
+    不是美国邮编格式时返回None（"K1A 0B1" 不能去掉字母后当成 "00101"，否则会和真实邮编共用缓存）
+    """
+    match = US_POSTAL_PATTERN.match(str(postal).strip())
+    if not match:
+        return None
+    return match.group(1).zfill(5)
+
+
+class PostalCentroidStore:
+    """
+    本地邮编质心库（SQLite文件）
+    表结构: postal_centroids(postal_code TEXT PRIMARY KEY, latitude REAL, longitude REAL)
+    每个线程一个只读连接
+    """
+
+    def __init__(self, path=None, mmap_size=64 * 1024 * 1024):
+        self.path = path
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+
+    @property
+    def available(self):
+        return bool(self.path) and os.path.exists(self.path)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, check_same_thread=False)
+            conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, postal_code):
+        """返回 (lat, lon)，库中没有返回None"""
+        if not self.available:
+            return None
+        row = self._connect().execute(
+            'SELECT latitude, longitude FROM postal_centroids WHERE postal_code = ?',
+            (postal_code,)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def lookup_many(self, postal_codes):
+        """{postal_code: (lat, lon)}，只包含命中的"""
+        if not self.available or not postal_codes:
+            return {}
+        codes = list(set(postal_codes))
+        found = {}
+        conn = self._connect()
+        for i in range(0, len(codes), 500):
+            chunk = codes[i:i + 500]
+            placeholders = ','.join('?' * len(chunk))
+            for code, lat, lon in conn.execute(
+                f'SELECT postal_code, latitude, longitude FROM postal_centroids '
+                f'WHERE postal_code IN ({placeholders})', chunk
+            ):
+                found[code] = (lat, lon)
+        return found
+
+    def all_centroids(self):
+        """遍历所有邮编质心 [(postal_code, lat, lon), ...]"""
+        if not self.available:
+            return []
+        return self._connect().execute(
+            'SELECT postal_code, latitude, longitude FROM postal_centroids ORDER BY postal_code'
+        ).fetchall()
+
+    def load(self, rows):
+        """
+        离线写入/覆盖邮编质心（预加载脚本使用）
+        rows: 可迭代的 (postal_code, lat, lon)
+        返回: 写入条数
+        """
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS postal_centroids ('
+                'postal_code TEXT PRIMARY KEY, latitude REAL NOT NULL, longitude REAL NOT NULL)'
+            )
+            cur = conn.executemany(
+                'INSERT OR REPLACE INTO postal_centroids (postal_code, latitude, longitude) VALUES (?, ?, ?)',
+                rows
+            )
+            conn.commit()
+            return cur.rowcount
+        finally:
+            conn.close()
+
+
+class GeocodeCache:
+    """
+    地理编码缓存
+
+    resolver: 远程地理编码函数 query -> (lat, lon) / None，失败时抛异常
+    """
+
+    def __init__(self):
+        self.ttl = 30 * 24 * 60 * 60
+        self.negative_ttl = 60 * 60
+        self.error_ttl = 60
+        self.flight_timeout = 15
+        self.bulk_delay = 1.0
+        self.centroids = PostalCentroidStore()
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def init_app(self, app):
+        self.ttl = app.config.get('GEOCODE_CACHE_TTL', self.ttl)
+        self.negative_ttl = app.config.get('GEOCODE_NEGATIVE_TTL', self.negative_ttl)
+        self.error_ttl = app.config.get('GEOCODE_ERROR_TTL', self.error_ttl)
+        self.flight_timeout = app.config.get('GEOCODE_TIMEOUT', 10) + 5
+        self.bulk_delay = app.config.get('GEOCODE_BULK_DELAY', self.bulk_delay)
+        self.centroids = PostalCentroidStore(app.config.get('POSTAL_CENTROIDS_DB'))
+
+    # ------------------------------------------------------------
+    # 共享缓存读写（Redis不可用时当作未命中，不影响搜索）
+    # ------------------------------------------------------------
+
+    def _cache_get(self, key):
+        try:
+            return cache.get(CACHE_PREFIX + key)
+        except Exception as e:
+            print(f"[Geocode cache] get failed: {e}")
+            return None
+
+    def _cache_set(self, key, value, ttl):
+        try:
+            cache.set(CACHE_PREFIX + key, value, timeout=ttl)
+        except Exception as e:
+            print(f"[Geocode cache] set failed: {e}")
+
+    @staticmethod
+    def _decode(value):
+        if value is None or value == NOT_FOUND:
+            return None
+        return tuple(value)
+
+    # ------------------------------------------------------------
+    # 单个查询
+    # ------------------------------------------------------------
+
+    def geocode(self, query, resolver):
+        """
+        地址 -> (lat, lon)，找不到返回None
+        """
+        key = normalize_query(query)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return self._decode(cached)
+
+        return self._single_flight(key, lambda: self._resolve(key, query, resolver))
+
+    def geocode_postal(self, postal, resolver):
+        """邮编 -> (lat, lon): 先查本地质心库，没有再走远程（加上国家防止解析失败）"""
+        code = normalize_postal_code(postal)
+        if code:
+            coords = self.centroids.lookup(code)
+            if coords:
+                return coords
+        return self.geocode(f"{code or postal}, USA", resolver)
+
+    def _resolve(self, key, query, resolver):
+        """调用远程地理编码并写缓存（成功/未找到/出错分别使用不同TTL）"""
+        try:
+            coords = resolver(query)
+        except Exception as e:
+            print(f"[Geocoding error] {query}: {e}")
+            self._cache_set(key, NOT_FOUND, self.error_ttl)
+            return None
+
+        if coords:
+            print(f"[Geocode] {query} -> {coords[0]}, {coords[1]}")
+            self._cache_set(key, list(coords), self.ttl)
+            return tuple(coords)
+
+        print(f"[Geocode failed] {query} returned None")
+        self._cache_set(key, NOT_FOUND, self.negative_ttl)
+        return None
+
+    def _single_flight(self, key, fn):
+        """同一个key同时只有一个线程真正执行fn，其他线程等待它的结果"""
+        with self._lock:
+            future = self._flights.get(key)
+            leader = future is None
+            if leader:
+                future = self._flights[key] = Future()
+
+        if not leader:
+            try:
+                return future.result(timeout=self.flight_timeout)
+            except Exception:
+                return None
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+
+    # ------------------------------------------------------------
+    # 批量（预热）
+    # ------------------------------------------------------------
+
+    def geocode_many(self, queries, resolver, postal=False):
+        """
+        批量地理编码（预热缓存用）
+
+        参数:
+            queries: 地址或邮编列表
+            postal: True表示queries是邮编（先查本地质心库）
+        返回: {query: (lat, lon) / None}
+        """
+        results = {}
+        pending = {}
+
+        if postal:
+            codes = {q: normalize_postal_code(q) for q in queries}
+            local = self.centroids.lookup_many([c for c in codes.values() if c])
+            for q, code in codes.items():
+                if code in local:
+                    results[q] = local[code]
+                else:
+                    pending[q] = f"{code or q}, USA"
+        else:
+            pending = {q: q for q in queries}
+
+        # 共享缓存一次批量读取
+        keys = {q: normalize_query(text) for q, text in pending.items()}
+        try:
+            cached = cache.get_many(*[CACHE_PREFIX + k for k in keys.values()]) if keys else []
+        except Exception as e:
+            print(f"[Geocode cache] get_many failed: {e}")
+            cached = [None] * len(keys)
+
+        misses = []
+        for (q, key), value in zip(keys.items(), cached):
+            if value is not None:
+                results[q] = self._decode(value)
+            else:
+                misses.append(q)
+
+        # 剩下的逐个远程查询，遵守Nominatim每秒1次的限制
+        for i, q in enumerate(misses):
+            if i and self.bulk_delay:
+                time.sleep(self.bulk_delay)
+            results[q] = self._single_flight(
+                keys[q], lambda q=q: self._resolve(keys[q], pending[q], resolver)
+            )
+
+        return results
+
+
+geocode_cache = GeocodeCache()
@@ -0,0 +1,99 @@
+"""
+营业时间预编译
+把 hours_mon ~ hours_sun 的字符串（"08:00-22:00" / "closed"）在写入时编码成
+7 x (open_minute, close_minute) 的uint16区间数组（28字节），
+之后判断是否营业只需按星期几取一个区间比较，不再每次split/int解析
+"""
+import re
+import struct
+import numpy as np
+
+DAY_COLUMNS = ['hours_mon', 'hours_tue', 'hours_wed', 'hours_thu',
+               'hours_fri', 'hours_sat', 'hours_sun']
+
+# 每天: open(uint16) + close(uint16)，小端
+_DAY_FORMAT = '<HH'
+_WEEK_FORMAT = '<' + 'HH' * 7
+PACKED_SIZE = struct.calcsize(_WEEK_FORMAT)
+
+# 休息日/无法解析: open > close，任何时刻都不满足 open <= now <= close
+CLOSED = (0xFFFF, 0)
+
+MINUTES_PER_DAY = 1440
+
+# H:MM / HH:MM-H:MM / HH:MM（去掉首尾空白后），CSV校验（validation.py）用同一个表达式
+HOURS_PATTERN = re.compile(r'^(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})$')
+
+
+def parse_hours(value):
+    """
+    "08:00-22:00" -> (480, 1320)，关门可以是 24:00
+    "closed" / 空 / 格式错误 / 超出范围（"25:00-26:00"） / 开门不早于关门 -> None
+
+    跨午夜的区间（"22:00-02:00"）不接受: 每天只存一个当天内的区间，
+    以前能通过校验但永远判断为不营业；应写成当天 "22:00-24:00" 加第二天 "00:00-02:00"
+    """
+    if not value or not isinstance(value, str):
+        return None
+    match = HOURS_PATTERN.match(value.strip())
+    if not match:
+        return None
+    oh, om, ch, cm = map(int, match.groups())
+    if not (0 <= oh <= 23 and 0 <= om <= 59 and 0 <= ch <= 24 and 0 <= cm <= 59):
+        return None
+    open_min, close_min = oh * 60 + om, ch * 60 + cm
+    if not open_min < close_min <= MINUTES_PER_DAY:
+        return None
+    return open_min, close_min
+
+
+def invalid_hours_fields(values):
+    """values（请求体dict）里格式不对的 hours_* 字段名；空值表示休息，不算错误"""
+    from store_locator.app.stores.utils import validate_hours_format
+
+    return [col for col in DAY_COLUMNS if values.get(col) and not validate_hours_format(values[col])]
+
+
+def pack_week(hours_list):
+    """7个营业时间字符串（周一到周日）-> 28字节"""
+    values = []
+    for value in hours_list:
+        values.extend(parse_hours(value) or CLOSED)
+    return struct.pack(_WEEK_FORMAT, *values)
+
+
+def day_window(packed, weekday):
+    """O(1) 取某天的 (open_minute, close_minute)，休息返回None"""
+    open_min, close_min = struct.unpack_from(_DAY_FORMAT, packed, weekday * 4)
+    if (open_min, close_min) == CLOSED:
+        return None
+    return open_min, close_min
+
+
+def is_open_at(packed, weekday, minute):
+    """O(1) 判断某天某分钟是否营业"""
+    open_min, close_min = struct.unpack_from(_DAY_FORMAT, packed, weekday * 4)
+    return open_min <= minute <= close_min
+
+
+def open_mask(packed_list, now):
+    """
+    向量化: 一次判断一批店铺在now时刻是否营业
+
+    参数:
+        packed_list: 每家店的28字节编码
+        now: datetime
+    返回: NumPy bool数组
+    """
+    if not packed_list:
+        return np.zeros(0, dtype=bool)
+
+    week = np.frombuffer(b''.join(packed_list), dtype='<u2').reshape(-1, 7, 2)
+    today = week[:, now.weekday(), :]
+    minute = now.hour * 60 + now.minute
+    return (today[:, 0] <= minute) & (minute <= today[:, 1])
+
+
+def format_minute(minute):
+    """480 -> "08:00" """
+    return f"{minute // 60:02d}:{minute % 60:02d}"
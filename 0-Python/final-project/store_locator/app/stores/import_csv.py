@@ -1,10 +1,34 @@
 """
 CSV批量导入逻辑
 支持创建和更新（Upsert）
+
+流程: 读取 → 向量化校验 → 分块批量upsert（StoreBulkUpserter）→ 一次提交
+
+大文件用 import_stores_streaming: 按块读取CSV，内存占用与文件大小无关
 """
+import itertools
+import uuid
 import pandas as pd
-from store_locator.app.models import Store, Service
+from sqlalchemy import select, insert, delete
 from store_locator.app.extensions import db
+from store_locator.app.stores.signals import stores_changed
+from store_locator.app.stores.validation import STRING_COLUMNS, missing_columns, validate_store_frame, validation_pool
+from store_locator.app.stores.bulk_upsert import StoreBulkUpserter
+from flask import current_app
+
+# 报告中最多列出的失败行（失败总数另外计数）
+MAX_REPORTED_FAILURES = 1000
+
+
+class ImportCancelled(Exception):
+    """progress回调抛出此异常来中止流式导入"""
+
+
+def frame_to_records(df):
+    """DataFrame -> dict列表（NaN转成None）"""
+    df = df.astype(object).where(df.notna(), None)
+    return df.to_dict('records')
+
 
 def import_stores_from_csv(file):
     """
@@ -31,112 +55,226 @@ def import_stores_from_csv(file):
     }
     """
     
-    # Step 1: 读取CSV
+    # Step 1: 读取CSV（store_id/邮编/电话按字符串读取，保留前导0）
     try:
-        df = pd.read_csv(file)
+        df = pd.read_csv(file, dtype=STRING_COLUMNS)
     except Exception as e:
         return {'error': f'Invalid CSV file: {str(e)}'}
     
     # Step 2: 验证CSV结构
-    required_cols = [
-        'store_id', 'name', 'store_type', 'status', 'latitude', 'longitude',
-        'address_street', 'address_city', 'address_state', 'address_postal_code',
-        'phone', 'services'
-    ]
-    
-    missing = set(required_cols) - set(df.columns)
+    missing = missing_columns(df)
     if missing:
-        return {'error': f'Missing required columns: {list(missing)}'}
+        return {'error': f'Missing required columns: {missing}'}
     
-    # Step 3: 逐行处理
-    created_count = 0
-    updated_count = 0
-    failed = []
+    # Step 3: 校验所有行（不访问数据库，大文件用进程池），有错误时整个文件不导入
+    failed = validate_store_frame(df)
+    if failed:
+        return {
+            'error': 'Import failed',
+            'failed_rows': failed
+        }
     
+    # Step 4: 批量upsert
     try:
-        # 开启事务
-        for idx, row in df.iterrows():
-            try:
-                # 检查店铺是否存在
-                store = Store.query.filter_by(store_id=row['store_id']).first()
-                
-                if store:
-                    # UPDATE逻辑
-                    store.name = row['name']
-                    store.store_type = row['store_type']
-                    store.status = row['status']
-                    store.phone = row['phone']
-                    store.hours_mon = row.get('hours_mon')
-                    store.hours_tue = row.get('hours_tue')
-                    store.hours_wed = row.get('hours_wed')
-                    store.hours_thu = row.get('hours_thu')
-                    store.hours_fri = row.get('hours_fri')
-                    store.hours_sat = row.get('hours_sat')
-                    store.hours_sun = row.get('hours_sun')
-                    updated_count += 1
-                else:
-                    # CREATE逻辑
-                    store = Store(
-                        store_id=row['store_id'],
-                        name=row['name'],
-                        store_type=row['store_type'],
-                        status=row['status'],
-                        latitude=row['latitude'],
-                        longitude=row['longitude'],
-                        address_street=row['address_street'],
-                        address_city=row['address_city'],
-                        address_state=row['address_state'],
-                        address_postal_code=row['address_postal_code'],
-                        address_country=row.get('address_country', 'USA'),
-                        phone=row['phone'],
-                        hours_mon=row.get('hours_mon'),
-                        hours_tue=row.get('hours_tue'),
-                        hours_wed=row.get('hours_wed'),
-                        hours_thu=row.get('hours_thu'),
-                        hours_fri=row.get('hours_fri'),
-                        hours_sat=row.get('hours_sat'),
-                        hours_sun=row.get('hours_sun')
-                    )
-                    db.session.add(store)
-                    created_count += 1
-                
-                # 处理服务（清空旧的，添加新的）
-                store.services = []
-                if pd.notna(row['services']):
-                    for svc_name in row['services'].split('|'):
-                        svc_name = svc_name.strip()
-                        svc = Service.query.filter_by(name=svc_name).first()
-                        if not svc:
-                            svc = Service(name=svc_name)
-                            db.session.add(svc)
-                            db.session.flush()  # 获取service ID
-                        store.services.append(svc)
-                
-            except Exception as e:
-                failed.append({
-                    'row': idx + 2,  # CSV行号（从1开始，跳过header）
-                    'store_id': row.get('store_id', 'N/A'),
-                    'error': str(e)
-                })
-        
-        # Step 4: 检查是否有失败
-        if failed:
-            db.session.rollback()
-            return {
-                'error': 'Import failed',
-                'failed_rows': failed
-            }
+        upserter = StoreBulkUpserter(chunk_size=current_app.config.get('IMPORT_CHUNK_SIZE', 1000))
+        upserter.preload()
+        counts = upserter.upsert(frame_to_records(df))
         
         # Step 5: 提交事务
         db.session.commit()
         
-        return {
-            'success': True,
-            'total_rows': len(df),
-            'created': created_count,
-            'updated': updated_count
-        }
-        
     except Exception as e:
         db.session.rollback()
-        return {'error': f'Import failed: {str(e)}'}
\ No newline at end of file
+        return {'error': f'Import failed: {str(e)}'}
+    
+    stores_changed.send(current_app._get_current_object(), store_ids=upserter.store_pks)
+    
+    return {
+        'success': True,
+        'total_rows': len(df),
+        'created': counts['created'],
+        'updated': counts['updated']
+    }
+
+
+def import_stores_streaming(file, atomic=False, chunk_size=None, progress=None):
+    """
+    流式导入店铺CSV（按块读取，每块单独校验、写入）
+
+    参数:
+        file: CSV文件对象或路径
+        atomic:
+            False → 每块在自己的savepoint里upsert并提交；校验失败的行跳过，其余照常导入
+            True  → 先把整个文件校验一遍（有错误时什么都不写），再读第二遍写暂存表，
+                    最后在一个事务里合并进stores（全部或全不导入）；file需要能seek回开头
+        chunk_size: 每块行数（默认 IMPORT_CHUNK_SIZE）
+        progress: 每处理完一块调用 progress(report)，report为当前累计的报告dict；
+                  回调抛出 ImportCancelled 时中止导入
+
+    返回:
+    {
+        "success": true,
+        "total_rows": 50000,
+        "created": 30000,
+        "updated": 19990,
+        "failed": 10,
+        "failed_rows": [...]        # 最多 MAX_REPORTED_FAILURES 条
+    }
+    或
+    {
+        "error": "...",
+        "failed_rows": [...]
+    }
+    """
+    chunk_size = chunk_size or current_app.config.get('IMPORT_CHUNK_SIZE', 1000)
+    report = {'total_rows': 0, 'created': 0, 'updated': 0, 'failed': 0, 'failed_rows': []}
+    import_id = str(uuid.uuid4())
+
+    upserter = StoreBulkUpserter(chunk_size=chunk_size)
+    upserter.preload()
+
+    try:
+        # Step 1: 按块读取（store_id/邮编/电话按字符串读取，保留前导0），第一块检查CSV结构
+        chunks = _read_chunks(file, chunk_size)
+        first = next(chunks, None)
+        if first is not None:
+            missing = missing_columns(first)
+            if missing:
+                return {'error': f'Missing required columns: {missing}'}
+            chunks = itertools.chain([first], chunks)
+
+        # Step 2-3: 校验（进程池里最多 IMPORT_VALIDATION_WORKERS 块同时校验）；非原子模式边校验边写入
+        for chunk_no, (df, failed) in enumerate(validation_pool.validate_chunks(chunks), start=1):
+            if failed:
+                _record_failures(report, failed)
+                df = df.drop(index=[f['row'] - 2 for f in failed])
+            report['total_rows'] += len(df) + len(failed)
+
+            if not atomic:
+                _upsert_chunk(upserter, df, report)
+
+            print(f"[Import] chunk {chunk_no}: {report['total_rows']} rows {'validated' if atomic else 'processed'}")
+            if progress:
+                progress(report)
+
+        # Step 4-5: 全部或全不导入: 整个文件都通过后才写暂存表，再一次合并
+        if atomic:
+            if report['failed']:
+                return {'error': 'Import failed', 'failed_rows': report['failed_rows']}
+            _rewind(file)
+            for df in _read_chunks(file, chunk_size):
+                _stage_rows(import_id, df)
+                if progress:
+                    progress(report)
+            counts = _merge_staged(import_id, upserter)
+            report['created'], report['updated'] = counts['created'], counts['updated']
+
+    except ImportCancelled:
+        # 非原子模式下已提交的块保留；原子模式什么都没写入
+        db.session.rollback()
+        if atomic:
+            upserter.store_pks = []
+        return {'error': 'Import cancelled', 'cancelled': True, **report}
+
+    except Exception as e:
+        db.session.rollback()
+        if atomic:
+            upserter.store_pks = []
+        return {'error': f'Import failed: {str(e)}', 'failed_rows': report['failed_rows']}
+
+    finally:
+        if atomic:
+            _clear_staged(import_id)
+
+        if upserter.store_pks:
+            stores_changed.send(current_app._get_current_object(), store_ids=upserter.store_pks)
+
+    report['success'] = True
+    return report
+
+
+def _read_chunks(file, chunk_size):
+    return iter(pd.read_csv(file, dtype=STRING_COLUMNS, chunksize=chunk_size))
+
+
+def _rewind(file):
+    """原子模式第二遍读取: 路径直接重新打开，文件对象seek回开头"""
+    if hasattr(file, 'seek'):
+        file.seek(0)
+
+
+def _record_failures(report, failed):
+    report['failed'] += len(failed)
+    room = MAX_REPORTED_FAILURES - len(report['failed_rows'])
+    report['failed_rows'].extend(failed[:max(room, 0)])
+
+
+def _upsert_chunk(upserter, df, report):
+    """非原子模式: 一块一个savepoint，写入失败时只丢弃这一块"""
+    records = frame_to_records(df)
+    if not records:
+        return
+    try:
+        with db.session.begin_nested():
+            counts = upserter.upsert(records)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        # savepoint里新建的服务/店铺已回滚，重新加载已有数据
+        upserter.preload()
+        _record_failures(report, [
+            {'row': int(idx) + 2, 'store_id': record['store_id'], 'error': str(e)}
+            for idx, record in zip(df.index, records)
+        ])
+        return
+    report['created'] += counts['created']
+    report['updated'] += counts['updated']
+
+
+def _stage_rows(import_id, df):
+    """校验通过的行写入暂存表（每块单独提交，不长时间占用事务）"""
+    from store_locator.app.models import store_import_rows
+
+    rows = [
+        {'import_id': import_id, 'row_number': int(idx), 'data': record}
+        for idx, record in zip(df.index, frame_to_records(df))
+    ]
+    if rows:
+        db.session.execute(insert(store_import_rows), rows)
+        db.session.commit()
+
+
+def _merge_staged(import_id, upserter):
+    """按行号顺序分块读回暂存行并upsert，整个合并只提交一次"""
+    from store_locator.app.models import store_import_rows
+
+    t = store_import_rows
+    created = updated = 0
+    last_row = -1
+    while True:
+        batch = db.session.execute(
+            select(t.c.row_number, t.c.data)
+            .where(t.c.import_id == import_id, t.c.row_number > last_row)
+            .order_by(t.c.row_number)
+            .limit(upserter.chunk_size)
+        ).all()
+        if not batch:
+            break
+        counts = upserter.upsert([data for _, data in batch])
+        created += counts['created']
+        updated += counts['updated']
+        last_row = batch[-1][0]
+
+    db.session.commit()
+    return {'created': created, 'updated': updated}
+
+
+def _clear_staged(import_id):
+    from store_locator.app.models import store_import_rows
+
+    try:
+        db.session.execute(delete(store_import_rows).where(store_import_rows.c.import_id == import_id))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"[Import] failed to clear staging rows {import_id}: {e}")
@@ -0,0 +1,333 @@
+"""
+后台CSV导入任务
+- 上传的文件先落盘（IMPORT_SPOOL_DIR），请求立即返回job_id
+- 每个进程一个线程池（IMPORT_WORKERS）执行流式导入
+- 任务状态、行计数、取消标记都在 import_jobs 表里，任意worker进程都能查询和取消
+- 任务只在提交它的进程里执行: 该进程每 IMPORT_JOB_HEARTBEAT_INTERVAL 秒给自己的任务写一次心跳，
+  进程退出（重启、被杀）后心跳停止；超过 IMPORT_JOB_STALE_SECONDS 没有心跳的 queued/running 任务
+  在查询状态时、或本主机的进程启动时标记为failed，启动时顺带删除没有活任务引用的落盘文件
+"""
+import os
+import socket
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, inspect, or_
+from store_locator.app.extensions import db
+from store_locator.app.stores.import_csv import import_stores_streaming, ImportCancelled
+
+FINISHED_STATUSES = ('succeeded', 'failed', 'cancelled')
+ACTIVE_STATUSES = ('queued', 'running')
+
+STALE_JOB_ERROR = 'Import worker stopped before the job finished'
+
+
+class ImportJobRunner:
+
+    def __init__(self):
+        self._app = None
+        self._executor = None
+        self._heartbeat = None
+        self._active = set()
+        self._lock = threading.Lock()
+        self.workers = 2
+        self.spool_dir = None
+        self.heartbeat_interval = 10
+        self.stale_seconds = 60
+
+    def init_app(self, app):
+        self._app = app
+        self.workers = app.config.get('IMPORT_WORKERS', self.workers)
+        self.spool_dir = app.config.get('IMPORT_SPOOL_DIR')
+        self.heartbeat_interval = app.config.get('IMPORT_JOB_HEARTBEAT_INTERVAL', self.heartbeat_interval)
+        self.stale_seconds = app.config.get('IMPORT_JOB_STALE_SECONDS', self.stale_seconds)
+        app.extensions['import_jobs'] = self
+
+        with app.app_context():
+            try:
+                self.recover()
+            except Exception as e:
+                db.session.rollback()
+                print(f"[Import job] startup recovery failed: {e}")
+
+    @staticmethod
+    def worker_id():
+        """主机名:pid（gunicorn fork之后pid才确定，每次现取）"""
+        return f'{socket.gethostname()}:{os.getpid()}'
+
+    def _get_executor(self):
+        # 第一次提交任务时才创建线程池（gunicorn fork之后）
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix='store-import'
+                )
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._heartbeat_loop, daemon=True,
+                                                   name='store-import-heartbeat')
+                self._heartbeat.start()
+            return self._executor
+
+    # ------------------------------------------------------------
+    # 提交 / 查询 / 取消
+    # ------------------------------------------------------------
+
+    def submit(self, file, mode='atomic', user_id=None):
+        """
+        把上传文件落盘并创建任务
+
+        参数:
+            file: werkzeug FileStorage
+            mode: 'stream' | 'atomic'
+        返回: ImportJob
+        """
+        from store_locator.app.models import ImportJob
+
+        job_id = str(uuid.uuid4())
+        os.makedirs(self.spool_dir, exist_ok=True)
+        path = os.path.join(self.spool_dir, f'{job_id}.csv')
+        file.save(path)
+
+        job = ImportJob(
+            id=job_id,
+            filename=file.filename,
+            mode=mode,
+            status='queued',
+            file_path=path,
+            worker=self.worker_id(),
+            heartbeat_at=datetime.utcnow(),
+            created_by=user_id
+        )
+        db.session.add(job)
+        db.session.commit()
+
+        with self._lock:
+            self._active.add(job_id)
+        self._get_executor().submit(self._run, job_id)
+        print(f"[Import job] {job_id} queued ({file.filename}, {mode})")
+        return job
+
+    def cancel(self, job_id):
+        """
+        请求取消任务
+        排队中的任务直接标记为cancelled；运行中的任务在下一块处理完时停止
+        返回: ImportJob，不存在时返回None
+        """
+        from store_locator.app.models import ImportJob
+
+        job = db.session.get(ImportJob, job_id)
+        if job is None or job.status in FINISHED_STATUSES:
+            return job
+
+        job.cancel_requested = True
+        if job.status == 'queued':
+            job.status = 'cancelled'
+            job.finished_at = datetime.utcnow()
+        db.session.commit()
+        return job
+
+    def check_alive(self, job):
+        """
+        查询状态时: queued/running 但心跳已超时（执行它的进程没了）的任务标记为failed
+        返回: 同一个ImportJob（必要时已刷新）
+        """
+        from store_locator.app.models import ImportJob
+
+        if job.status not in ACTIVE_STATUSES or not self._is_stale(job.heartbeat_at):
+            return job
+
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+        with db.engine.begin() as conn:
+            marked = conn.execute(
+                update(ImportJob.__table__)
+                .where(ImportJob.id == job.id, ImportJob.status.in_(ACTIVE_STATUSES),
+                       or_(ImportJob.heartbeat_at < cutoff, ImportJob.heartbeat_at.is_(None)))
+                .values(status='failed', error=STALE_JOB_ERROR, finished_at=datetime.utcnow())
+            ).rowcount
+        if marked:
+            print(f"[Import job] {job.id} marked failed: no heartbeat from {job.worker}")
+        db.session.refresh(job)
+        return job
+
+    def _is_stale(self, heartbeat_at):
+        return heartbeat_at is None or datetime.utcnow() - heartbeat_at > timedelta(seconds=self.stale_seconds)
+
+    # ------------------------------------------------------------
+    # 心跳 / 启动恢复
+    # ------------------------------------------------------------
+
+    def _heartbeat_loop(self):
+        """本进程提交的任务（排队中和运行中）定时写心跳"""
+        from store_locator.app.models import ImportJob
+
+        while True:
+            time.sleep(self.heartbeat_interval)
+            with self._lock:
+                job_ids = list(self._active)
+            if not job_ids:
+                continue
+            try:
+                with self._app.app_context():
+                    with db.engine.begin() as conn:
+                        conn.execute(
+                            update(ImportJob.__table__)
+                            .where(ImportJob.id.in_(job_ids))
+                            .values(heartbeat_at=datetime.utcnow())
+                        )
+            except Exception as e:
+                print(f"[Import job] heartbeat failed: {e}")
+
+    def recover(self):
+        """
+        进程启动时（需要app context）:
+        - 本主机上心跳超时的 queued/running 任务标记为failed（执行它们的进程已经退出，任务不会再继续）
+        - 删除落盘目录里超时且没有活任务引用的文件
+        返回: 标记为failed的任务数
+        """
+        from store_locator.app.models import ImportJob
+
+        if not inspect(db.engine).has_table(ImportJob.__tablename__):
+            return 0
+
+        table = ImportJob.__table__
+        now = datetime.utcnow()
+        cutoff = now - timedelta(seconds=self.stale_seconds)
+        stale = or_(table.c.heartbeat_at < cutoff, table.c.heartbeat_at.is_(None))
+
+        with db.engine.begin() as conn:
+            rows = conn.execute(
+                select(table.c.id, table.c.file_path)
+                .where(table.c.status.in_(ACTIVE_STATUSES), stale,
+                       table.c.worker.like(f'{socket.gethostname()}:%'))
+            ).all()
+            if rows:
+                conn.execute(
+                    update(table)
+                    .where(table.c.id.in_([row.id for row in rows]), table.c.status.in_(ACTIVE_STATUSES), stale)
+                    .values(status='failed', error=STALE_JOB_ERROR, finished_at=now)
+                )
+            live = set(conn.execute(
+                select(table.c.file_path).where(table.c.status.in_(ACTIVE_STATUSES), ~stale)
+            ).scalars())
+
+        for row in rows:
+            self._remove_spool(row.file_path)
+        if rows:
+            print(f"[Import job] marked {len(rows)} interrupted jobs failed")
+
+        # 其他进程刚落盘、还没提交任务行的文件还没超时，不会被误删
+        if self.spool_dir and os.path.isdir(self.spool_dir):
+            spool_cutoff = time.time() - self.stale_seconds
+            for name in os.listdir(self.spool_dir):
+                path = os.path.join(self.spool_dir, name)
+                try:
+                    orphaned = path not in live and os.path.getmtime(path) < spool_cutoff
+                except OSError:
+                    continue
+                if orphaned:
+                    self._remove_spool(path)
+        return len(rows)
+
+    # ------------------------------------------------------------
+    # 执行
+    # ------------------------------------------------------------
+
+    def _update_job(self, job_id, expect_status=None, **values):
+        """
+        用独立连接更新任务行，不影响导入本身的事务
+        expect_status: 只有任务当前是这个状态时才更新
+        返回: 更新的行数
+        """
+        from store_locator.app.models import ImportJob
+
+        stmt = update(ImportJob.__table__).where(ImportJob.id == job_id)
+        if expect_status is not None:
+            stmt = stmt.where(ImportJob.status == expect_status)
+        with db.engine.begin() as conn:
+            return conn.execute(stmt.values(**values)).rowcount
+
+    def _cancel_requested(self, job_id):
+        from store_locator.app.models import ImportJob
+
+        with db.engine.connect() as conn:
+            return bool(conn.execute(
+                select(ImportJob.cancel_requested).where(ImportJob.id == job_id)
+            ).scalar())
+
+    def _run(self, job_id):
+        from store_locator.app.models import ImportJob
+
+        with self._app.app_context():
+            job = db.session.get(ImportJob, job_id)
+            if job is None or job.status != 'queued':
+                # 排队期间已被取消
+                self._remove_spool(job.file_path if job else None)
+                with self._lock:
+                    self._active.discard(job_id)
+                return
+            path, atomic = job.file_path, job.mode == 'atomic'
+            db.session.close()
+
+            # 条件更新: 读任务之后、这里之前被取消的话不能再改回running（调用方已经收到cancelled）
+            started = self._update_job(job_id, expect_status='queued', status='running',
+                                       started_at=datetime.utcnow(), heartbeat_at=datetime.utcnow())
+            if not started:
+                self._remove_spool(path)
+                with self._lock:
+                    self._active.discard(job_id)
+                print(f"[Import job] {job_id} cancelled before start")
+                return
+
+            def progress(report):
+                self._update_job(
+                    job_id,
+                    total_rows=report['total_rows'],
+                    created=report['created'],
+                    updated=report['updated'],
+                    failed=report['failed']
+                )
+                if self._cancel_requested(job_id):
+                    raise ImportCancelled()
+
+            try:
+                result = import_stores_streaming(path, atomic=atomic, progress=progress)
+            except Exception as e:
+                result = {'error': f'Import failed: {str(e)}'}
+            finally:
+                db.session.remove()
+                self._remove_spool(path)
+                with self._lock:
+                    self._active.discard(job_id)
+
+            if result.get('cancelled'):
+                status = 'cancelled'
+            elif 'error' in result:
+                status = 'failed'
+            else:
+                status = 'succeeded'
+
+            values = {
+                'status': status,
+                'error': result.get('error'),
+                'failed_rows': result.get('failed_rows') or [],
+                'finished_at': datetime.utcnow()
+            }
+            # 失败时只有部分计数（原子模式下都没有写入）
+            for key in ('total_rows', 'created', 'updated', 'failed'):
+                if key in result:
+                    values[key] = result[key]
+            self._update_job(job_id, **values)
+            print(f"[Import job] {job_id} {status}")
+
+    @staticmethod
+    def _remove_spool(path):
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"[Import job] failed to remove {path}: {e}")
+
+
+import_jobs = ImportJobRunner()
@@ -0,0 +1,355 @@
+"""
+邮编 -> 附近店铺 预计算表
+大部分搜索是按邮编 + 几个固定半径（5/10/25/50），每次都要重新算一遍同样的距离
+
+- 离线任务（scripts/build_postal_nearby.py）对邮编质心库里的每个邮编，
+  把 POSTAL_NEARBY_MAX_MILES 内的店铺按距离排好写入 postal_nearby_stores
+  （每个邮编最多 POSTAL_NEARBY_MAX_STORES 家，截断时 complete_miles 记录列表完整的半径）
+- 搜索按邮编查询时一条SQL读出: 按 (postal_code, distance_miles) 索引顺序扫描，
+  join stores 过滤状态/服务位图/类型，不再计算距离
+- 表里没有这个邮编、半径超出 complete_miles 且不够limit家、或有位图表达不了的服务时返回None，调用方走实时搜索
+- 店铺变更（stores_changed）增量刷新: 删除这些店铺的旧行，按新位置重新插入到附近已预计算的邮编；
+  只在 complete_miles 以内插入，所以列表始终在 complete_miles 内完整（可能略多于上限，下次全量重建时整理）
+  少量店铺（管理端修改）当场刷新；超过 POSTAL_NEARBY_SYNC_LIMIT 家（CSV导入）放进队列，
+  由后台线程按 POSTAL_NEARBY_REFRESH_BATCH 家一批刷新，不占用导入请求/任务
+- 刷新失败: 删除这些店铺新旧位置附近的邮编，这些邮编改走实时搜索，直到下次全量重建
+
+表在主库里，所有worker共用；配置了分片（STORE_SHARDS）时不使用
+"""
+import math
+import threading
+from collections import defaultdict
+from datetime import datetime
+import numpy as np
+from flask import current_app
+from sqlalchemy import select, delete, insert
+from store_locator.app.extensions import db
+from store_locator.app.stores.geocoding import geocode_cache, normalize_postal_code
+from store_locator.app.stores.hours import DAY_COLUMNS, open_mask, pack_week
+from store_locator.app.stores.serializers import _chunks
+from store_locator.app.stores.service_mask import required_mask
+from store_locator.app.stores.signals import stores_changed
+from store_locator.app.stores.utils import calculate_bounding_box, calculate_distances
+from store_locator.app.metrics import count_candidates
+
+
+class PointGrid:
+    """按经纬度网格分桶的点集（邮编质心 / 店铺），查询半径内的点"""
+
+    def __init__(self, points, cell_degrees=1.0):
+        self.cell_degrees = cell_degrees
+        buckets = defaultdict(list)
+        for key, lat, lon in points:
+            lat, lon = float(lat), float(lon)
+            buckets[self._cell(lat, lon)].append((key, lat, lon))
+        self._cells = {
+            cell: ([p[0] for p in items], np.array([p[1] for p in items]), np.array([p[2] for p in items]))
+            for cell, items in buckets.items()
+        }
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees))
+
+    def near(self, lat, lon, radius_miles, method='haversine'):
+        """返回 [(key, 距离)]，未排序"""
+        min_lat, max_lat, min_lon, max_lon = calculate_bounding_box(lat, lon, radius_miles)
+        lat_lo, lon_lo = self._cell(min_lat, min_lon)
+        lat_hi, lon_hi = self._cell(max_lat, max_lon)
+        lon_hi = min(lon_hi, lon_lo + math.ceil(360 / self.cell_degrees))
+
+        keys, lats, lons = [], [], []
+        for i in range(lat_lo, lat_hi + 1):
+            for j in range(lon_lo, lon_hi + 1):
+                cell = self._cells.get((i, j))
+                if cell is not None:
+                    keys.extend(cell[0])
+                    lats.append(cell[1])
+                    lons.append(cell[2])
+        if not keys:
+            return []
+
+        distances = calculate_distances((lat, lon), np.concatenate(lats), np.concatenate(lons), method=method)
+        return [(key, float(d)) for key, d in zip(keys, distances) if d <= radius_miles]
+
+
+class PostalNearbyTable:
+
+    def __init__(self):
+        self.enabled = False
+        self.max_miles = 50.0
+        self.max_stores = 100
+        self.sync_limit = 100
+        self.refresh_batch = 1000
+        self._centroids = None
+        self._app = None
+        self._pending = set()
+        self._wakeup = threading.Event()
+        self._worker = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshed_stores = 0
+        self.refresh_failures = 0
+
+    def init_app(self, app):
+        self._app = app
+        self.enabled = app.config.get('POSTAL_NEARBY_ENABLED', True)
+        self.max_miles = app.config.get('POSTAL_NEARBY_MAX_MILES', self.max_miles)
+        self.max_stores = app.config.get('POSTAL_NEARBY_MAX_STORES', self.max_stores)
+        self.sync_limit = app.config.get('POSTAL_NEARBY_SYNC_LIMIT', self.sync_limit)
+        self.refresh_batch = app.config.get('POSTAL_NEARBY_REFRESH_BATCH', self.refresh_batch)
+        self._centroids = None
+        if self.enabled:
+            stores_changed.connect(self._on_stores_changed, sender=app)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshed_stores': self.refreshed_stores,
+            'refresh_failures': self.refresh_failures,
+            'pending_stores': len(self._pending)
+        }
+
+    # ------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------
+
+    def search(self, postal_code, radius_miles, services=None, store_types=None, open_now=False, limit=20):
+        """
+        按距离升序的 [(Store.id, updated_at, lat, lon, 距离)]，与实时搜索结构相同
+        不能由预计算表回答时返回None
+        """
+        from store_locator.app.models import Store, PostalNearbyCode, PostalNearbyStore
+        from store_locator.app.stores.shards import shard_router
+
+        code = normalize_postal_code(postal_code) if postal_code else None
+        if not self.enabled or not code or shard_router.enabled:
+            return None
+
+        # 服务id超过63（不在位图里）时需要EXISTS子查询，交给实时搜索
+        services_mask, unmapped_services = required_mask(services)
+        if unmapped_services:
+            self._count('misses')
+            return None
+
+        complete_miles = db.session.execute(
+            select(PostalNearbyCode.complete_miles).where(PostalNearbyCode.postal_code == code)
+        ).scalar()
+        if complete_miles is None:
+            self._count('misses')
+            return None
+
+        nearby = PostalNearbyStore.__table__
+        stores = Store.__table__
+        columns = [stores.c.id, stores.c.updated_at, stores.c.latitude, stores.c.longitude, nearby.c.distance_miles]
+        if open_now:
+            columns += [stores.c.hours_packed] + [stores.c[col] for col in DAY_COLUMNS]
+        stmt = (
+            select(*columns)
+            .select_from(nearby.join(stores, stores.c.id == nearby.c.store_id))
+            .where(nearby.c.postal_code == code,
+                   nearby.c.distance_miles <= radius_miles,
+                   stores.c.status == 'active')
+            .order_by(nearby.c.distance_miles, nearby.c.store_id)
+        )
+        if services_mask:
+            stmt = stmt.where(stores.c.services_mask.op('&')(services_mask) == services_mask)
+        if store_types:
+            stmt = stmt.where(stores.c.store_type.in_(store_types))
+        if not open_now:
+            stmt = stmt.limit(limit)
+
+        rows = db.session.execute(stmt).all()
+        count_candidates(len(rows))
+        if open_now and rows:
+            packed = [row.hours_packed or pack_week([getattr(row, col) for col in DAY_COLUMNS]) for row in rows]
+            rows = [row for row, ok in zip(rows, open_mask(packed, datetime.utcnow())) if ok]
+        rows = rows[:limit]
+
+        # 不够limit家时，只有搜索半径在列表完整的范围内才能确定没有更多店铺
+        if len(rows) < limit and radius_miles > complete_miles:
+            self._count('misses')
+            return None
+
+        self._count('hits')
+        return [
+            (row.id, row.updated_at, float(row.latitude), float(row.longitude), float(row.distance_miles))
+            for row in rows
+        ]
+
+    # ------------------------------------------------------------
+    # 全量构建（离线）
+    # ------------------------------------------------------------
+
+    def rebuild(self, batch_size=500):
+        """
+        清空并重新计算所有邮编（需要app context）
+        返回: (邮编数, 行数)
+        """
+        from store_locator.app.models import Store, PostalNearbyCode, PostalNearbyStore
+
+        centroids = geocode_cache.centroids.all_centroids()
+        if not centroids:
+            raise RuntimeError('Postal centroid database is empty (run scripts/load_postal_centroids.py first)')
+
+        method = current_app.config.get('DISTANCE_METHOD', 'haversine')
+        stores = PointGrid(db.session.execute(
+            select(Store.id, Store.latitude, Store.longitude).where(Store.status == 'active')
+        ).all())
+
+        db.session.execute(delete(PostalNearbyStore.__table__))
+        db.session.execute(delete(PostalNearbyCode.__table__))
+        db.session.commit()
+
+        total_codes = total_rows = 0
+        for start in range(0, len(centroids), batch_size):
+            codes, rows = [], []
+            now = datetime.utcnow()
+            for code, lat, lon in centroids[start:start + batch_size]:
+                nearest, complete_miles = self._nearest(stores.near(lat, lon, self.max_miles, method))
+                codes.append({'postal_code': code, 'complete_miles': complete_miles, 'refreshed_at': now})
+                rows.extend({'postal_code': code, 'store_id': pk, 'distance_miles': d} for pk, d in nearest)
+
+            db.session.execute(insert(PostalNearbyCode.__table__), codes)
+            if rows:
+                db.session.execute(insert(PostalNearbyStore.__table__), rows)
+            db.session.commit()
+            total_codes += len(codes)
+            total_rows += len(rows)
+            print(f"[PostalNearby] {total_codes}/{len(centroids)} postal codes, {total_rows} rows")
+
+        return total_codes, total_rows
+
+    def _nearest(self, hits):
+        """半径内的 [(Store.id, 距离)] -> (最近的max_stores家（含并列）, 列表完整的半径)"""
+        hits.sort(key=lambda hit: (hit[1], hit[0]))
+        if len(hits) <= self.max_stores:
+            return hits, self.max_miles
+        boundary = hits[self.max_stores - 1][1]
+        return [hit for hit in hits if hit[1] <= boundary], boundary
+
+    # ------------------------------------------------------------
+    # 增量刷新
+    # ------------------------------------------------------------
+
+    def _centroid_grid(self):
+        if self._centroids is None:
+            self._centroids = PointGrid(geocode_cache.centroids.all_centroids())
+        return self._centroids
+
+    def refresh_stores(self, store_pks):
+        """
+        店铺变更后: 删除这些店铺的旧行，active的店铺按当前位置插入到附近已预计算的邮编
+        （只插入到 complete_miles 以内，列表在该半径内保持完整）
+        """
+        from store_locator.app.models import Store, PostalNearbyCode, PostalNearbyStore
+
+        nearby = PostalNearbyStore.__table__
+        method = current_app.config.get('DISTANCE_METHOD', 'haversine')
+        grid = self._centroid_grid()
+
+        for chunk in _chunks(list(store_pks)):
+            stores = db.session.execute(
+                select(Store.id, Store.latitude, Store.longitude)
+                .where(Store.id.in_(chunk), Store.status == 'active')
+            ).all()
+            db.session.execute(delete(nearby).where(nearby.c.store_id.in_(chunk)))
+
+            pairs = [
+                (code, pk, d)
+                for pk, lat, lon in stores
+                for code, d in grid.near(float(lat), float(lon), self.max_miles, method)
+            ]
+            complete = {}
+            for codes in _chunks(list({code for code, _, _ in pairs})):
+                complete.update(db.session.execute(
+                    select(PostalNearbyCode.postal_code, PostalNearbyCode.complete_miles)
+                    .where(PostalNearbyCode.postal_code.in_(codes))
+                ).all())
+
+            rows = [
+                {'postal_code': code, 'store_id': pk, 'distance_miles': d}
+                for code, pk, d in pairs if code in complete and d <= complete[code]
+            ]
+            if rows:
+                db.session.execute(insert(nearby), rows)
+        db.session.commit()
+        self._count('refreshed_stores', len(store_pks))
+
+    def _refresh_or_drop(self, store_pks):
+        try:
+            self.refresh_stores(store_pks)
+        except Exception as e:
+            db.session.rollback()
+            self._count('refresh_failures')
+            print(f"[PostalNearby] refresh failed for {len(store_pks)} stores, dropping nearby postal codes: {e}")
+            try:
+                self.drop_codes_near(store_pks)
+            except Exception as e:
+                db.session.rollback()
+                print(f"[PostalNearby] dropping postal codes failed: {e}")
+
+    def drop_codes_near(self, store_pks):
+        """
+        删除列出了这些店铺的邮编（旧位置）和当前位置附近的邮编，之后按这些邮编的搜索走实时搜索
+        返回: 删除的邮编数
+        """
+        from store_locator.app.models import Store, PostalNearbyCode, PostalNearbyStore
+
+        nearby = PostalNearbyStore.__table__
+        method = current_app.config.get('DISTANCE_METHOD', 'haversine')
+        grid = self._centroid_grid()
+
+        codes = set()
+        for chunk in _chunks(list(store_pks)):
+            codes.update(db.session.execute(
+                select(nearby.c.postal_code).where(nearby.c.store_id.in_(chunk))
+            ).scalars())
+            for lat, lon in db.session.execute(
+                select(Store.latitude, Store.longitude).where(Store.id.in_(chunk))
+            ):
+                codes.update(code for code, _ in grid.near(float(lat), float(lon), self.max_miles, method))
+
+        for chunk in _chunks(list(codes)):
+            db.session.execute(delete(nearby).where(nearby.c.postal_code.in_(chunk)))
+            db.session.execute(delete(PostalNearbyCode.__table__).where(PostalNearbyCode.postal_code.in_(chunk)))
+        db.session.commit()
+        return len(codes)
+
+    def _on_stores_changed(self, sender, store_ids=None, **extra):
+        if not store_ids:
+            return
+        if len(store_ids) <= self.sync_limit:
+            self._refresh_or_drop(store_ids)
+            return
+
+        with self._lock:
+            self._pending.update(store_ids)
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._loop, daemon=True, name='postal-nearby-refresh')
+                self._worker.start()
+        self._wakeup.set()
+
+    def _loop(self):
+        """后台刷新队列里的店铺，每批一个事务"""
+        while True:
+            self._wakeup.wait()
+            with self._lock:
+                batch = [self._pending.pop() for _ in range(min(self.refresh_batch, len(self._pending)))]
+                if not self._pending:
+                    self._wakeup.clear()
+            if not batch:
+                continue
+            try:
+                with self._app.app_context():
+                    self._refresh_or_drop(batch)
+            except Exception as e:
+                print(f"[PostalNearby] background refresh failed: {e}")
+
+postal_nearby = PostalNearbyTable()
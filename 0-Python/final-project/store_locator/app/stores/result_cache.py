@@ -0,0 +1,228 @@
+"""
+搜索结果缓存
+热门搜索（同一邮编 + 默认半径 + 无过滤）不再每次跑完整流程
+
+缓存key（规范化后的参数）:
+- 中心点坐标吸附到网格（SEARCH_CACHE_GRID_DEGREES）
+- 半径、limit 向上取到档位（结果是前缀，取回后再按实际半径/limit截取）
+  缓存离网格中心最近的 2×limit档位 家；换到实际中心点后不能保证是最近的limit家时（列表截断且边界不够）改为实时计算
+- services / store_types 排序去重
+- open_now 精确到分钟
+- 覆盖区域内每个瓦片（tile）的版本号
+
+失效: 店铺变更时只给它所在的瓦片换一个新版本号，覆盖该瓦片的缓存自然全部失效
+（在延迟非0的只读副本上算出的结果不写缓存，否则旧数据会存到新版本号下，见 db_routing.py）
+"""
+import hashlib
+import math
+import threading
+import uuid
+from datetime import datetime
+from flask import current_app
+from store_locator.app.db_routing import replica_reads_stale
+from store_locator.app.extensions import cache, db
+from store_locator.app.stores.signals import stores_changed
+from store_locator.app.stores.utils import calculate_bounding_box, calculate_distances, select_nearest
+
+KEY_PREFIX = 'search:v3:'
+GEN_PREFIX = 'search-gen:'
+EPOCH_KEY = GEN_PREFIX + 'epoch'
+
+RADIUS_BUCKETS = [1, 2, 5, 10, 15, 25, 50, 75, 100]
+LIMIT_BUCKETS = [10, 20, 50, 100]
+
+# 一次变更涉及的瓦片超过这个数量时直接整体失效（换epoch）
+MAX_TILES_PER_INVALIDATION = 200
+
+def _bucket(value, buckets):
+    """向上取到档位，超过最大档位时取整数上界"""
+    for b in buckets:
+        if value <= b:
+            return b
+    return math.ceil(value)
+
+
+class SearchResultCache:
+
+    def __init__(self):
+        self.enabled = False
+        self.ttl = 300
+        self.grid_degrees = 0.01
+        self.tile_degrees = 1.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.recomputed = 0
+        self.stale_skipped = 0
+        self.invalidations = 0
+
+    def init_app(self, app):
+        self.enabled = app.config.get('SEARCH_CACHE_ENABLED', True)
+        self.ttl = app.config.get('SEARCH_CACHE_TTL', self.ttl)
+        self.grid_degrees = app.config.get('SEARCH_CACHE_GRID_DEGREES', self.grid_degrees)
+        self.tile_degrees = app.config.get('SEARCH_CACHE_TILE_DEGREES', self.tile_degrees)
+        if self.enabled:
+            stores_changed.connect(self._on_stores_changed, sender=app)
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'hits': self.hits,
+            'misses': self.misses,
+            'bypassed': self.bypassed,
+            'recomputed': self.recomputed,
+            'stale_skipped': self.stale_skipped,
+            'invalidations': self.invalidations,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None
+        }
+
+    # ------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------
+
+    def _tile(self, lat, lon):
+        return (math.floor(lat / self.tile_degrees), math.floor(lon / self.tile_degrees))
+
+    def _tiles_for(self, lat, lon, radius_miles):
+        min_lat, max_lat, min_lon, max_lon = calculate_bounding_box(lat, lon, radius_miles)
+        lat_lo, lon_lo = self._tile(min_lat, min_lon)
+        lat_hi, lon_hi = self._tile(max_lat, max_lon)
+        return [(i, j) for i in range(lat_lo, lat_hi + 1) for j in range(lon_lo, lon_hi + 1)]
+
+    def _generations(self, tiles):
+        """[epoch, 每个瓦片的版本号...]，缓存不可用时抛异常"""
+        keys = [EPOCH_KEY] + [f'{GEN_PREFIX}{i}:{j}' for i, j in tiles]
+        return [v or '0' for v in cache.get_many(*keys)]
+
+    def search(self, compute, lat, lon, radius_miles, services, store_types, open_now, limit):
+        """
+        带缓存的搜索
+
+        参数:
+            compute(lat, lon, radius_miles, limit) -> 按距离排好序的
+                [(Store.id, updated_at, lat, lon, 距离)]（未命中时调用）
+            其余为实际搜索参数
+        返回: 同样结构的列表（距离按实际中心点重新计算）
+        缓存里只存这些元组，店铺内容由 fragments.py 按 updated_at 拼接
+        """
+        if not self.enabled:
+            self._count('bypassed')
+            return compute(lat, lon, radius_miles, limit)
+
+        # 规范化参数: 中心点吸附到网格中心，半径加上吸附误差后取档位
+        cell_lat = (math.floor(lat / self.grid_degrees) + 0.5) * self.grid_degrees
+        cell_lon = (math.floor(lon / self.grid_degrees) + 0.5) * self.grid_degrees
+        margin = self.grid_degrees * 69.0
+        radius_bucket = _bucket(radius_miles + margin, RADIUS_BUCKETS)
+        limit_bucket = _bucket(limit, LIMIT_BUCKETS)
+        minute = datetime.utcnow().strftime('%Y%m%d%H%M') if open_now else '-'
+
+        try:
+            generations = self._generations(self._tiles_for(cell_lat, cell_lon, radius_bucket))
+            raw_key = '|'.join(map(str, [
+                round(cell_lat, 6), round(cell_lon, 6), radius_bucket, limit_bucket,
+                ','.join(sorted(set(services or []))), ','.join(sorted(set(store_types or []))),
+                minute, ','.join(map(str, generations))
+            ]))
+            key = KEY_PREFIX + hashlib.sha1(raw_key.encode()).hexdigest()
+            stores = cache.get(key)
+        except Exception as e:
+            print(f"[Search cache] unavailable: {e}")
+            self._count('bypassed')
+            return compute(lat, lon, radius_miles, limit)
+
+        # 缓存的是离网格中心最近的depth家，比limit档位多取一倍，换了中心点后前limit家基本都在里面
+        depth = limit_bucket * 2
+        if stores is None:
+            self._count('misses')
+            stores = compute(cell_lat, cell_lon, radius_bucket, depth)
+            if replica_reads_stale():
+                # 副本可能还没看到触发这次失效的写入，不能把旧结果存到新版本号下
+                self._count('stale_skipped')
+            else:
+                try:
+                    cache.set(key, stores, timeout=self.ttl)
+                except Exception as e:
+                    print(f"[Search cache] set failed: {e}")
+        else:
+            self._count('hits')
+
+        entries = self._localize(stores, lat, lon, radius_miles, limit)
+        if len(stores) >= depth and not self._complete(stores, entries, cell_lat, cell_lon, radius_miles, limit):
+            # 截断的列表不能保证包含实际中心点最近的店铺，这次不用缓存
+            self._count('recomputed')
+            return compute(lat, lon, radius_miles, limit)
+        return entries
+
+    def _complete(self, stores, entries, cell_lat, cell_lon, radius_miles, limit):
+        """
+        缓存列表被截断（取满depth家）时，没缓存的店铺离网格中心至少是第depth家的距离，
+        离实际中心点至少再减去网格的半对角线；结果都在这个距离以内才是准确的
+        """
+        half = self.grid_degrees / 2
+        corners = calculate_distances(
+            (cell_lat, cell_lon),
+            [cell_lat - half, cell_lat - half, cell_lat + half, cell_lat + half],
+            [cell_lon - half, cell_lon + half, cell_lon - half, cell_lon + half],
+            method=current_app.config.get('DISTANCE_METHOD', 'haversine')
+        )
+        bound = stores[-1][4] - float(corners.max())
+        if len(entries) == limit:
+            return entries[-1][4] <= bound
+        return radius_miles <= bound
+
+    def _localize(self, entries, lat, lon, radius_miles, limit):
+        """按实际中心点重新计算距离、按实际半径过滤并截取limit"""
+        if not entries:
+            return []
+
+        distances = calculate_distances(
+            (lat, lon),
+            [e[2] for e in entries],
+            [e[3] for e in entries],
+            method=current_app.config.get('DISTANCE_METHOD', 'haversine')
+        )
+        idx = [i for i in select_nearest(distances, len(entries)) if distances[i] <= radius_miles][:limit]
+        return [(*entries[i][:4], float(distances[i])) for i in idx]
+
+    # ------------------------------------------------------------
+    # 失效
+    # ------------------------------------------------------------
+
+    def _on_stores_changed(self, sender, store_ids=None, **extra):
+        """店铺变更: 只让覆盖这些店铺所在瓦片的缓存失效"""
+        if store_ids:
+            self.invalidate_stores(store_ids)
+
+    def invalidate_stores(self, store_ids, extra_points=()):
+        """让这些店铺当前位置（以及 extra_points 里的旧位置）所在瓦片的缓存失效"""
+        if not self.enabled:
+            return
+
+        from store_locator.app.models import Store
+
+        try:
+            rows = db.session.query(Store.latitude, Store.longitude).filter(Store.id.in_(store_ids)).all()
+            tiles = {self._tile(float(lat), float(lon)) for lat, lon in list(rows) + list(extra_points)}
+            # 版本号用随机token而不是计数器: 不需要原子自增，也不会因过期回到旧值
+            token = uuid.uuid4().hex[:12]
+            if len(tiles) > MAX_TILES_PER_INVALIDATION:
+                cache.set(EPOCH_KEY, token, timeout=0)
+            else:
+                cache.set_many({f'{GEN_PREFIX}{i}:{j}': token for i, j in tiles}, timeout=0)
+            self._count('invalidations')
+        except Exception as e:
+            print(f"[Search cache] invalidation failed: {e}")
+
+    def invalidate_all(self):
+        """换epoch，所有缓存的搜索结果失效（重新拆分分片等）"""
+        cache.set(EPOCH_KEY, uuid.uuid4().hex[:12], timeout=0)
+        self._count('invalidations')
+
+search_result_cache = SearchResultCache()
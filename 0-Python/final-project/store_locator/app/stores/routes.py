@@ -2,15 +2,22 @@
 店铺搜索路由
 公开API端点
 """
-from flask import Blueprint, request, jsonify
-from store_locator.app.stores.search import StoreSearchService
+from flask import Blueprint, request, Response
+from store_locator.app.stores.search import get_search_service
+from store_locator.app.stores.fragments import render_response
 from store_locator.app.extensions import limiter
+from store_locator.app.rate_limit import rate_limiter
+from store_locator.app.auth.decorators import optional_current_user
+from store_locator.app.db_routing import replica_reads
 
 stores_bp = Blueprint('stores', __name__, url_prefix='/api/stores')
 
 @stores_bp.route('/search', methods=['POST'])
-@limiter.limit("10 per minute")   # 短期限制
-@limiter.limit("100 per hour")    # 长期限制
+@limiter.exempt                   # 不走Flask-Limiter的默认限制（每次请求都要访问Redis）
+@rate_limiter.limit(
+    "10 per minute",              # 短期限制
+    "100 per hour"                # 长期限制
+)
 def search_stores():
     """
     店铺搜索端点（公开）
@@ -29,11 +36,32 @@ def search_stores():
         "longitude": -71.0589,
         "radius_miles": 50
     }
+    
+    最近N家（不限半径，从radius_miles开始向外扩大）:
+    {
+        "postal_code": "02101",
+        "nearest": true,
+        "limit": 5
+    }
+
+    管理员可加 "debug_timings": true，响应中附带各阶段耗时（其他用户忽略该字段）
     """
     data = request.get_json() or {}
-    
-    # 创建搜索服务实例
-    service = StoreSearchService()
+
+    # 只有请求了才校验token（普通搜索不多做任何事）
+    # 在进入副本作用域之前识别用户: 用户/角色表走主库（副本延迟只按stores表判断，见db_routing.py）
+    debug_timings = False
+    if data.get('debug_timings'):
+        user = optional_current_user()
+        debug_timings = user is not None and user.role_name == 'admin'
+
+    return _search(data, debug_timings)
+
+
+@replica_reads                    # 只读，走副本库（见db_routing.py）
+def _search(data, debug_timings):
+    # 进程内共享的搜索服务（地理编码器和连接池只创建一次）
+    service = get_search_service()
     
     # 执行搜索
     results = service.search_stores(
@@ -45,7 +73,12 @@ def search_stores():
         services=data.get('services', []),
         store_types=data.get('store_types', []),
         open_now=data.get('open_now', False),
-        limit=data.get('limit', 20)
+        limit=max(min(data.get('limit', 20), 100), 1),  # 最多100家
+        nearest=data.get('nearest', False),
+        debug_timings=debug_timings,
+        raw_fragments=True
     )
-    
-    return jsonify(results), 200
\ No newline at end of file
+
+    # 店铺部分是预编码的JSON片段，直接拼接（不再逐个dict编码）
+    stores = results.pop('stores')
+    return Response(render_response(results, stores), status=200, mimetype='application/json')
\ No newline at end of file
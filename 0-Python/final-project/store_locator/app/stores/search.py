@@ -1,13 +1,48 @@
 from typing import Optional, List
-from sqlalchemy import and_
+from datetime import datetime
+from sqlalchemy import and_, or_
 from store_locator.app.models import Store, Service
-from store_locator.app.extensions import db, cache
-from store_locator.app.stores.utils import calculate_bounding_box, calculate_distance
+from store_locator.app.extensions import db
+from store_locator.app.stores.utils import calculate_bounding_box, calculate_distances, select_nearest
+from store_locator.app.stores.spatial_index import spatial_index
+from store_locator.app.stores.hours import DAY_COLUMNS, open_mask, pack_week
+from store_locator.app.stores.fragments import store_fragments
+from store_locator.app.stores.shards import shard_router
+from store_locator.app.stores.geocoding import geocode_cache
+from store_locator.app.stores.result_cache import search_result_cache
+from store_locator.app.stores.postal_nearby import postal_nearby
+from store_locator.app.stores.service_mask import required_mask
+from store_locator.app.metrics import start_search_timings, finish_search_timings, stage, count_candidates
+from flask import current_app
 from geopy.geocoders import Nominatim
+from geopy.adapters import RequestsAdapter, requests_available
+from functools import partial
+import numpy as np
+import heapq
+import itertools
+import json
+import math
 import ssl
 import certifi
 import os
 
+# nearest模式的最大搜索半径（约半个地球周长，覆盖所有店铺）
+NEAREST_MAX_RADIUS_MILES = 12500
+# nearest模式最多扩大几轮，最后一轮直接用最大半径
+NEAREST_MAX_ROUNDS = 5
+
+
+def _expand_radius(radius_miles, found, limit, rounds):
+    """
+    nearest模式下一轮的半径: 按这一轮的店铺密度估算找够limit家需要的半径（店铺数 ∝ 半径²），
+    多留25%余量，至少翻倍；一家都没找到时扩大4倍
+    """
+    if rounds >= NEAREST_MAX_ROUNDS:
+        return NEAREST_MAX_RADIUS_MILES
+    factor = max(2.0, 1.25 * math.sqrt(limit / found)) if found else 4.0
+    return min(max(radius_miles, 1) * factor, NEAREST_MAX_RADIUS_MILES)
+
+
 class StoreSearchService:
     """
     店铺搜索服务类
@@ -18,14 +53,34 @@ class StoreSearchService:
     4. 多条件过滤
     """
 
-    def __init__(self):
-        """初始化地理编码器"""
-        user_agent = os.getenv('NOMINATIM_USER_AGENT', 'store-locator/1.0')
-        
-        # 使用 certifi 提供的受信任 CA
-        ssl_context = ssl.create_default_context(cafile=certifi.where())
-        
-        self.geocoder = Nominatim(user_agent=user_agent, ssl_context=ssl_context)
+    def __init__(self, user_agent=None, pool_size=10, geocoder=None, domain=None, scheme=None):
+        """
+        初始化地理编码器
+
+        每个进程只创建一次（见 init_search_service），所有请求共用同一个
+        SSL context 和 HTTP 连接池；geocoder 参数用于注入测试/benchmark替身
+        domain/scheme: Nominatim服务地址（默认公共服务，自建时见 NOMINATIM_DOMAIN）
+        """
+        if geocoder is None:
+            user_agent = user_agent or os.getenv('NOMINATIM_USER_AGENT', 'store-locator/1.0')
+
+            # 使用 certifi 提供的受信任 CA
+            ssl_context = ssl.create_default_context(cafile=certifi.where())
+
+            # requests可用时使用带连接池的adapter（keep-alive，复用TLS连接）
+            adapter_factory = None
+            if requests_available:
+                adapter_factory = partial(RequestsAdapter, pool_connections=1, pool_maxsize=pool_size)
+
+            geocoder = Nominatim(
+                user_agent=user_agent,
+                domain=domain or 'nominatim.openstreetmap.org',
+                scheme=scheme or 'https',
+                ssl_context=ssl_context,
+                adapter_factory=adapter_factory
+            )
+
+        self.geocoder = geocoder
 
     def search_stores(
         self,
@@ -37,64 +92,62 @@ class StoreSearchService:
         services: Optional[List[str]] = None,
         store_types: Optional[List[str]] = None,
         open_now: bool = False,
-        limit: int = 20
+        limit: int = 20,
+        nearest: bool = False,
+        debug_timings: bool = False,
+        raw_fragments: bool = False
     ):
         """
         搜索店铺主函数
-        """
-        # Step 1: 获取搜索中心点坐标
-        search_lat, search_lon = self._get_coordinates(latitude, longitude, address, postal_code)
 
-        if search_lat is None or search_lon is None:
-            return {
-                'error': 'Unable to determine search location',
-                'stores': []
-            }
+        nearest=True 时忽略半径上限: 从radius_miles开始逐圈翻倍扩大搜索范围，
+        直到找到limit家店铺（或已覆盖全球）
+        debug_timings=True 时在结果中附带各阶段耗时（仅管理员请求，见 routes.py）
+        raw_fragments=True 时 stores 是预编码的JSON片段（bytes），由路由直接拼接响应
+        """
+        timings, token = start_search_timings()
+        mode = 'nearest' if nearest else 'radius'
+        try:
+            # Step 1: 获取搜索中心点坐标
+            with stage('geocode'):
+                search_lat, search_lon = self._get_coordinates(latitude, longitude, address, postal_code)
 
-        # Step 2: 计算边界框
-        min_lat, max_lat, min_lon, max_lon = calculate_bounding_box(search_lat, search_lon, radius_miles)
+            if search_lat is None or search_lon is None:
+                mode = 'unresolved'
+                return {
+                    'error': 'Unable to determine search location',
+                    'stores': []
+                }
 
-        # Step 3: SQL预过滤（利用索引）
-        query = Store.query.filter(
-            and_(
-                Store.latitude.between(min_lat, max_lat),
-                Store.longitude.between(min_lon, max_lon),
-                Store.status == 'active'
-            )
-        )
+            # Step 2-8: nearest模式半径不固定，不走结果缓存
+            if nearest:
+                entries, radius_miles = self._search_nearest(
+                    search_lat, search_lon, radius_miles, services, store_types, open_now, limit
+                )
+            else:
+                # 中心点来自邮编时先查预计算表（见 postal_nearby.py）
+                entries = self._search_postal(
+                    latitude, longitude, address, postal_code, radius_miles, services, store_types, open_now, limit
+                )
+                if entries is not None:
+                    mode = 'postal'
+                else:
+                    entries = search_result_cache.search(
+                        lambda lat, lon, radius, k: self._search_page(lat, lon, radius, services, store_types, open_now, k),
+                        search_lat, search_lon, radius_miles, services, store_types, open_now, limit
+                    )
 
-        # Step 4: 服务过滤（AND逻辑）
-        if services:
-            for service_name in services:
-                query = query.filter(Store.services.any(Service.name == service_name))
+            # Step 9: 拼接预编码的店铺片段（只有未缓存/已修改的店铺查库）
+            with stage('serialize'):
+                stores = store_fragments.render([(pk, stamp, distance) for pk, stamp, _, _, distance in entries])
+                if not raw_fragments:
+                    stores = [json.loads(fragment) for fragment in stores]
+            timings.returned = len(stores)
+        finally:
+            finish_search_timings(timings, token, mode)
 
-        # Step 5: 店铺类型过滤（OR逻辑）
-        if store_types:
-            query = query.filter(Store.store_type.in_(store_types))
-
-        stores = query.all()
-
-        # Step 6: 精确距离计算并过滤
-        results = []
-        for store in stores:
-            distance = calculate_distance((search_lat, search_lon), (float(store.latitude), float(store.longitude)))
-            if distance <= radius_miles:
-                if open_now and not store.is_open_now():
-                    continue
-                results.append({'store': store, 'distance': distance})
-
-        # Step 7: 按距离排序
-        results.sort(key=lambda x: x['distance'])
-
-        # Step 8: 限制返回数量
-        results = results[:limit]
-
-        # Step 9: 返回结构化结果
-        return {
-            'stores': [
-                {**r['store'].to_dict(include_distance=True, distance=r['distance'])}
-                for r in results
-            ],
+        results = {
+            'stores': stores,
             'search_location': {
                 'latitude': search_lat,
                 'longitude': search_lon,
@@ -104,10 +157,251 @@ class StoreSearchService:
                 'radius_miles': radius_miles,
                 'services': services or [],
                 'store_types': store_types or [],
-                'open_now': open_now
+                'open_now': open_now,
+                'nearest': nearest
             },
-            'total_results': len(results)
+            'total_results': len(stores)
         }
+        if debug_timings:
+            results['debug_timings'] = timings.to_dict()
+        return results
+
+    def _search_postal(self, latitude, longitude, address, postal_code, radius_miles,
+                       services, store_types, open_now, limit):
+        """只有中心点来自邮编时才读预计算表；不能回答时返回None"""
+        if not postal_code or address or (latitude is not None and longitude is not None):
+            return None
+        with stage('postal_nearby'):
+            return postal_nearby.search(postal_code, radius_miles, services, store_types, open_now, limit)
+
+    def _search_page(self, search_lat, search_lon, radius_miles, services, store_types, open_now, limit):
+        """半径内最近的limit家店铺，按距离升序: [(Store.id, updated_at, lat, lon, 距离)]"""
+        return self._nearest_entries(search_lat, search_lon, radius_miles, services, store_types, open_now, limit)[0]
+
+    def _search_nearest(self, search_lat, search_lon, radius_miles, services, store_types, open_now, limit):
+        """
+        最近的limit家店铺，不限半径: 从radius_miles开始逐圈扩大（见 _expand_radius），直到找够或已覆盖全球
+        不分片时上一轮读到的行留着复用，每轮只查询新增的范围
+        返回: (店铺列表, 最终半径)
+        """
+        if shard_router.enabled:
+            def search_round(radius):
+                return self._nearest_from_shards(
+                    search_lat, search_lon, radius, services, store_types, open_now, limit
+                )
+        else:
+            seen = {'rows': {}, 'bbox_radius': None}
+
+            def search_round(radius):
+                candidates, distances = self._find_candidates(
+                    search_lat, search_lon, radius, services, store_types, open_now, seen
+                )
+                return self._select_nearest(candidates, distances, limit), len(candidates)
+
+        entries, found = search_round(radius_miles)
+        rounds = 1
+        while found < limit and radius_miles < NEAREST_MAX_RADIUS_MILES:
+            rounds += 1
+            radius_miles = _expand_radius(radius_miles, found, limit, rounds)
+            entries, found = search_round(radius_miles)
+        return entries, radius_miles
+
+    def _nearest_entries(self, search_lat, search_lon, radius_miles, services, store_types, open_now, limit):
+        """
+        半径内最近的limit家店铺
+        返回: (按距离升序的 [(Store.id, updated_at, lat, lon, 距离)], 半径内满足条件的店铺总数)
+        配置了分片时 Store.id 是 (分片, 主键)
+        """
+        if shard_router.enabled:
+            return self._nearest_from_shards(
+                search_lat, search_lon, radius_miles, services, store_types, open_now, limit
+            )
+
+        # Step 2-6: 候选店铺 + 距离
+        candidates, distances = self._find_candidates(
+            search_lat, search_lon, radius_miles, services, store_types, open_now
+        )
+        return self._select_nearest(candidates, distances, limit), len(candidates)
+
+    def _nearest_from_shards(self, search_lat, search_lon, radius_miles, services, store_types, open_now, limit):
+        """
+        分片搜索: 搜索框相交的分片并发执行同一条预过滤SQL，
+        每个分片各自算距离取前limit个，再按距离k路归并
+        """
+        method = current_app.config.get('DISTANCE_METHOD', 'haversine')
+        services_mask, unmapped_services = required_mask(services)
+
+        with stage('shard_route'):
+            bbox = calculate_bounding_box(search_lat, search_lon, radius_miles)
+            keys = shard_router.shards_for_bbox(bbox)
+        if not keys:
+            return [], 0
+
+        # 语句在请求线程里构造一次，各分片线程只执行
+        statement = self._candidate_query(
+            search_lat, search_lon, radius_miles, services_mask, unmapped_services, store_types, open_now
+        ).statement
+        now = datetime.utcnow()
+
+        def search_shard(key, engine):
+            with engine.connect() as conn:
+                rows = conn.execute(statement).all()
+            candidates, distances = self._filter_candidates(
+                rows, search_lat, search_lon, radius_miles, method, open_now, now
+            )
+            nearest = [
+                ((key, candidates[i][0]), *candidates[i][1:], float(distances[i]))
+                for i in select_nearest(distances, limit)
+            ]
+            return len(rows), len(candidates), nearest
+
+        with stage('shard_fanout'):
+            results = shard_router.fan_out(search_shard, keys)
+        count_candidates(sum(fetched for fetched, _, _ in results.values()))
+
+        # Step 7-8: 每个分片的结果已按距离排好序，k路归并取前limit个
+        with stage('sort'):
+            merged = heapq.merge(*(nearest for _, _, nearest in results.values()), key=lambda entry: entry[4])
+            entries = list(itertools.islice(merged, limit))
+        return entries, sum(found for _, found, _ in results.values())
+
+    def _select_nearest(self, candidates, distances, limit):
+        # Step 7-8: 部分排序，只取距离最近的limit个（O(n + k log k)）
+        with stage('sort'):
+            nearest_idx = select_nearest(distances, limit)
+            return [(*candidates[i], float(distances[i])) for i in nearest_idx]
+
+    def _find_candidates(self, search_lat, search_lon, radius_miles, services, store_types, open_now, seen=None):
+        """
+        半径内满足所有过滤条件的店铺
+
+        只读取过滤需要的列（不构造ORM对象）
+        seen: nearest模式逐圈扩大时的复用状态（会被更新）
+            rows: 之前几轮读到的预过滤行 {Store.id: row}，不再重复查库
+            bbox_radius: 上一轮走SQL边界框时的半径，这一轮只查询该边界框之外的部分
+        返回: ([(Store.id, updated_at, lat, lon)], 对应的距离NumPy数组)，未排序
+        """
+        # 距离计算方式: haversine（向量化，默认）或 geodesic（精确）
+        method = current_app.config.get('DISTANCE_METHOD', 'haversine')
+
+        # 服务过滤用位图；id超过63的服务（或不存在的服务名）仍用EXISTS子查询
+        services_mask, unmapped_services = required_mask(services)
+
+        # Step 2-3: 内存空间索引完成Bounding Box + 半径 + 服务位图过滤；索引不可用时回退SQL
+        with stage('spatial_index'):
+            index_hits = spatial_index.query_radius(
+                search_lat, search_lon, radius_miles, store_types, method=method, services_mask=services_mask
+            )
+        if index_hits is not None and not index_hits:
+            return [], np.zeros(0, dtype=np.float64)
+
+        known = seen['rows'] if seen is not None else {}
+        if index_hits is not None:
+            fetch_hits = {pk: d for pk, d in index_hits.items() if pk not in known}
+            exclude_radius = None
+        else:
+            fetch_hits = None
+            exclude_radius = seen['bbox_radius'] if seen is not None else None
+
+        # Step 2-5 的SQL部分（边界框/服务/类型过滤都在这一条查询里）
+        rows = []
+        if fetch_hits is None or fetch_hits:
+            query = self._candidate_query(
+                search_lat, search_lon, radius_miles, services_mask, unmapped_services, store_types, open_now,
+                fetch_hits, exclude_radius
+            )
+            with stage('sql_prefilter'):
+                rows = query.all()
+            count_candidates(len(rows))
+
+        if seen is not None:
+            known.update((row.id, row) for row in rows)
+            seen['bbox_radius'] = radius_miles if index_hits is None else None
+            if index_hits is not None:
+                rows = [row for pk, row in known.items() if pk in index_hits]
+            else:
+                rows = list(known.values())
+
+        return self._filter_candidates(
+            rows, search_lat, search_lon, radius_miles, method, open_now, datetime.utcnow(), index_hits
+        )
+
+    def _candidate_query(self, search_lat, search_lon, radius_miles, services_mask, unmapped_services,
+                         store_types, open_now, index_hits=None, exclude_radius=None):
+        """
+        预过滤查询（只读过滤需要的列）；index_hits 为空间索引命中的 {Store.id: 距离}
+        exclude_radius: 跳过这个半径的边界框以内的店铺（nearest模式上一轮已读过）
+        """
+        # updated_at 是店铺JSON片段的版本戳
+        columns = [Store.id, Store.updated_at, Store.latitude, Store.longitude]
+        if open_now:
+            columns += [Store.hours_packed] + [getattr(Store, col) for col in DAY_COLUMNS]
+        query = db.session.query(*columns)
+
+        if index_hits is not None:
+            # 其他worker的写入可能还没同步到本进程索引，这里再确认一次状态
+            query = query.filter(Store.id.in_(list(index_hits)), Store.status == 'active')
+        else:
+            # Step 2: 计算边界框
+            min_lat, max_lat, min_lon, max_lon = calculate_bounding_box(search_lat, search_lon, radius_miles)
+
+            # Step 3: SQL预过滤（利用索引）
+            query = query.filter(
+                and_(
+                    Store.latitude.between(min_lat, max_lat),
+                    Store.longitude.between(min_lon, max_lon),
+                    Store.status == 'active'
+                )
+            )
+            if exclude_radius is not None:
+                inner = calculate_bounding_box(search_lat, search_lon, exclude_radius)
+                query = query.filter(or_(
+                    Store.latitude < inner[0], Store.latitude > inner[1],
+                    Store.longitude < inner[2], Store.longitude > inner[3]
+                ))
+
+        # Step 4: 服务过滤（AND逻辑）: 一次按位与（索引路径已在内存中过滤）
+        if services_mask and index_hits is None:
+            query = query.filter(Store.services_mask.op('&')(services_mask) == services_mask)
+        for service_name in unmapped_services:
+            query = query.filter(Store.services.any(Service.name == service_name))
+
+        # Step 5: 店铺类型过滤（OR逻辑，索引路径已在内存中过滤）
+        if store_types and index_hits is None:
+            query = query.filter(Store.store_type.in_(store_types))
+        return query
+
+    def _filter_candidates(self, rows, search_lat, search_lon, radius_miles, method, open_now, now,
+                           index_hits=None):
+        """
+        预过滤结果 -> 半径内（且营业中）的店铺
+        不访问数据库和app上下文，分片线程里也可以调用
+        返回: ([(Store.id, updated_at, lat, lon)], 对应的距离NumPy数组)，未排序
+        """
+        # Step 6: 精确距离计算并过滤（一次批量计算所有候选店铺）
+        with stage('distance'):
+            if index_hits is not None:
+                distances = np.array([index_hits[row.id] for row in rows], dtype=np.float64)
+            else:
+                distances = calculate_distances(
+                    (search_lat, search_lon),
+                    [row.latitude for row in rows],
+                    [row.longitude for row in rows],
+                    method=method
+                )
+            keep = distances <= radius_miles
+
+        if open_now:
+            # 预编译营业时间，一次向量化判断所有候选
+            with stage('open_now'):
+                packed = [row.hours_packed or pack_week([getattr(row, col) for col in DAY_COLUMNS]) for row in rows]
+                keep &= open_mask(packed, now)
+
+        candidates = [
+            (row.id, row.updated_at, float(row.latitude), float(row.longitude))
+            for row, ok in zip(rows, keep) if ok
+        ]
+        return candidates, distances[keep]
 
     def _get_coordinates(self, lat, lon, address, postal):
         """
@@ -120,31 +414,48 @@ class StoreSearchService:
 
         # 地址 geocoding
         if address:
-            coords = self._geocode_cached(address)
+            coords = geocode_cache.geocode(address, self._geocode_remote)
             if coords:
                 return coords
 
-        # 邮编 geocoding（加上国家防止解析失败）
+        # 邮编 geocoding（本地邮编质心库优先）
         if postal:
-            coords = self._geocode_cached(f"{postal}, USA")
+            coords = geocode_cache.geocode_postal(postal, self._geocode_remote)
             if coords:
                 return coords
 
         # 如果都失败，返回 None
         return None, None
 
-    @cache.memoize(timeout=30*24*60*60)  # 30天缓存
-    def _geocode_cached(self, address):
+    def geocode_many(self, queries, postal=False):
+        """批量地理编码，用于预热缓存（见 scripts/prewarm_geocode.py）"""
+        return geocode_cache.geocode_many(queries, self._geocode_remote, postal=postal)
+
+    def _geocode_remote(self, address):
         """
-        带缓存的地理编码
+        远程地理编码（不带缓存，缓存/去重由geocode_cache负责）
+        返回 (lat, lon)，找不到返回None，网络错误直接抛出
         """
-        try:
-            location = self.geocoder.geocode(address, timeout=10)
-            if location:
-                print(f"[Geocode] {address} -> {location.latitude}, {location.longitude}")
-                return location.latitude, location.longitude
-            else:
-                print(f"[Geocode failed] {address} returned None")
-        except Exception as e:
-            print(f"[Geocoding error] {address}: {e}")
-        return None, None
+        timeout = current_app.config.get('GEOCODE_TIMEOUT', 10)
+        location = self.geocoder.geocode(address, timeout=timeout)
+        if location:
+            return location.latitude, location.longitude
+        return None
+
+
+def init_search_service(app, geocoder=None):
+    """创建进程内共享的搜索服务，挂在 app.extensions 上"""
+    service = StoreSearchService(
+        user_agent=app.config.get('NOMINATIM_USER_AGENT'),
+        pool_size=app.config.get('GEOCODER_POOL_SIZE', 10),
+        geocoder=geocoder,
+        domain=app.config.get('NOMINATIM_DOMAIN'),
+        scheme=app.config.get('NOMINATIM_SCHEME')
+    )
+    app.extensions['store_search'] = service
+    return service
+
+
+def get_search_service():
+    """当前app的共享搜索服务"""
+    return current_app.extensions['store_search']
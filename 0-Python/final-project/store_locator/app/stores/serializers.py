@@ -0,0 +1,127 @@
+"""
+店铺批量序列化
+直接用Core select读取行元组（不经过ORM identity map），
+一批店铺固定两条SQL: 一条读店铺列，一条读 store_services JOIN services
+"""
+from datetime import datetime
+from sqlalchemy import select
+from store_locator.app.extensions import db
+from store_locator.app.stores.hours import DAY_COLUMNS, pack_week, is_open_at
+
+# 批量IN查询每批的主键数量，避免参数过多
+IN_CHUNK_SIZE = 900
+
+
+def build_store_dict(store, service_names, distance=None, is_open=False):
+    """
+    店铺响应结构（Store.to_dict 也使用这里）
+
+    store 可以是ORM对象，也可以是Core查询返回的Row（列名与属性名相同）
+    """
+    return {
+        'id': store.store_id,
+        'name': store.name,
+        'type': store.store_type,
+        'status': store.status,
+        'address': {
+            'street': store.address_street,
+            'city': store.address_city,
+            'state': store.address_state,
+            'postal_code': store.address_postal_code,
+            'country': store.address_country
+        },
+        'phone': store.phone,
+        'coordinates': {
+            'latitude': float(store.latitude),
+            'longitude': float(store.longitude)
+        },
+        'services': service_names,
+        'hours': {
+            'monday': store.hours_mon,
+            'tuesday': store.hours_tue,
+            'wednesday': store.hours_wed,
+            'thursday': store.hours_thu,
+            'friday': store.hours_fri,
+            'saturday': store.hours_sat,
+            'sunday': store.hours_sun
+        },
+        'distance_miles': round(distance, 2) if distance else None,
+        'is_open_now': is_open
+    }
+
+
+def _chunks(values, size=IN_CHUNK_SIZE):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def load_service_names(store_pks, execute=None):
+    """
+    {Store.id: [service_name, ...]}，一条JOIN查询
+    execute: 在其他连接上执行（例如分片库的 conn.execute），默认当前session
+    """
+    from store_locator.app.models import Service, store_services
+
+    execute = execute or db.session.execute
+    names = {}
+    for chunk in _chunks(list(store_pks)):
+        rows = execute(
+            select(store_services.c.store_id, Service.name)
+            .join(Service, Service.id == store_services.c.service_id)
+            .where(store_services.c.store_id.in_(chunk))
+            .order_by(store_services.c.store_id, Service.id)
+        )
+        for store_pk, name in rows:
+            names.setdefault(store_pk, []).append(name)
+    return names
+
+
+def serialize_stores(store_pks, distances=None, now=None):
+    """
+    按给定顺序批量序列化店铺
+
+    参数:
+        store_pks: [Store.id, ...]（结果保持这个顺序，不存在的主键被跳过）
+        distances: 与store_pks一一对应的距离（英里），可选
+        now: 计算is_open_now的时间，默认当前UTC
+    返回: [dict, ...]，结构与 Store.to_dict 相同
+    """
+    from store_locator.app.models import Store
+
+    store_pks = list(store_pks)
+    if not store_pks:
+        return []
+
+    table = Store.__table__
+    rows = {}
+    for chunk in _chunks(store_pks):
+        for row in db.session.execute(select(table).where(table.c.id.in_(chunk))):
+            rows[row.id] = row
+
+    ordered = [rows[pk] for pk in store_pks if pk in rows]
+    if distances is not None:
+        distances = [d for pk, d in zip(store_pks, distances) if pk in rows]
+    return serialize_rows(ordered, distances, now)
+
+
+def serialize_rows(rows, distances=None, now=None):
+    """
+    序列化已经查出来的店铺行（select(Store.__table__) 的结果），只再查一次服务
+
+    调用方自己决定怎么选店铺时使用（例如游标分页: 分页查询 + 服务查询共两条SQL）
+    """
+    if not rows:
+        return []
+
+    now = now or datetime.utcnow()
+    weekday, minute = now.weekday(), now.hour * 60 + now.minute
+
+    services = load_service_names([row.id for row in rows])
+
+    results = []
+    for i, row in enumerate(rows):
+        packed = row.hours_packed or pack_week([getattr(row, col) for col in DAY_COLUMNS])
+        is_open = row.status == 'active' and is_open_at(packed, weekday, minute)
+        distance = float(distances[i]) if distances is not None else None
+        results.append(build_store_dict(row, services.get(row.id, []), distance, is_open))
+    return results
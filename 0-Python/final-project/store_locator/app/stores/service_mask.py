@@ -0,0 +1,151 @@
+"""
+店铺服务位图（stores.services_mask）
+每个服务占一位: bit = Service.id - 1（最多63个服务，超出的服务没有位，回退到EXISTS子查询）
+"必须同时有 pharmacy、pickup、photo_printing" 变成一次按位与: (mask & required) == required
+
+服务名 -> id 缓存在进程内；不存在的服务名记住 MISSING_NAME_TTL 秒，期间不再为它重新加载服务表
+（这些名字照样走EXISTS过滤，结果不会错，只是慢一点）；店铺变更（可能带来新服务）时清空
+"""
+import threading
+import time
+from sqlalchemy import select, update, bindparam, inspect
+from sqlalchemy.orm.attributes import set_committed_value
+from store_locator.app.extensions import db
+from store_locator.app.stores.signals import stores_changed
+
+MAX_SERVICE_BITS = 63
+MISSING_NAME_TTL = 60
+MAX_MISSING_NAMES = 1000     # 请求里的服务名由客户端决定，不存在名单不能无限增长
+
+_lock = threading.Lock()
+_service_ids = {}
+_missing = {}       # 服务名 -> 到期时间（time.monotonic）
+
+
+def init_app(app):
+    stores_changed.connect(_on_stores_changed, sender=app)
+
+
+def _on_stores_changed(sender, **extra):
+    """写入可能新建了服务，下次遇到没见过的名字时重新加载"""
+    with _lock:
+        _missing.clear()
+
+
+def service_bit(service_id):
+    """Service.id -> 位值；没有位时返回0"""
+    if service_id and 1 <= service_id <= MAX_SERVICE_BITS:
+        return 1 << (service_id - 1)
+    return 0
+
+
+def mask_for_ids(service_ids):
+    mask = 0
+    for service_id in service_ids:
+        mask |= service_bit(service_id)
+    return mask
+
+
+def _unknown(names, now):
+    return [name for name in names if name not in _service_ids and _missing.get(name, 0) <= now]
+
+
+def _load_service_ids(names):
+    """
+    重新加载服务表，返回最新的 名字->id
+
+    加锁串行: 并发请求遇到同一个新名字时只查一次，后面的线程拿到锁后发现已经加载过就直接返回；
+    整个字典替换而不是原地clear/update，读的线程不会看到加载到一半的状态
+    """
+    global _service_ids
+    from store_locator.app.models import Service
+
+    with _lock:
+        now = time.monotonic()
+        if not _unknown(names, now):
+            return _service_ids
+        _service_ids = dict(db.session.execute(select(Service.name, Service.id)).all())
+        if len(_missing) > MAX_MISSING_NAMES:
+            _missing.clear()
+        for name in names:
+            if name not in _service_ids:
+                _missing[name] = now + MISSING_NAME_TTL
+        return _service_ids
+
+
+def required_mask(service_names):
+    """
+    服务名列表 -> (required_mask, 无法用位表示的服务名)
+
+    不存在的服务名也放进第二个返回值，由调用方用EXISTS过滤（结果为空）
+    """
+    if not service_names:
+        return 0, []
+
+    # 服务表很小，按名字缓存id；遇到没见过（且不在不存在名单里）的名字时重新加载一次
+    service_ids = _service_ids
+    if _unknown(service_names, time.monotonic()):
+        service_ids = _load_service_ids(service_names)
+
+    mask = 0
+    leftover = []
+    for name in service_names:
+        bit = service_bit(service_ids.get(name))
+        if bit:
+            mask |= bit
+        else:
+            leftover.append(name)
+    return mask, leftover
+
+
+def sync_services_mask(session, flush_context):
+    """
+    after_flush钩子: services关系有变化的店铺重新计算位图
+
+    放在flush之后是因为新建的Service这时才有id；
+    一次flush内的所有店铺合成一条executemany UPDATE
+    """
+    from store_locator.app.models import Store
+
+    updates = []
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Store):
+            continue
+        if not inspect(obj).attrs.services.history.has_changes():
+            continue
+        mask = mask_for_ids(s.id for s in obj.services)
+        updates.append({'pk': obj.id, 'mask': mask})
+        set_committed_value(obj, 'services_mask', mask)
+
+    if updates:
+        table = Store.__table__
+        session.connection().execute(
+            update(table).where(table.c.id == bindparam('pk')).values(services_mask=bindparam('mask')),
+            updates
+        )
+
+
+def rebuild_services_masks(batch_size=1000):
+    """
+    按 store_services 全量重算所有店铺的位图（修复/回填用）
+    返回: 更新的店铺数量
+    """
+    from store_locator.app.models import Store, store_services
+
+    links = {}
+    for store_pk, service_id in db.session.execute(
+        select(store_services.c.store_id, store_services.c.service_id)
+    ):
+        links[store_pk] = links.get(store_pk, 0) | service_bit(service_id)
+
+    table = Store.__table__
+    rows = [
+        {'pk': pk, 'mask': links.get(pk, 0)}
+        for pk, current in db.session.execute(select(table.c.id, table.c.services_mask))
+        if current != links.get(pk, 0)
+    ]
+    stmt = update(table).where(table.c.id == bindparam('pk')).values(services_mask=bindparam('mask'))
+    for i in range(0, len(rows), batch_size):
+        db.session.execute(stmt, rows[i:i + batch_size])
+    db.session.commit()
+    return len(rows)
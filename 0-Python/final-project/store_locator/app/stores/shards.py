@@ -0,0 +1,346 @@
+"""
+按地区分片的店铺库
+每个分片是 SQLALCHEMY_BINDS 里的一个bind（表结构与主库相同: stores / services / store_services）
+
+STORE_SHARDS 定义每个分片包含哪些店铺（写入/拆分时用）:
+    {"us_east": {"states": ["NY", "MA"]},
+     "eu":      {"countries": ["DE", "FR"]},
+     "apac":    {"geohash": ["w", "x"]}}
+匹配顺序: geohash前缀（最长优先） > 州 > 国家 > STORE_DEFAULT_SHARD
+（STORE_DEFAULT_SHARD 也要在 STORE_SHARDS 里，规则可以为空: "rest": {}）
+
+搜索按地理范围路由: 每个分片的覆盖范围（extents）由该分片库里各州/国家店铺的
+经纬度边界框汇总而来（每个分片一条GROUP BY），定期刷新；
+搜索框与哪些分片的范围相交就并发查询哪些分片，结果按距离k路归并（见 search.py）
+
+写入仍然只写主库（主库是完整数据）；stores_changed 之后把这些店铺的当前状态复制到所属分片
+（先从所有分片删除，换了分片的店铺也能处理），再让新旧位置的搜索缓存失效。
+复制进来的有效店铺如果落在分片当前范围之外（新地区、整片都是下线店铺的地区），
+本进程直接把这个点加进范围，并更新共享缓存里的范围版本，其他worker下次检查时重新汇总
+重新拆分（scripts/split_store_shards.py）后更新共享缓存里的布局版本，
+各worker发现版本变化时重新汇总范围并清空本进程的店铺片段
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select, insert, delete, func
+from store_locator.app.extensions import db, cache
+from store_locator.app.stores.serializers import _chunks
+from store_locator.app.stores.signals import stores_changed
+
+LAYOUT_KEY = 'store-shards:layout'
+EXTENTS_KEY = 'store-shards:extents'
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash_encode(lat, lon, precision=6):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, coord = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if coord >= mid:
+            value = value * 2 + 1
+            rng[0] = mid
+        else:
+            value *= 2
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def geohash_bbox(prefix):
+    """geohash前缀 -> (min_lat, max_lat, min_lon, max_lon)"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in prefix:
+        value = _BASE32.index(char)
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if value >> shift & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+
+def _overlaps(a, b):
+    return a[0] <= b[1] and b[0] <= a[1] and a[2] <= b[3] and b[2] <= a[3]
+
+
+class ShardRouter:
+
+    def __init__(self):
+        self.enabled = False
+        self.shards = {}
+        self.default_shard = None
+        self.extent_ttl = 300
+        self._extents = {}
+        self._extents_at = None
+        self.layout_check_interval = 5.0
+        self._layout = None
+        self._extents_version = None
+        self._layout_checked_at = None
+        self._lock = threading.Lock()
+        self._executor = None
+        self.synced_stores = 0
+        self.sync_failures = 0
+
+    def init_app(self, app):
+        self.shards = app.config.get('STORE_SHARDS') or {}
+        self.default_shard = app.config.get('STORE_DEFAULT_SHARD')
+        self.extent_ttl = app.config.get('STORE_SHARD_EXTENT_TTL', 300)
+        self.layout_check_interval = app.config.get('STORE_SHARD_LAYOUT_CHECK_INTERVAL', self.layout_check_interval)
+        self.enabled = bool(self.shards)
+        self._extents = {}
+        self._extents_at = None
+        self._layout = None
+        self._extents_version = None
+        self._layout_checked_at = None
+
+        binds = app.config.get('SQLALCHEMY_BINDS') or {}
+        missing = [key for key in self.shards if key not in binds]
+        if missing:
+            raise ValueError(f"STORE_SHARDS without SQLALCHEMY_BINDS entry: {', '.join(missing)}")
+        if self.default_shard and self.default_shard not in self.shards:
+            raise ValueError(f"STORE_DEFAULT_SHARD {self.default_shard} is not in STORE_SHARDS")
+        if self.enabled:
+            self._executor = ThreadPoolExecutor(
+                max_workers=app.config.get('STORE_SHARD_WORKERS', 8), thread_name_prefix='store-shard'
+            )
+            stores_changed.connect(self._on_stores_changed, sender=app)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'shards': len(self.shards),
+            'synced_stores': self.synced_stores,
+            'sync_failures': self.sync_failures
+        }
+
+    # ------------------------------------------------------------
+    # 写入路由
+    # ------------------------------------------------------------
+
+    def shard_for_store(self, state=None, country=None, lat=None, lon=None):
+        """一家店铺属于哪个分片，没有匹配返回 STORE_DEFAULT_SHARD"""
+        if lat is not None and lon is not None:
+            code = geohash_encode(float(lat), float(lon), 8)
+            best, best_len = None, 0
+            for key, rule in self.shards.items():
+                for prefix in rule.get('geohash', []):
+                    if len(prefix) > best_len and code.startswith(prefix):
+                        best, best_len = key, len(prefix)
+            if best:
+                return best
+        for field, value in (('states', state), ('countries', country)):
+            if value:
+                for key, rule in self.shards.items():
+                    if value.upper() in (v.upper() for v in rule.get(field, [])):
+                        return key
+        return self.default_shard
+
+    def sync_stores(self, store_pks):
+        """
+        把主库里这些店铺（含服务关系）复制到所属分片，其他分片里的旧行删除；主库已删除的店铺只删除
+        返回: 分片里旧行的位置 [(lat, lon)]（换了位置/分片的店铺，旧位置的搜索缓存也要失效）
+        """
+        from store_locator.app.models import Store, Service, store_services
+
+        store_table, service_table = Store.__table__, Service.__table__
+        previous = []
+        added = {}
+        for chunk in _chunks(list(store_pks)):
+            rows = db.session.execute(select(store_table).where(store_table.c.id.in_(chunk))).all()
+            links = [dict(link._mapping) for link in db.session.execute(
+                select(store_services).where(store_services.c.store_id.in_(chunk))
+            )]
+
+            by_shard = {}
+            for row in rows:
+                key = self.shard_for_store(row.address_state, row.address_country, row.latitude, row.longitude)
+                if key is not None:
+                    by_shard.setdefault(key, []).append(dict(row._mapping))
+                    if row.status == 'active':
+                        added.setdefault(key, []).append((float(row.latitude), float(row.longitude)))
+
+            for key in self.shards:
+                stores = by_shard.get(key, [])
+                pks = {store['id'] for store in stores}
+                shard_links = [link for link in links if link['store_id'] in pks]
+                with self.engine(key).begin() as conn:
+                    previous += conn.execute(
+                        select(store_table.c.latitude, store_table.c.longitude).where(store_table.c.id.in_(chunk))
+                    ).all()
+                    conn.execute(delete(store_services).where(store_services.c.store_id.in_(chunk)))
+                    conn.execute(delete(store_table).where(store_table.c.id.in_(chunk)))
+                    if not stores:
+                        continue
+                    # 拆分之后新增的服务（services_mask 依赖id一致）
+                    service_ids = {link['service_id'] for link in shard_links}
+                    if service_ids:
+                        known = set(conn.execute(
+                            select(service_table.c.id).where(service_table.c.id.in_(service_ids))
+                        ).scalars())
+                        missing = [dict(row._mapping) for row in db.session.execute(
+                            select(service_table).where(service_table.c.id.in_(service_ids - known))
+                        )] if service_ids - known else []
+                        if missing:
+                            conn.execute(insert(service_table), missing)
+                    conn.execute(insert(store_table), stores)
+                    if shard_links:
+                        conn.execute(insert(store_services), shard_links)
+        self._extend_extents(added)
+        self._count('synced_stores', len(store_pks))
+        return [(float(lat), float(lon)) for lat, lon in previous]
+
+    def _extend_extents(self, points):
+        """
+        复制进分片的有效店铺 {分片: [(lat, lon)]}: 不在该分片现有范围内的点直接加成一个点范围，
+        不用等 STORE_SHARD_EXTENT_TTL；并通知其他worker重新汇总
+        """
+        outside = False
+        with self._lock:
+            extents = dict(self._extents)
+            for key, shard_points in points.items():
+                boxes = list(extents.get(key, []))
+                for lat, lon in shard_points:
+                    if not any(_overlaps((lat, lat, lon, lon), box) for box in boxes):
+                        boxes.append((lat, lat, lon, lon))
+                        outside = True
+                extents[key] = boxes
+            if not outside:
+                return
+            if self._extents_at is not None:
+                self._extents = extents
+
+        version = uuid.uuid4().hex[:12]
+        self._extents_version = version
+        try:
+            cache.set(EXTENTS_KEY, version, timeout=0)
+        except Exception as e:
+            print(f"[Shards] extents version update failed: {e}")
+
+    def _on_stores_changed(self, sender, store_ids=None, **extra):
+        if not store_ids:
+            return
+        from store_locator.app.stores.result_cache import search_result_cache
+
+        try:
+            previous = self.sync_stores(store_ids)
+        except Exception as e:
+            db.session.rollback()
+            self._count('sync_failures')
+            print(f"[Shards] sync failed for {len(store_ids)} stores: {e}")
+            return
+        # 结果缓存自己的订阅者可能在复制之前就换了版本号，复制完成后新旧位置再失效一次
+        search_result_cache.invalidate_stores(store_ids, previous)
+
+    # ------------------------------------------------------------
+    # 布局版本（重新拆分）
+    # ------------------------------------------------------------
+
+    def mark_layout_changed(self):
+        """重新拆分后调用: 各worker重新汇总范围、清空店铺片段；搜索结果缓存整体失效"""
+        from store_locator.app.stores.result_cache import search_result_cache
+
+        cache.set(LAYOUT_KEY, uuid.uuid4().hex[:12], timeout=0)
+        search_result_cache.invalidate_all()
+
+    def check_layout(self):
+        """
+        每 STORE_SHARD_LAYOUT_CHECK_INTERVAL 秒读一次布局版本和范围版本:
+        布局变化时丢弃本进程的范围和片段，范围变化（其他worker写入了范围外的店铺）时只重新汇总范围
+        """
+        from store_locator.app.stores.fragments import store_fragments
+
+        now = time.monotonic()
+        if self._layout_checked_at is not None and now - self._layout_checked_at < self.layout_check_interval:
+            return
+        self._layout_checked_at = now
+        try:
+            layout, extents_version = cache.get_many(LAYOUT_KEY, EXTENTS_KEY)
+        except Exception as e:
+            print(f"[Shards] layout check failed: {e}")
+            return
+        if extents_version != self._extents_version:
+            self._extents_at = None
+            self._extents_version = extents_version
+        if layout == self._layout:
+            return
+        if self._layout is not None:
+            print("[Shards] shard layout changed, refreshing extents")
+            self._extents_at = None
+            store_fragments.clear()
+        self._layout = layout
+
+    # ------------------------------------------------------------
+    # 搜索路由
+    # ------------------------------------------------------------
+
+    def engine(self, key):
+        return db.engines[key]
+
+    def shards_for_bbox(self, bbox):
+        """与搜索框相交的分片（需要app context，范围过期或布局变化时重新汇总）"""
+        self.check_layout()
+        extents = self._get_extents()
+        return [key for key, boxes in extents.items() if any(_overlaps(bbox, box) for box in boxes)]
+
+    def _get_extents(self):
+        now = time.monotonic()
+        if self._extents_at is None or now - self._extents_at > self.extent_ttl:
+            self.refresh_extents()
+        return self._extents
+
+    def refresh_extents(self):
+        """每个分片一条GROUP BY: 各州/国家店铺的经纬度边界框，再加上配置里的geohash前缀"""
+        from store_locator.app.models import Store
+
+        table = Store.__table__
+        stmt = select(
+            func.min(table.c.latitude), func.max(table.c.latitude),
+            func.min(table.c.longitude), func.max(table.c.longitude)
+        ).where(table.c.status == 'active').group_by(table.c.address_country, table.c.address_state)
+
+        extents = {}
+        for key, rule in self.shards.items():
+            boxes = [geohash_bbox(prefix) for prefix in rule.get('geohash', [])]
+            try:
+                with self.engine(key).connect() as conn:
+                    boxes += [tuple(float(v) for v in row) for row in conn.execute(stmt) if row[0] is not None]
+            except Exception as e:
+                print(f"[Shards] extent refresh failed for {key}: {e}")
+                boxes = self._extents.get(key, boxes)
+            extents[key] = boxes
+
+        with self._lock:
+            self._extents = extents
+            self._extents_at = time.monotonic()
+
+    def fan_out(self, fn, keys):
+        """
+        并发在多个分片上执行 fn(key, engine)
+        返回: {key: 结果}；单个分片失败时抛出异常（不返回不完整的结果）
+        """
+        engines = {key: self.engine(key) for key in keys}
+        if len(keys) == 1:
+            key = keys[0]
+            return {key: fn(key, engines[key])}
+        futures = {key: self._executor.submit(fn, key, engines[key]) for key in keys}
+        return {key: future.result() for key, future in futures.items()}
+
+
+shard_router = ShardRouter()
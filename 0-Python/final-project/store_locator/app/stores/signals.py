@@ -0,0 +1,10 @@
+"""
+店铺数据变更信号
+写操作（admin路由、CSV导入）提交后发送，进程内的索引/缓存订阅后自行刷新
+"""
+from blinker import Namespace
+
+_signals = Namespace()
+
+# 参数: sender=app, store_ids=[Store.id, ...]（主键，不是业务store_id）
+stores_changed = _signals.signal('stores-changed')
@@ -0,0 +1,218 @@
+"""
+进程内空间索引
+对所有active店铺按经纬度划分网格（grid），在内存中完成Bounding Box和半径过滤，
+搜索时不再访问数据库做预过滤；索引未启用或已过期时返回None，由调用方回退到SQL
+"""
+import math
+import threading
+import time
+import numpy as np
+from store_locator.app.extensions import db
+from store_locator.app.stores.signals import stores_changed
+from store_locator.app.stores.utils import calculate_bounding_box, calculate_distances
+
+# 单次变更超过这个数量时直接全量重建，比逐条更新更快
+INCREMENTAL_UPDATE_LIMIT = 1000
+
+
+class StoreSpatialIndex:
+    """
+    网格空间索引
+    - cells:   (lat_cell, lon_cell) -> {Store.id, ...}
+    - records: Store.id -> (latitude, longitude, store_type, services_mask)
+
+    只收录status='active'的店铺；写操作通过stores_changed信号增量同步，
+    超过max_age秒后视为过期（其他worker进程的写入看不到），下次搜索回退SQL并在后台重建
+    """
+
+    def __init__(self, cell_degrees=0.5):
+        self.enabled = False
+        self.max_age = 300
+        self.cell_degrees = cell_degrees
+        self._app = None
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        self._cells = {}
+        self._records = {}
+        self._built_at = None
+
+    def init_app(self, app):
+        """读取配置，订阅店铺变更信号，并在启动时构建索引"""
+        self.enabled = app.config.get('SPATIAL_INDEX_ENABLED', True)
+        self.max_age = app.config.get('SPATIAL_INDEX_MAX_AGE', 300)
+        self.cell_degrees = app.config.get('SPATIAL_INDEX_CELL_DEGREES', 0.5)
+        self._app = app
+        # 丢掉之前的app（另一个数据库）建的索引，下面重建失败时也不会用到它
+        with self._lock:
+            self._cells = {}
+            self._records = {}
+            self._built_at = None
+
+        if not self.enabled:
+            return
+
+        stores_changed.connect(self._on_stores_changed, sender=app)
+
+        # 启动时构建；表还不存在（如init_db）时失败也没关系，搜索会先走SQL
+        with app.app_context():
+            try:
+                self.rebuild()
+            except Exception as e:
+                db.session.rollback()
+                print(f"[SpatialIndex] initial build failed, using SQL: {e}")
+
+    # ------------------------------------------------------------
+    # 构建与同步
+    # ------------------------------------------------------------
+
+    def rebuild(self):
+        """从数据库全量重建索引（需要app context）"""
+        from store_locator.app.models import Store
+
+        rows = db.session.query(
+            Store.id, Store.latitude, Store.longitude, Store.store_type, Store.services_mask
+        ).filter(Store.status == 'active').all()
+
+        cells = {}
+        records = {}
+        for pk, lat, lon, store_type, services_mask in rows:
+            lat, lon = float(lat), float(lon)
+            records[pk] = (lat, lon, store_type, services_mask or 0)
+            cells.setdefault(self._cell(lat, lon), set()).add(pk)
+
+        with self._lock:
+            self._cells = cells
+            self._records = records
+            self._built_at = time.monotonic()
+
+        print(f"[SpatialIndex] built with {len(records)} active stores")
+
+    def _on_stores_changed(self, sender, store_ids=None, **extra):
+        """店铺变更后增量同步：重新读取这些店铺，删除旧位置后按当前状态重新插入"""
+        if not store_ids:
+            return
+
+        if len(store_ids) > INCREMENTAL_UPDATE_LIMIT:
+            try:
+                self.rebuild()
+            except Exception as e:
+                self.mark_stale()
+                print(f"[SpatialIndex] rebuild failed: {e}")
+            return
+
+        from store_locator.app.models import Store
+
+        try:
+            rows = db.session.query(
+                Store.id, Store.latitude, Store.longitude, Store.store_type, Store.services_mask, Store.status
+            ).filter(Store.id.in_(store_ids)).all()
+        except Exception as e:
+            self.mark_stale()
+            print(f"[SpatialIndex] sync failed, marked stale: {e}")
+            return
+
+        with self._lock:
+            for pk in store_ids:
+                self._remove(pk)
+            for pk, lat, lon, store_type, services_mask, status in rows:
+                if status == 'active':
+                    lat, lon = float(lat), float(lon)
+                    self._records[pk] = (lat, lon, store_type, services_mask or 0)
+                    self._cells.setdefault(self._cell(lat, lon), set()).add(pk)
+
+    def _remove(self, pk):
+        record = self._records.pop(pk, None)
+        if record is None:
+            return
+        key = self._cell(record[0], record[1])
+        bucket = self._cells.get(key)
+        if bucket is not None:
+            bucket.discard(pk)
+            if not bucket:
+                del self._cells[key]
+
+    def mark_stale(self):
+        """标记为过期，下次搜索回退SQL并触发后台重建"""
+        with self._lock:
+            self._built_at = None
+
+    def is_fresh(self):
+        if not self.enabled or self._built_at is None:
+            return False
+        if not self.max_age:
+            return True
+        return time.monotonic() - self._built_at < self.max_age
+
+    def _schedule_rebuild(self):
+        with self._lock:
+            if self._rebuilding or self._app is None:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild_in_background, daemon=True).start()
+
+    def _rebuild_in_background(self):
+        try:
+            with self._app.app_context():
+                self.rebuild()
+        except Exception as e:
+            print(f"[SpatialIndex] background rebuild failed: {e}")
+        finally:
+            self._rebuilding = False
+
+    # ------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees))
+
+    def query_bbox(self, min_lat, max_lat, min_lon, max_lon, store_types=None):
+        """
+        返回边界框内的 [(Store.id, lat, lon, services_mask), ...]
+        """
+        lat_lo, lon_lo = self._cell(min_lat, min_lon)
+        lat_hi, lon_hi = self._cell(max_lat, max_lon)
+        # 高纬度大半径时经度范围可能非常宽，最多扫描一整圈
+        lon_hi = min(lon_hi, lon_lo + math.ceil(360 / self.cell_degrees))
+
+        results = []
+        with self._lock:
+            for i in range(lat_lo, lat_hi + 1):
+                for j in range(lon_lo, lon_hi + 1):
+                    for pk in self._cells.get((i, j), ()):
+                        lat, lon, store_type, services_mask = self._records[pk]
+                        if store_types and store_type not in store_types:
+                            continue
+                        if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                            results.append((pk, lat, lon, services_mask))
+        return results
+
+    def query_radius(self, lat, lon, radius_miles, store_types=None, method='haversine', services_mask=0):
+        """
+        在内存中完成Bounding Box + 精确距离过滤（批量向量化计算距离）
+        services_mask: 必须具备的服务位图，整批候选一次按位与过滤
+
+        返回: {Store.id: distance_miles}；索引不可用时返回None（调用方回退SQL）
+        """
+        if not self.is_fresh():
+            if self.enabled:
+                self._schedule_rebuild()
+            return None
+
+        min_lat, max_lat, min_lon, max_lon = calculate_bounding_box(lat, lon, radius_miles)
+        candidates = self.query_bbox(min_lat, max_lat, min_lon, max_lon, store_types)
+        if not candidates:
+            return {}
+
+        pks, lats, lons, masks = zip(*candidates)
+        distances = calculate_distances((lat, lon), lats, lons, method=method)
+        keep = distances <= radius_miles
+        if services_mask:
+            keep &= (np.array(masks, dtype=np.int64) & services_mask) == services_mask
+        return {pk: float(d) for pk, d, ok in zip(pks, distances, keep) if ok}
+
+    def __len__(self):
+        return len(self._records)
+
+
+spatial_index = StoreSpatialIndex()
@@ -3,8 +3,12 @@
 包含距离计算、边界框计算等
 """
 import math
+import numpy as np
 from geopy.distance import geodesic
 
+# 地球平均半径（英里），Haversine使用
+EARTH_RADIUS_MILES = 3958.7613
+
 def calculate_bounding_box(lat, lon, radius_miles):
     """
     计算搜索范围的边界框
@@ -37,6 +41,57 @@ def calculate_distance(point1, point2):
     """
     return geodesic(point1, point2).miles
 
+def calculate_distances(origin, latitudes, longitudes, method='haversine'):
+    """
+    批量计算一个中心点到多个店铺的距离（英里）
+    
+    参数:
+        origin: (latitude, longitude)
+        latitudes / longitudes: 店铺坐标数组（list / NumPy数组，长度相同）
+        method:
+            - 'haversine': 球面公式，NumPy一次向量化计算（快速模式）
+            - 'geodesic':  WGS-84椭球精确距离，逐点调用geopy（精确模式）
+    
+    返回: NumPy float64数组，与输入顺序一致
+    """
+    lats = np.asarray(latitudes, dtype=np.float64)
+    lons = np.asarray(longitudes, dtype=np.float64)
+    
+    if method == 'geodesic':
+        return np.fromiter(
+            (geodesic(origin, (lat, lon)).miles for lat, lon in zip(lats, lons)),
+            dtype=np.float64,
+            count=len(lats)
+        )
+    if method != 'haversine':
+        raise ValueError(f'Unknown distance method: {method}')
+    
+    lat1 = math.radians(origin[0])
+    lon1 = math.radians(origin[1])
+    lat2 = np.radians(lats)
+    lon2 = np.radians(lons)
+    
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def select_nearest(distances, k):
+    """
+    从距离数组中选出最近的k个，返回它们的下标（按距离升序）
+    
+    使用np.argpartition做部分排序: 复杂度 O(n + k log k)，
+    而不是对所有候选做 O(n log n) 全排序
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    n = len(distances)
+    if k <= 0 or n == 0:
+        return np.array([], dtype=np.intp)
+    
+    if k < n:
+        idx = np.argpartition(distances, k - 1)[:k]
+    else:
+        idx = np.arange(n)
+    return idx[np.argsort(distances[idx], kind='stable')]
+
 def validate_coordinates(lat, lon):
     """验证经纬度合法性"""
     return -90 <= lat <= 90 and -180 <= lon <= 180
@@ -46,24 +101,11 @@ def validate_hours_format(hours):
     验证营业时间格式
     
     有效格式:
-    - "08:00-22:00"
+    - "08:00-22:00"（开门早于关门，关门可以是 24:00）
     - "closed"
     """
-    if not hours:
+    from store_locator.app.stores.hours import parse_hours
+
+    if not hours or not isinstance(hours, str):
         return False
-    
-    hours = hours.lower().strip()
-    if hours == 'closed':
-        return True
-    
-    try:
-        if '-' not in hours:
-            return False
-        parts = hours.split('-')
-        for t in parts:
-            h, m = map(int, t.strip().split(':'))
-            if not (0 <= h <= 23 and 0 <= m <= 59):
-                return False
-        return True
-    except:
-        return False
\ No newline at end of file
+    return hours.strip().lower() == 'closed' or parse_hours(hours) is not None
\ No newline at end of file
@@ -0,0 +1,232 @@
+"""
+CSV导入数据校验（按列向量化）
+每个检查对整列生成一个bool掩码，最后把出错的行汇总成 failed_rows 报告，
+不逐行循环、不访问数据库
+
+大文件（行数 >= parallel_rows）按行切成几段，用进程池并行校验后合并报告；
+流式导入把每块整块交给进程池，最多 workers 块同时校验（validation_pool.validate_chunks）
+
+进程池每个进程只创建一次（第一次用到时），子进程用spawn启动（IMPORT_VALIDATION_START_METHOD）:
+导入在多线程的web进程里执行，fork会把其他线程持有的锁、数据库连接一起复制到子进程
+"""
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+import numpy as np
+import pandas as pd
+from store_locator.app.stores.hours import DAY_COLUMNS, HOURS_PATTERN
+
+REQUIRED_COLUMNS = [
+    'store_id', 'name', 'store_type', 'status', 'latitude', 'longitude',
+    'address_street', 'address_city', 'address_state', 'address_postal_code',
+    'phone', 'services'
+]
+
+# 不允许为空的列
+NOT_NULL_COLUMNS = [
+    'store_id', 'name', 'store_type', 'status', 'latitude', 'longitude',
+    'address_street', 'address_city', 'address_state', 'address_postal_code'
+]
+
+# 读CSV时按字符串读取的列（邮编/电话的前导0不能丢）
+STRING_COLUMNS = {'store_id': str, 'address_postal_code': str, 'phone': str}
+
+STORE_TYPES = ['flagship', 'regular', 'outlet', 'express']
+STORE_STATUSES = ['active', 'inactive', 'temporarily_closed']
+
+POSTAL_CODE_PATTERN = r'^\d{5}(-\d{4})?$'
+STATE_PATTERN = r'^[A-Za-z]{2}$'
+PHONE_PATTERN = r'^\d{3}-\d{3}-\d{4}$'
+
+
+def missing_columns(df):
+    """缺失的必需列（保持REQUIRED_COLUMNS顺序）"""
+    return [col for col in REQUIRED_COLUMNS if col not in df.columns]
+
+
+class ValidationPool:
+
+    def __init__(self):
+        self.workers = 1
+        self.parallel_rows = 50000
+        self.start_method = 'spawn'
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.shutdown()
+        self.workers = app.config.get('IMPORT_VALIDATION_WORKERS', self.workers)
+        self.parallel_rows = app.config.get('IMPORT_VALIDATION_PARALLEL_ROWS', self.parallel_rows)
+        self.start_method = app.config.get('IMPORT_VALIDATION_START_METHOD', self.start_method)
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context(self.start_method))
+            return self._pool
+
+    def _discard(self, pool, error):
+        """子进程异常退出后池不能再用，下次重新创建"""
+        with self._lock:
+            if self._pool is not pool:
+                return
+            self._pool = None
+        pool.shutdown(wait=False)
+        print(f"[Import] validation pool broken, validating in-process: {error}")
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def validate(self, df):
+        """
+        校验一批CSV行（df的index为从0开始的行号，分块读取时连续）
+        行数 >= parallel_rows 且 workers > 1 时切成workers段并行校验
+        返回: failed_rows [{'row': CSV行号, 'store_id': ..., 'error': '...; ...'}, ...]（按行号排序）
+        """
+        if self.workers <= 1 or len(df) < self.parallel_rows:
+            return _validate_part(df)
+
+        parts = [df.iloc[idx] for idx in np.array_split(np.arange(len(df)), self.workers)]
+        pool = self._get_pool()
+        try:
+            reports = list(pool.map(_validate_part, parts))
+        except BrokenProcessPool as e:
+            self._discard(pool, e)
+            return _validate_part(df)
+        return [failure for report in reports for failure in report]
+
+    def validate_chunks(self, chunks):
+        """
+        流式校验: 按原顺序逐块产出 (df, failed_rows)
+        workers > 1 时后面最多 workers 块已经在子进程里校验，调用方写入当前块时不用等
+        """
+        if self.workers <= 1:
+            for df in chunks:
+                yield df, _validate_part(df)
+            return
+
+        pool = self._get_pool()
+        pending = deque()
+        for df in chunks:
+            pending.append((df, self._submit(pool, df)))
+            if len(pending) >= self.workers:
+                yield self._chunk_result(pool, *pending.popleft())
+        while pending:
+            yield self._chunk_result(pool, *pending.popleft())
+
+    def _submit(self, pool, df):
+        try:
+            return pool.submit(_validate_part, df)
+        except BrokenProcessPool as e:
+            self._discard(pool, e)
+            return None
+
+    def _chunk_result(self, pool, df, future):
+        """子进程的结果；池已损坏时在本进程校验这一块"""
+        if future is not None:
+            try:
+                return df, future.result()
+            except BrokenProcessPool as e:
+                self._discard(pool, e)
+        return df, _validate_part(df)
+
+validation_pool = ValidationPool()
+
+
+def validate_store_frame(df):
+    """校验一批CSV行（见 ValidationPool.validate）"""
+    return validation_pool.validate(df)
+
+
+def _valid_values(series, check):
+    """
+    只对去重后的值做字符串/正则检查，再用isin映射回整列
+    （营业时间、州、邮编这些列重复值很多，比逐行正则快一个数量级）
+    """
+    uniques = pd.Series(series.unique())
+    return series.isin(uniques[check(uniques).to_numpy()])
+
+
+def _valid_hours(values):
+    """HH:MM-HH:MM（开门早于关门，关门可以是24:00）或 closed，与 hours.parse_hours 规则相同"""
+    values = values.str.strip().str.lower()
+    parts = values.str.extract(HOURS_PATTERN.pattern).astype(float)
+    oh, om, ch, cm = parts[0], parts[1], parts[2], parts[3]
+    valid_times = (
+        (oh <= 23) & (om <= 59)
+        & (((ch <= 23) & (cm <= 59)) | ((ch == 24) & (cm == 0)))
+        & (oh * 60 + om < ch * 60 + cm)
+    )
+    return (values == 'closed') | valid_times
+
+
+def _validate_part(df):
+    """单进程向量化校验（进程池里执行的也是这个函数）"""
+    errors = pd.Series('', index=df.index, dtype=object)
+
+    def flag(mask, message):
+        nonlocal errors
+        if mask.any():
+            errors = errors.mask(mask, errors + message + '; ')
+
+    texts = {}
+
+    def text(col):
+        # 按去重后的值strip，再按codes取回（大部分列重复值很多）
+        if col not in texts:
+            codes, uniques = pd.factorize(df[col], use_na_sentinel=False)
+            stripped = pd.Series(uniques).astype(str).str.strip().to_numpy()
+            texts[col] = pd.Series(stripped[codes], index=df.index)
+        return texts[col]
+
+    # 必填字段
+    present = {}
+    for col in NOT_NULL_COLUMNS:
+        present[col] = df[col].notna() & (text(col) != '')
+        flag(~present[col], f'{col} is required')
+
+    # 枚举
+    flag(present['store_type'] & ~text('store_type').isin(STORE_TYPES),
+         f"store_type must be one of {', '.join(STORE_TYPES)}")
+    flag(present['status'] & ~text('status').isin(STORE_STATUSES),
+         f"status must be one of {', '.join(STORE_STATUSES)}")
+
+    # 经纬度: 必须是数字且在合法范围内（validate_coordinates 的向量化版本）
+    lat = pd.to_numeric(df['latitude'], errors='coerce')
+    lon = pd.to_numeric(df['longitude'], errors='coerce')
+    flag(present['latitude'] & lat.isna(), 'latitude must be a number')
+    flag(present['longitude'] & lon.isna(), 'longitude must be a number')
+    flag(lat.notna() & ~lat.between(-90, 90), 'latitude out of range')
+    flag(lon.notna() & ~lon.between(-180, 180), 'longitude out of range')
+
+    # 地址 / 电话格式（电话可以为空）
+    flag(present['address_state'] & ~_valid_values(text('address_state'), lambda v: v.str.match(STATE_PATTERN)),
+         'address_state must be a two-letter code')
+    flag(present['address_postal_code']
+         & ~_valid_values(text('address_postal_code'), lambda v: v.str.match(POSTAL_CODE_PATTERN)),
+         'address_postal_code must be a 5-digit ZIP code')
+    phone = df['phone'].notna() & (text('phone') != '')
+    flag(phone & ~text('phone').str.match(PHONE_PATTERN), 'phone must be XXX-XXX-XXXX')
+
+    # 营业时间（validate_hours_format 的向量化版本）: 空值视为休息
+    for col in DAY_COLUMNS:
+        if col not in df.columns:
+            continue
+        has_value = df[col].notna() & (text(col) != '')
+        flag(has_value & ~_valid_values(text(col), _valid_hours),
+             f'{col} must be HH:MM-HH:MM (open before close) or closed')
+
+    bad = errors[errors != '']
+    return [
+        {
+            'row': int(idx) + 2,  # CSV行号（从1开始，跳过header）
+            'store_id': df.at[idx, 'store_id'] if pd.notna(df.at[idx, 'store_id']) else 'N/A',
+            'error': message.rstrip('; ')
+        }
+        for idx, message in bad.items()
+    ]
@@ -0,0 +1,128 @@
+"""
+热点函数微基准
+- distance:    calculate_distance（geopy逐点） vs calculate_distances（haversine向量化 / geodesic）
+- open_now:    Store.is_open_now（逐个ORM对象） vs open_mask（预编译营业时间，向量化）
+- to_dict:     Store.to_dict 单店序列化（services已预加载，只测CPU）
+- import:      import_stores_from_csv 首次导入（全部INSERT）和重复导入（全部UPDATE）
+
+    python -m store_locator.benchmarks.bench_micro [--points 2000] [--stores 5000] [--import-rows 20000]
+        [--only distance,open_now,to_dict,import] [--database-url sqlite:////tmp/bench.db]
+"""
+import argparse
+import io
+import time
+from datetime import datetime
+from sqlalchemy.orm import selectinload
+from store_locator.app.extensions import db
+from store_locator.app.models import Store
+from store_locator.app.stores.hours import open_mask
+from store_locator.app.stores.import_csv import import_stores_from_csv
+from store_locator.app.stores.utils import calculate_distance, calculate_distances
+from store_locator.benchmarks.common import (
+    make_bench_app, seed_database, generate_store_rows, write_store_csv, measure, emit, environment
+)
+
+BENCHMARKS = ('distance', 'open_now', 'to_dict', 'import')
+
+
+def bench_distance(points, repeat):
+    rows = generate_store_rows(points)
+    lats = [row['latitude'] for row in rows]
+    lons = [row['longitude'] for row in rows]
+    origin = (40.7128, -74.0060)
+
+    cases = (
+        ('calculate_distance', lambda: [calculate_distance(origin, p) for p in zip(lats, lons)]),
+        ('calculate_distances_geodesic', lambda: calculate_distances(origin, lats, lons, method='geodesic')),
+        ('calculate_distances_haversine', lambda: calculate_distances(origin, lats, lons)),
+    )
+    results = []
+    for name, fn in cases:
+        # geopy逐点很慢，少跑几次
+        stats, _ = measure(fn, repeat=repeat if 'haversine' in name else max(repeat // 5, 1))
+        results.append({'benchmark': 'distance', 'method': name, 'points': points,
+                        'per_item_us': round(stats['mean_ms'] * 1000 / points, 3), **stats})
+    return results
+
+
+def bench_open_now(stores, repeat):
+    now = datetime(2024, 1, 3, 12, 30)
+    packed = [s.packed_hours for s in stores]
+
+    cases = (
+        ('Store.is_open_now', lambda: [s.is_open_now(now) for s in stores]),
+        ('open_mask', lambda: open_mask(packed, now)),
+    )
+    results = []
+    for name, fn in cases:
+        stats, _ = measure(fn, repeat=repeat)
+        results.append({'benchmark': 'open_now', 'method': name, 'stores': len(stores),
+                        'per_item_us': round(stats['mean_ms'] * 1000 / len(stores), 3), **stats})
+    return results
+
+
+def bench_to_dict(stores, repeat):
+    stats, _ = measure(lambda: [s.to_dict() for s in stores], repeat=repeat)
+    return [{'benchmark': 'to_dict', 'method': 'Store.to_dict', 'stores': len(stores),
+             'per_item_us': round(stats['mean_ms'] * 1000 / len(stores), 3), **stats}]
+
+
+def bench_import(app, rows):
+    buf = io.StringIO()
+    write_store_csv(buf, rows)
+    data = buf.getvalue().encode('utf-8')
+
+    results = []
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        # 第一次全部是新店铺，第二次同一份文件全部走UPDATE
+        for phase in ('insert', 'update'):
+            start = time.perf_counter()
+            report = import_stores_from_csv(io.BytesIO(data))
+            elapsed = time.perf_counter() - start
+            assert report.get('success'), {k: v for k, v in report.items() if k != 'failed_rows'}
+            results.append({
+                'benchmark': 'import', 'method': 'import_stores_from_csv', 'phase': phase, 'rows': rows,
+                'created': report['created'], 'updated': report['updated'],
+                'total_ms': round(elapsed * 1000, 3), 'rows_per_sec': round(rows / elapsed, 1)
+            })
+    return results
+
+
+def run(points=2000, total_stores=5000, import_rows=20000, repeat=20, only=BENCHMARKS, database_url=None):
+    app = make_bench_app(database_url, SPATIAL_INDEX_ENABLED=False, SEARCH_CACHE_ENABLED=False)
+    results = []
+
+    if 'distance' in only:
+        results += bench_distance(points, repeat)
+
+    if 'open_now' in only or 'to_dict' in only:
+        with app.app_context():
+            seed_database(total_stores)
+            stores = Store.query.options(selectinload(Store.services)).all()
+            if 'open_now' in only:
+                results += bench_open_now(stores, repeat)
+            if 'to_dict' in only:
+                results += bench_to_dict(stores, repeat)
+            db.session.remove()
+
+    if 'import' in only:
+        results += bench_import(app, import_rows)
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--points', type=int, default=2000)
+    parser.add_argument('--stores', type=int, default=5000)
+    parser.add_argument('--import-rows', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--only', default=','.join(BENCHMARKS))
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+
+    only = tuple(name.strip() for name in args.only.split(',') if name.strip())
+    emit('micro', run(args.points, args.stores, args.import_rows, args.repeat, only, args.database_url),
+         params={**vars(args), 'environment': environment(args.database_url)})
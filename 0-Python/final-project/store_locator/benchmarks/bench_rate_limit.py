@@ -0,0 +1,113 @@
+"""
+限流开销Benchmark: Flask-Limiter（每个请求访问存储） vs 混合限流（本地令牌桶 + 后台批量同步）
+
+后端网络延迟用 rtt_ms 模拟（Flask-Limiter 的每次存储调用 / 混合限流的每次批量同步各sleep一次）
+同一个最小Flask app上挂三个端点，限额足够大不会触发429，结果减去无限流端点得到纯开销
+
+    python -m store_locator.benchmarks.bench_rate_limit [--requests 2000] [--rtt-ms 0.5]
+"""
+import argparse
+import time
+from flask import Flask
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from limits.storage import MemoryStorage
+from store_locator.app.rate_limit import HybridRateLimiter, MemoryCounterBackend
+from store_locator.benchmarks.common import summarize, emit
+
+
+class LatencyMemoryStorage(MemoryStorage):
+    """模拟Redis: 内存存储 + 每次调用一个网络往返"""
+
+    STORAGE_SCHEME = ['latencymemory']
+    rtt_ms = 0.0
+
+    def incr(self, *args, **kwargs):
+        time.sleep(self.rtt_ms / 1000)
+        return super().incr(*args, **kwargs)
+
+    def get(self, *args, **kwargs):
+        time.sleep(self.rtt_ms / 1000)
+        return super().get(*args, **kwargs)
+
+
+class LatencyCounterBackend(MemoryCounterBackend):
+    """模拟Redis pipeline: 一次批量同步一个网络往返"""
+
+    def __init__(self, rtt_ms):
+        super().__init__()
+        self.rtt_ms = rtt_ms
+        self.calls = 0
+
+    def incr_many(self, items):
+        self.calls += 1
+        time.sleep(self.rtt_ms / 1000)
+        return super().incr_many(items)
+
+
+def build_app(rtt_ms):
+    LatencyMemoryStorage.rtt_ms = rtt_ms
+
+    app = Flask(__name__)
+    app.config['RATELIMIT_HEADERS_ENABLED'] = True
+    limiter = Limiter(key_func=get_remote_address, app=app, storage_uri='latencymemory://')
+
+    hybrid = HybridRateLimiter()
+    hybrid.init_app(app)
+    hybrid.backend = LatencyCounterBackend(rtt_ms)
+    hybrid.sync_interval = 0.05
+
+    @app.route('/none', methods=['POST'])
+    @limiter.exempt
+    def no_limit():
+        return {'ok': True}
+
+    @app.route('/flask-limiter', methods=['POST'])
+    @limiter.limit('1000000 per minute')
+    @limiter.limit('1000000 per hour')
+    def flask_limited():
+        return {'ok': True}
+
+    @app.route('/hybrid', methods=['POST'])
+    @limiter.exempt
+    @hybrid.limit('1000000 per minute', '1000000 per hour')
+    def hybrid_limited():
+        return {'ok': True}
+
+    return app, hybrid
+
+
+def run(requests=2000, rtt_ms=0.5):
+    app, hybrid = build_app(rtt_ms)
+    client = app.test_client()
+
+    results = []
+    baseline = None
+    for path in ('/none', '/flask-limiter', '/hybrid'):
+        for _ in range(50):
+            client.post(path)
+        samples = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            client.post(path)
+            samples.append((time.perf_counter() - start) * 1000)
+        summary = summarize(samples)
+        if baseline is None:
+            baseline = summary['mean_ms']
+        results.append({
+            'limiter': path.strip('/'),
+            'rtt_ms': rtt_ms,
+            'overhead_mean_ms': round(summary['mean_ms'] - baseline, 4),
+            **summary
+        })
+
+    results[-1]['backend_syncs'] = hybrid.backend.calls
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--rtt-ms', type=float, default=0.5)
+    args = parser.parse_args()
+    emit('rate_limit_overhead', run(args.requests, args.rtt_ms))
@@ -0,0 +1,163 @@
+"""
+端到端搜索压测: POST /api/stores/search（离线，StubGeocoder代替Nominatim）
+
+请求组合（固定随机种子，每次运行完全相同）:
+- coordinates: 都市圈附近的坐标（网格吸附后部分命中结果缓存）
+- postal:      5位邮编（不用本地邮编库，走模拟的远程地理编码 + 地理编码缓存）
+- address:     文本地址（同上）
+- nearest:     最近5家，不限半径
+约30%带服务过滤，20%带 open_now
+
+输出: 整体和按请求类型的 p50/p95/p99、吞吐、每个请求的SQL条数、各阶段平均耗时（来自 /metrics 的直方图）
+
+    python -m store_locator.benchmarks.bench_search_load [--stores 10000] [--requests 500] [--concurrency 1]
+        [--no-cache] [--no-index] [--rtt-ms 0] [--database-url sqlite:////tmp/bench.db]
+
+并发>1时建议用SQLite文件或Postgres（内存SQLite所有线程共用一个连接）
+"""
+import argparse
+import random
+import statistics
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from store_locator.app.extensions import db
+from store_locator.app.metrics import SEARCH_STAGE_SECONDS
+from store_locator.app.stores.geocoding import geocode_cache, PostalCentroidStore
+from store_locator.app.stores.result_cache import search_result_cache
+from store_locator.app.stores.search import init_search_service
+from store_locator.app.stores.spatial_index import spatial_index
+from store_locator.benchmarks.common import (
+    METRO_CENTERS, SERVICES, make_bench_app, seed_database, StubGeocoder, ThreadQueryCounter,
+    summarize, percentile, emit, environment
+)
+
+REQUEST_MIX = [('coordinates', 55), ('postal', 20), ('address', 15), ('nearest', 10)]
+RADII = [5, 10, 25, 50]
+
+
+def build_requests(n, seed=7):
+    """生成n个搜索请求体: [(类型, body)]"""
+    rng = random.Random(seed)
+    kinds = [k for k, _ in REQUEST_MIX]
+    weights = [w for _, w in REQUEST_MIX]
+    centers = [c for c, _ in METRO_CENTERS]
+
+    requests = []
+    for _ in range(n):
+        kind = rng.choices(kinds, weights)[0]
+        lat0, lon0 = rng.choice(centers)
+        if kind == 'postal':
+            body = {'postal_code': f'{rng.randint(10000, 10200):05d}'}
+        elif kind == 'address':
+            body = {'address': f'{rng.randint(1, 50)} Main St, Bench City'}
+        else:
+            body = {'latitude': round(lat0 + rng.uniform(-0.3, 0.3), 4),
+                    'longitude': round(lon0 + rng.uniform(-0.3, 0.3), 4)}
+
+        if kind == 'nearest':
+            body.update({'nearest': True, 'limit': 5, 'radius_miles': 5})
+        else:
+            body['radius_miles'] = rng.choice(RADII)
+        if rng.random() < 0.3:
+            body['services'] = rng.sample(SERVICES, rng.randint(1, 2))
+        if rng.random() < 0.2:
+            body['open_now'] = True
+        requests.append((kind, body))
+    return requests
+
+
+def _stage_means(before, after):
+    """两次直方图快照之间各阶段的平均耗时（毫秒）"""
+    means = {}
+    for key, (count, total) in after.items():
+        count0, total0 = before.get(key, (0, 0.0))
+        if count > count0:
+            means[key[0]] = round((total - total0) / (count - count0) * 1000, 3)
+    return dict(sorted(means.items()))
+
+
+def run(total_stores=10000, requests=500, concurrency=1, warmup=20,
+        use_cache=True, use_index=True, rtt_ms=0.0, database_url=None):
+    app = make_bench_app(database_url, SEARCH_CACHE_ENABLED=use_cache, SPATIAL_INDEX_ENABLED=use_index)
+
+    with app.app_context():
+        seed_database(total_stores)
+        if use_index:
+            spatial_index.rebuild()
+        # 不使用本地邮编库，邮编也走（模拟的）远程地理编码
+        geocode_cache.centroids = PostalCentroidStore(None)
+    init_search_service(app, geocoder=StubGeocoder(rtt_ms))
+
+    plan = build_requests(warmup + requests)
+    with app.app_context():
+        engine = db.engine
+
+    def send(item):
+        kind, body = item
+        client = app.test_client()
+        counter.reset()
+        start = time.perf_counter()
+        resp = client.post('/api/stores/search', json=body)
+        elapsed = (time.perf_counter() - start) * 1000
+        return kind, elapsed, counter.count, resp.status_code, len((resp.get_json() or {}).get('stores', []))
+
+    with ThreadQueryCounter(engine) as counter:
+        for item in plan[:warmup]:
+            send(item)
+
+        hits_before = search_result_cache.hits
+        stages_before = SEARCH_STAGE_SECONDS.totals()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(send, plan[warmup:]))
+        wall = time.perf_counter() - started
+        stages_after = SEARCH_STAGE_SECONDS.totals()
+
+    def report(subset):
+        latencies = [s[1] for s in subset]
+        queries = [s[2] for s in subset]
+        return {
+            **summarize(latencies),
+            'queries_per_request': round(statistics.fmean(queries), 2),
+            'queries_p95': percentile(queries, 95),
+            'queries_max': max(queries),
+            'avg_results': round(statistics.fmean(s[4] for s in subset), 1)
+        }
+
+    results = [{
+        'kind': 'all',
+        'stores': total_stores,
+        'concurrency': concurrency,
+        'cache': use_cache,
+        'spatial_index': use_index,
+        'throughput_rps': round(len(samples) / wall, 1),
+        'status_codes': dict(Counter(str(s[3]) for s in samples)),
+        'cache_hits': search_result_cache.hits - hits_before,
+        'stage_mean_ms': _stage_means(stages_before, stages_after),
+        **report(samples)
+    }]
+    for kind, _ in REQUEST_MIX:
+        subset = [s for s in samples if s[0] == kind]
+        if subset:
+            results.append({'kind': kind, 'stores': total_stores, 'concurrency': concurrency,
+                            'cache': use_cache, 'spatial_index': use_index, **report(subset)})
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stores', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--no-index', action='store_true')
+    parser.add_argument('--rtt-ms', type=float, default=0.0)
+    parser.add_argument('--database-url', default=None)
+    args = parser.parse_args()
+    emit('search_load', run(
+        args.stores, args.requests, args.concurrency, args.warmup,
+        use_cache=not args.no_cache, use_index=not args.no_index, rtt_ms=args.rtt_ms,
+        database_url=args.database_url
+    ), params={**vars(args), 'environment': environment(args.database_url)})
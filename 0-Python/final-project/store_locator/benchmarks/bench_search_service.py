@@ -0,0 +1,82 @@
+"""
+搜索服务生命周期Benchmark: 每个请求新建StoreSearchService（旧行为） vs 进程内共享实例
+
+新建实例每次都要创建SSL context和Nominatim客户端，并且拿不到已建立的HTTP连接。
+两种方式都是真实的geopy客户端，通过HTTP访问本地的 LocalGeocoderServer（见 common.py），
+结果里的 connections 是实际建立的TCP连接数；
+握手（connect_ms，每个新连接一次）和网络往返（rtt_ms）是服务端sleep出来的模型值，不是实测的TLS开销
+
+注意: 没有安装 requests 时geopy用urllib，不保持长连接，两种方式的 connections 都等于请求数
+
+- cold: 每个请求都是新的邮编，缓存未命中，需要远程地理编码
+- warm: 重复同一个邮编，命中地理编码缓存
+
+    python -m store_locator.benchmarks.bench_search_service [--stores 10000] [--requests 50]
+"""
+import argparse
+from store_locator.app.stores.geocoding import geocode_cache, PostalCentroidStore
+from store_locator.app.stores.search import StoreSearchService, init_search_service
+from store_locator.app.stores.spatial_index import spatial_index
+from store_locator.app.extensions import cache
+from store_locator.benchmarks.common import make_bench_app, seed_database, LocalGeocoderServer, summarize, emit
+import time
+
+
+def run(total_stores=10000, requests=50, rtt_ms=20.0, connect_ms=60.0):
+    server = LocalGeocoderServer(rtt_ms, connect_ms)
+    app = make_bench_app(NOMINATIM_DOMAIN=server.domain, NOMINATIM_SCHEME='http')
+    mode = {'per_request': False}
+
+    @app.before_request
+    def _new_service_per_request():
+        # 旧代码: 路由里每次 StoreSearchService()
+        if mode['per_request']:
+            app.extensions['store_search'] = StoreSearchService(domain=server.domain, scheme='http')
+
+    with app.app_context():
+        seed_database(total_stores)
+        spatial_index.rebuild()
+        # 不使用本地邮编库，邮编查询都走（模拟的）远程地理编码
+        geocode_cache.centroids = PostalCentroidStore(None)
+
+    client = app.test_client()
+    results = []
+    with server:
+        for lifecycle in ('per_request', 'shared'):
+            mode['per_request'] = lifecycle == 'per_request'
+            init_search_service(app)
+
+            for cache_state in ('cold', 'warm'):
+                results.append({'lifecycle': lifecycle, 'cache': cache_state,
+                                **_measure(app, client, server, cache_state, requests)})
+
+    return results
+
+
+def _measure(app, client, server, cache_state, requests):
+    with app.app_context():
+        cache.clear()
+    connections, geocoded = server.connections, server.requests
+    samples = []
+    for i in range(requests):
+        postal = f'{10000 + i:05d}' if cache_state == 'cold' else '10001'
+        start = time.perf_counter()
+        resp = client.post('/api/stores/search', json={'postal_code': postal, 'radius_miles': 25})
+        samples.append((time.perf_counter() - start) * 1000)
+        assert resp.status_code == 200
+    # warm的第一个请求负责填充缓存，不计入
+    if cache_state == 'warm':
+        samples = samples[1:]
+    return {**summarize(samples),
+            'geocode_requests': server.requests - geocoded,
+            'connections': server.connections - connections}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--stores', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--rtt-ms', type=float, default=20.0)
+    parser.add_argument('--connect-ms', type=float, default=60.0)
+    args = parser.parse_args()
+    emit('search_service_lifecycle', run(args.stores, args.requests, args.rtt_ms, args.connect_ms))
@@ -0,0 +1,48 @@
+"""
+序列化Benchmark: Store.to_dict（逐行ORM，懒加载services） vs serialize_stores（批量Core查询）
+
+对20 / 100 / 1000行分别统计每次响应的SQL条数和耗时
+
+    python -m store_locator.benchmarks.bench_serialization [--stores 5000] [--repeat 20]
+"""
+import argparse
+from store_locator.app.extensions import db
+from store_locator.app.models import Store
+from store_locator.app.stores.serializers import serialize_stores
+from store_locator.benchmarks.common import make_bench_app, seed_database, QueryCounter, measure, emit
+
+
+def run(total_stores=5000, sizes=(20, 100, 1000), repeat=20):
+    app = make_bench_app(SPATIAL_INDEX_ENABLED=False)
+    results = []
+
+    with app.app_context():
+        store_pks = seed_database(total_stores)
+
+        for size in sizes:
+            pks = store_pks[:size]
+
+            def legacy():
+                stores = Store.query.filter(Store.id.in_(pks)).all()
+                return [s.to_dict() for s in stores]
+
+            def bulk():
+                return serialize_stores(pks)
+
+            for name, fn in (('to_dict', legacy), ('serialize_stores', bulk)):
+                # 每次都从空session开始，模拟一次新请求
+                db.session.remove()
+                with QueryCounter(db.engine) as counter:
+                    fn()
+                stats, _ = measure(fn, repeat=repeat, setup=db.session.remove)
+                results.append({'rows': size, 'method': name, 'queries': counter.count, **stats})
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--stores', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    emit('serialization', run(args.stores, repeat=args.repeat))
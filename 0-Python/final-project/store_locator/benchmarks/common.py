@@ -0,0 +1,394 @@
+"""
+Benchmark公共工具
+- 离线运行: SQLite + SimpleCache + 内存限流存储，不需要Postgres/Redis
+  （BENCH_DATABASE_URL / --database-url 可指向本地Postgres，注意会重建表）
+- 合成店铺数据生成（1万~100万家，按都市圈聚集）
+- SQL计数、耗时统计、JSON输出（compare.py 对比两次结果）
+
+运行方式（在final-project目录下）:
+    python -m store_locator.benchmarks.bench_serialization
+    python -m store_locator.benchmarks.bench_micro
+    python -m store_locator.benchmarks.bench_search_load
+"""
+import csv
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# 美国主要都市圈（中心坐标, 权重），店铺围绕这些中心聚集
+METRO_CENTERS = [
+    ((40.7128, -74.0060), 20), ((34.0522, -118.2437), 13), ((41.8781, -87.6298), 9),
+    ((29.7604, -95.3698), 7), ((33.4484, -112.0740), 5), ((39.9526, -75.1652), 6),
+    ((32.7767, -96.7970), 7), ((37.7749, -122.4194), 6), ((47.6062, -122.3321), 4),
+    ((25.7617, -80.1918), 6), ((33.7490, -84.3880), 6), ((42.3601, -71.0589), 5),
+    ((39.7392, -104.9903), 3), ((44.9778, -93.2650), 3), ((36.1627, -86.7816), 2),
+    ((28.5383, -81.3792), 2), ((45.5152, -122.6784), 2), ((35.2271, -80.8431), 2),
+]
+
+SERVICES = ['pharmacy', 'pickup', 'returns', 'optical',
+            'photo_printing', 'gift_wrapping', 'automotive', 'garden_center']
+STORE_TYPES = ['flagship'] * 5 + ['regular'] * 70 + ['outlet'] * 20 + ['express'] * 5
+STATUSES = ['active'] * 95 + ['temporarily_closed'] * 3 + ['inactive'] * 2
+HOURS = ['08:00-22:00', '07:00-23:00', '09:00-21:00', '10:00-20:00', '06:00-24:00', 'closed']
+STATES = ['NY', 'CA', 'IL', 'TX', 'AZ', 'PA', 'FL', 'GA', 'MA', 'WA', 'CO', 'MN', 'TN', 'OR', 'NC']
+
+# 都市圈之外的零散店铺（美国本土范围内均匀分布）
+RURAL_SHARE = 0.1
+CONUS_BOUNDS = (25.0, 49.0, -124.0, -67.0)
+
+CSV_COLUMNS = [
+    'store_id', 'name', 'store_type', 'status', 'latitude', 'longitude',
+    'address_street', 'address_city', 'address_state', 'address_postal_code', 'address_country',
+    'phone', 'services', 'hours_mon', 'hours_tue', 'hours_wed', 'hours_thu', 'hours_fri', 'hours_sat', 'hours_sun'
+]
+
+DEFAULT_DATABASE_URL = os.getenv('BENCH_DATABASE_URL', 'sqlite://')
+
+
+def make_bench_app(database_url=None, **overrides):
+    """
+    创建离线benchmark/测试用的app（覆盖依赖外部服务的配置）
+    只改这个app的配置，不修改 Config 类，同一进程里之后创建的app不受影响
+    """
+    from store_locator.app import create_app
+    from store_locator.app.config import Config
+
+    return create_app({
+        'SQLALCHEMY_DATABASE_URI': database_url or DEFAULT_DATABASE_URL,
+        'CACHE_TYPE': 'SimpleCache',
+        'RATELIMIT_STORAGE_URL': 'memory://',
+        'RATELIMIT_ENABLED': False,
+        'JWT_SECRET_KEY': Config.JWT_SECRET_KEY or 'bench-secret-key-bench-secret-key',
+        **overrides
+    })
+
+
+def iter_store_rows(n, seed=42, rural_share=RURAL_SHARE):
+    """
+    逐行生成n家合成店铺（CSV列名），100万家也不需要一次放进内存
+
+    - 大部分按都市圈权重聚集，越靠近中心越密集（正态分布，大都市圈更分散）
+    - rural_share 的店铺均匀分布在美国本土，模拟郊区/乡村的稀疏区域
+    """
+    rng = random.Random(seed)
+    centers = [c for c, _ in METRO_CENTERS]
+    weights = [w for _, w in METRO_CENTERS]
+    min_lat, max_lat, min_lon, max_lon = CONUS_BOUNDS
+
+    for i in range(1, n + 1):
+        if rng.random() < rural_share:
+            lat, lon = rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon)
+        else:
+            idx = rng.choices(range(len(centers)), weights)[0]
+            (lat0, lon0), spread = centers[idx], 0.15 + 0.02 * weights[idx]
+            lat, lon = rng.gauss(lat0, spread), rng.gauss(lon0, spread)
+        row = {
+            'store_id': f'B{i:07d}',
+            'name': f'Bench Store {i}',
+            'store_type': rng.choice(STORE_TYPES),
+            'status': rng.choice(STATUSES),
+            'latitude': round(lat, 6),
+            'longitude': round(lon, 6),
+            'address_street': f'{rng.randint(1, 9999)} Main St',
+            'address_city': 'Bench City',
+            'address_state': rng.choice(STATES),
+            'address_postal_code': f'{rng.randint(0, 99999):05d}',
+            'address_country': 'USA',
+            'phone': f'555-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}',
+            'services': '|'.join(rng.sample(SERVICES, rng.randint(1, 5))),
+        }
+        for day in ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun'):
+            row[f'hours_{day}'] = rng.choice(HOURS)
+        yield row
+
+
+def generate_store_rows(n, seed=42):
+    """生成n家合成店铺（列表）"""
+    return list(iter_store_rows(n, seed))
+
+
+def write_store_csv(path_or_file, n, seed=42):
+    """把n家合成店铺写成导入用的CSV（文件路径或文本文件对象）"""
+    def write(f):
+        writer = csv.DictWriter(f, fieldnames=CSV_COLUMNS)
+        writer.writeheader()
+        writer.writerows(iter_store_rows(n, seed))
+
+    if hasattr(path_or_file, 'write'):
+        write(path_or_file)
+    else:
+        with open(path_or_file, 'w', newline='') as f:
+            write(f)
+
+
+def seed_database(n, seed=42, batch_size=5000, reset=True):
+    """
+    建表并批量写入n家合成店铺（需要app context）
+    reset=True 时先删表重建（--database-url 指向已有库时同样会清空）
+    返回: 店铺主键列表
+    """
+    from sqlalchemy import insert, select
+    from store_locator.app.extensions import db
+    from store_locator.app.models import Store, Service, store_services
+    from store_locator.app.stores.hours import DAY_COLUMNS, pack_week
+    from store_locator.app.stores.service_mask import mask_for_ids
+
+    # 只建主库的表: 同一进程里之前创建过带分片bind的app时，db.metadatas 里还留着那些bind
+    if reset:
+        db.drop_all(bind_key=None)
+    db.create_all(bind_key=None)
+    for name in SERVICES:
+        if not Service.query.filter_by(name=name).first():
+            db.session.add(Service(name=name))
+    db.session.commit()
+    service_ids = dict(db.session.execute(select(Service.name, Service.id)).all())
+
+    rows = iter_store_rows(n, seed)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        store_values = []
+        for row in batch:
+            values = {k: v for k, v in row.items() if k != 'services'}
+            values['hours_packed'] = pack_week([row[col] for col in DAY_COLUMNS])
+            values['services_mask'] = mask_for_ids(service_ids[name] for name in row['services'].split('|'))
+            store_values.append(values)
+        db.session.execute(insert(Store), store_values)
+
+        pks = dict(db.session.execute(
+            select(Store.store_id, Store.id).where(Store.store_id.in_([r['store_id'] for r in batch]))
+        ).all())
+        links = [
+            {'store_id': pks[row['store_id']], 'service_id': service_ids[name]}
+            for row in batch for name in row['services'].split('|')
+        ]
+        db.session.execute(insert(store_services), links)
+    db.session.commit()
+
+    return [pk for (pk,) in db.session.execute(select(Store.id).order_by(Store.id))]
+
+
+class StubGeocoder:
+    """
+    离线地理编码替身（接口与geopy一致: geocode(query, timeout) -> location）
+
+    - 坐标由query哈希到某个都市圈附近，结果稳定
+    - rtt_ms: 每次请求的模拟网络往返
+    - connect_ms: 新客户端第一次请求的模拟TCP+TLS握手（连接池复用后不再产生）
+    """
+
+    def __init__(self, rtt_ms=0.0, connect_ms=0.0):
+        self.rtt_ms = rtt_ms
+        self.connect_ms = connect_ms
+        self.calls = 0
+        self._connected = False
+
+    def geocode(self, query, timeout=None):
+        from types import SimpleNamespace
+
+        if not self._connected:
+            time.sleep(self.connect_ms / 1000)
+            self._connected = True
+        time.sleep(self.rtt_ms / 1000)
+        self.calls += 1
+
+        lat, lon = stub_coordinates(query)
+        return SimpleNamespace(latitude=lat, longitude=lon)
+
+
+def stub_coordinates(query):
+    """query哈希到某个都市圈附近的稳定坐标"""
+    rng = random.Random(str(query))
+    lat0, lon0 = rng.choice(METRO_CENTERS)[0]
+    return lat0 + rng.uniform(-0.2, 0.2), lon0 + rng.uniform(-0.2, 0.2)
+
+
+class _GeocodeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'      # keep-alive，客户端连接池可以复用连接
+
+    def setup(self):
+        super().setup()
+        # 每个新TCP连接一次: 模拟的TLS握手
+        with self.server.lock:
+            self.server.connections += 1
+        time.sleep(self.server.connect_ms / 1000)
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query).get('q', [''])[0]
+        time.sleep(self.server.rtt_ms / 1000)
+        lat, lon = stub_coordinates(query)
+        body = json.dumps([{'lat': str(lat), 'lon': str(lon), 'display_name': query}]).encode()
+        with self.server.lock:
+            self.server.requests += 1
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalGeocoderServer:
+    """
+    本地HTTP地理编码服务（Nominatim /search 的JSON格式），搜索服务通过真实的geopy客户端访问
+
+    - 客户端对象创建、HTTP请求、连接池是否复用连接都是实测的（connections 为实际建立的TCP连接数）
+    - 本地是http，没有TLS: 每个新连接由服务端等待 connect_ms 代替握手，每个请求等待 rtt_ms 代替网络往返，
+      这两部分是模型值
+    """
+
+    def __init__(self, rtt_ms=0.0, connect_ms=0.0):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _GeocodeHandler)
+        self._server.daemon_threads = True
+        self._server.rtt_ms = rtt_ms
+        self._server.connect_ms = connect_ms
+        self._server.connections = 0
+        self._server.requests = 0
+        self._server.lock = threading.Lock()
+
+    @property
+    def domain(self):
+        return f'127.0.0.1:{self._server.server_address[1]}'
+
+    @property
+    def connections(self):
+        return self._server.connections
+
+    @property
+    def requests(self):
+        return self._server.requests
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True, name='bench-geocoder').start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class QueryCounter:
+    """统计一段代码执行的SQL条数（所有线程合计）"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        from sqlalchemy import event
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        from sqlalchemy import event
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+class ThreadQueryCounter:
+    """
+    按线程统计SQL条数（并发压测时每个请求单独计数）
+
+        with ThreadQueryCounter(db.engine) as counter:
+            counter.reset(); 发请求; counter.count
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._local = threading.local()
+
+    @property
+    def count(self):
+        return getattr(self._local, 'count', 0)
+
+    def reset(self):
+        self._local.count = 0
+
+    def _on_execute(self, *args, **kwargs):
+        self._local.count = self.count + 1
+
+    def __enter__(self):
+        from sqlalchemy import event
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        from sqlalchemy import event
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def summarize(samples_ms):
+    """耗时样本（毫秒）-> 统计结果"""
+    return {
+        'runs': len(samples_ms),
+        'mean_ms': round(statistics.fmean(samples_ms), 3),
+        'p50_ms': round(percentile(samples_ms, 50), 3),
+        'p95_ms': round(percentile(samples_ms, 95), 3),
+        'p99_ms': round(percentile(samples_ms, 99), 3),
+    }
+
+
+def measure(fn, repeat=20, setup=None):
+    """
+    重复执行fn，返回 (统计结果, 最后一次的返回值)
+    setup: 每次执行前调用（不计时），例如清空session
+    """
+    samples = []
+    result = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize(samples), result
+
+
+def environment(database_url=None):
+    """运行环境（写进结果里，对比时确认两次跑在相同条件下）"""
+    from sqlalchemy.engine import make_url
+
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'database': make_url(database_url or DEFAULT_DATABASE_URL).get_backend_name()
+    }
+
+
+def emit(name, results, path=None, params=None):
+    """
+    以JSON输出结果；指定path（或BENCH_OUTPUT环境变量）时同时写入文件，
+    用 python -m store_locator.benchmarks.compare old.json new.json 对比
+    """
+    payload = {'benchmark': name, 'timestamp': time.time(), 'results': results}
+    if params is not None:
+        payload['params'] = params
+    text = json.dumps(payload, indent=2)
+    print(text)
+
+    path = path or os.getenv('BENCH_OUTPUT')
+    if path:
+        with open(path, 'w') as f:
+            f.write(text)
+    return payload
@@ -0,0 +1,71 @@
+"""
+对比两次benchmark的JSON输出（emit 写出的文件）
+
+按结果行中的非统计字段（method / rows / kind ...）配对，逐项列出耗时变化
+--fail-above 10 表示任一行的指标变慢超过10%时退出码为1，可用于CI
+
+    python -m store_locator.benchmarks.compare base.json new.json [--metric p95_ms] [--fail-above 10]
+"""
+import argparse
+import json
+import sys
+
+# 这些字段是测量结果，其余字段用来识别是哪一行
+STAT_FIELDS = {
+    'runs', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'per_item_us', 'total_ms', 'rows_per_sec',
+    'throughput_rps', 'queries', 'queries_per_request', 'queries_p95', 'queries_max', 'avg_results',
+    'overhead_mean_ms', 'backend_syncs', 'status_codes', 'cache_hits', 'stage_mean_ms', 'created', 'updated'
+}
+
+
+def row_key(row):
+    return tuple(sorted((k, json.dumps(v)) for k, v in row.items() if k not in STAT_FIELDS))
+
+
+def compare(base, new, metric='p95_ms'):
+    """返回 [{'key', 'base', 'new', 'change_pct'}]，只包含两边都有该指标的行"""
+    base_rows = {row_key(row): row for row in base['results']}
+    changes = []
+    for row in new['results']:
+        old = base_rows.get(row_key(row))
+        if old is None or old.get(metric) is None or row.get(metric) is None:
+            continue
+        change = (row[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+        changes.append({
+            'key': {k: v for k, v in row.items() if k not in STAT_FIELDS},
+            'base': old[metric],
+            'new': row[metric],
+            'change_pct': round(change, 1)
+        })
+    return changes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base')
+    parser.add_argument('new')
+    parser.add_argument('--metric', default='p95_ms')
+    parser.add_argument('--fail-above', type=float, default=None, help='变慢超过该百分比时退出码为1')
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    if base.get('benchmark') != new.get('benchmark'):
+        sys.exit(f"Different benchmarks: {base.get('benchmark')} vs {new.get('benchmark')}")
+
+    # 吞吐类指标越大越好，其余越小越好
+    higher_is_better = args.metric in ('rows_per_sec', 'throughput_rps')
+    regressions = 0
+    for item in compare(base, new, args.metric):
+        label = ' '.join(f'{k}={v}' for k, v in item['key'].items())
+        slower = -item['change_pct'] if higher_is_better else item['change_pct']
+        flag = ''
+        if args.fail_above is not None and slower > args.fail_above:
+            flag = '  <-- regression'
+            regressions += 1
+        print(f"{label:60} {item['base']:>10} -> {item['new']:>10}  {item['change_pct']:+6.1f}%{flag}")
+
+    if regressions:
+        sys.exit(1)
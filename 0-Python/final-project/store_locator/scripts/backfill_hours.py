@@ -0,0 +1,30 @@
+# 为已有店铺回填 stores.hours_packed（预编译营业时间）
+from sqlalchemy import inspect, text
+from store_locator.app import create_app
+from store_locator.app.extensions import db
+from store_locator.app.models import Store
+from store_locator.app.stores.hours import DAY_COLUMNS, pack_week
+
+app = create_app()
+
+with app.app_context():
+    # 老库没有这一列时先加上
+    columns = [c['name'] for c in inspect(db.engine).get_columns('stores')]
+    if 'hours_packed' not in columns:
+        col_type = Store.__table__.c.hours_packed.type.compile(dialect=db.engine.dialect)
+        db.session.execute(text(f'ALTER TABLE stores ADD COLUMN hours_packed {col_type}'))
+        db.session.commit()
+        print("✓ Added column stores.hours_packed")
+
+    # 每批1000条提交一次，避免一个大事务
+    updated = 0
+    while True:
+        batch = Store.query.filter(Store.hours_packed.is_(None)).limit(1000).all()
+        if not batch:
+            break
+        for store in batch:
+            store.hours_packed = pack_week([getattr(store, col) for col in DAY_COLUMNS])
+        db.session.commit()
+        updated += len(batch)
+
+    print(f"✓ Backfilled hours for {updated} stores")
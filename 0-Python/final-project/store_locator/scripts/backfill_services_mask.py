@@ -0,0 +1,20 @@
+# 为已有店铺回填 stores.services_mask（按 store_services 重算服务位图）
+from sqlalchemy import inspect, text
+from store_locator.app import create_app
+from store_locator.app.extensions import db
+from store_locator.app.models import Store
+from store_locator.app.stores.service_mask import rebuild_services_masks
+
+app = create_app()
+
+with app.app_context():
+    # 老库没有这一列时先加上
+    columns = [c['name'] for c in inspect(db.engine).get_columns('stores')]
+    if 'services_mask' not in columns:
+        col_type = Store.__table__.c.services_mask.type.compile(dialect=db.engine.dialect)
+        db.session.execute(text(f'ALTER TABLE stores ADD COLUMN services_mask {col_type} NOT NULL DEFAULT 0'))
+        db.session.commit()
+        print("✓ Added column stores.services_mask")
+
+    updated = rebuild_services_masks()
+    print(f"✓ Recomputed services mask for {updated} stores")
@@ -0,0 +1,23 @@
+# 离线预计算 邮编 -> 附近店铺 表（postal_nearby_codes / postal_nearby_stores）
+# 需要先加载邮编质心库（load_postal_centroids.py）；之后店铺变更会增量刷新，
+# 一般只在首次部署、大批量导入后或调整 POSTAL_NEARBY_MAX_MILES / MAX_STORES 后重新运行
+#
+# 用法:
+#   python -m store_locator.scripts.build_postal_nearby [batch_size]
+import sys
+from store_locator.app import create_app
+from store_locator.app.extensions import db
+from store_locator.app.stores.postal_nearby import postal_nearby
+
+batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+
+app = create_app()
+
+with app.app_context():
+    db.create_all()
+    try:
+        codes, rows = postal_nearby.rebuild(batch_size)
+    except RuntimeError as e:
+        sys.exit(f"✗ {e}")
+    print(f"✓ Precomputed {codes} postal codes ({rows} rows, "
+          f"{postal_nearby.max_miles:g} miles, up to {postal_nearby.max_stores} stores each)")
@@ -0,0 +1,39 @@
+# 离线预加载美国邮编质心到本地SQLite（搜索时邮编查询不再请求Nominatim）
+#
+# 用法:
+#   python -m store_locator.scripts.load_postal_centroids 2023_Gaz_zcta_national.txt
+#
+# 支持两种输入:
+# - Census Gazetteer ZCTA文件（制表符分隔，列 GEOID / INTPTLAT / INTPTLONG）
+# - 普通CSV（列 postal_code / latitude / longitude）
+import sys
+import pandas as pd
+from store_locator.app.config import Config
+from store_locator.app.stores.geocoding import PostalCentroidStore, normalize_postal_code
+
+if len(sys.argv) < 2:
+    print("Usage: python -m store_locator.scripts.load_postal_centroids <file>")
+    sys.exit(1)
+
+path = sys.argv[1]
+sep = '\t' if path.endswith('.txt') else ','
+df = pd.read_csv(path, sep=sep, dtype=str)
+df.columns = [c.strip() for c in df.columns]
+
+if 'GEOID' in df.columns:
+    df = df.rename(columns={'GEOID': 'postal_code', 'INTPTLAT': 'latitude', 'INTPTLONG': 'longitude'})
+
+missing = {'postal_code', 'latitude', 'longitude'} - set(df.columns)
+if missing:
+    print(f"✗ Missing columns: {sorted(missing)}")
+    sys.exit(1)
+
+rows = []
+for code, lat, lon in df[['postal_code', 'latitude', 'longitude']].itertuples(index=False):
+    code = normalize_postal_code(code)
+    if code:
+        rows.append((code, float(lat), float(lon)))
+
+store = PostalCentroidStore(Config.POSTAL_CENTROIDS_DB)
+count = store.load(rows)
+print(f"✓ Loaded {count} postal centroids into {Config.POSTAL_CENTROIDS_DB}")
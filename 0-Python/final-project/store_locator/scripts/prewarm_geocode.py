@@ -0,0 +1,29 @@
+# 预热地理编码缓存
+#
+# 用法:
+#   python -m store_locator.scripts.prewarm_geocode              # 所有店铺的邮编
+#   python -m store_locator.scripts.prewarm_geocode queries.txt  # 每行一个地址
+import sys
+from store_locator.app import create_app
+from store_locator.app.extensions import db
+from store_locator.app.models import Store
+from store_locator.app.stores.search import get_search_service
+
+app = create_app()
+
+with app.app_context():
+    service = get_search_service()
+
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            queries = [line.strip() for line in f if line.strip()]
+        results = service.geocode_many(queries)
+    else:
+        queries = [code for (code,) in db.session.query(Store.address_postal_code).distinct()]
+        results = service.geocode_many(queries, postal=True)
+
+    found = sum(1 for coords in results.values() if coords)
+    print(f"✓ Geocoded {found}/{len(queries)} queries")
+    for query, coords in results.items():
+        if not coords:
+            print(f"  ✗ {query}")
@@ -0,0 +1,19 @@
+# 分批删除过期的 refresh token（建议cron定时执行，例如每小时一次）
+# 用法: python -m store_locator.scripts.purge_refresh_tokens [batch_size]
+import sys
+from store_locator.app import create_app
+from store_locator.app.extensions import db
+from store_locator.app.models import RefreshToken
+from store_locator.app.auth.tokens import purge_expired_tokens
+
+batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+
+app = create_app()
+
+with app.app_context():
+    # 老库没有 expires_at / user_id 索引时先建上
+    for index in RefreshToken.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+
+    deleted = purge_expired_tokens(batch_size=batch_size, pause=0.1)
+    print(f"✓ Deleted {deleted} expired refresh tokens")
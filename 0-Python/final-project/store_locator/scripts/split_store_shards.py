@@ -0,0 +1,75 @@
+# 按 STORE_SHARDS 把主库的店铺拆分到各分片库（SQLALCHEMY_BINDS），分片库会被清空重建
+# 之后的店铺写入由 stores_changed 增量复制到分片（见 app/stores/shards.py）
+# 用法:
+#   SQLALCHEMY_BINDS='{"east": "sqlite:////tmp/east.db", "west": "sqlite:////tmp/west.db"}' \
+#   STORE_SHARDS='{"east": {"states": ["NY", "MA"]}, "west": {"states": ["CA", "WA"]}}' \
+#   STORE_DEFAULT_SHARD=east \
+#   python -m store_locator.scripts.split_store_shards [batch_size]
+import sys
+from sqlalchemy import select, insert, delete
+from store_locator.app import create_app
+from store_locator.app.extensions import db
+from store_locator.app.models import Store, Service, store_services
+from store_locator.app.stores.shards import shard_router
+
+batch_size = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+
+app = create_app()
+
+with app.app_context():
+    if not shard_router.enabled:
+        sys.exit("STORE_SHARDS is empty, nothing to split")
+
+    tables = [Service.__table__, Store.__table__, store_services]
+    services = [dict(row._mapping) for row in db.session.execute(select(Service.__table__))]
+
+    # Step 1: 建表、清空，复制服务表（保持id一致，services_mask 在各库通用）
+    for key in shard_router.shards:
+        engine = shard_router.engine(key)
+        db.metadata.create_all(engine, tables=tables)
+        with engine.begin() as conn:
+            for table in reversed(tables):
+                conn.execute(delete(table))
+            if services:
+                conn.execute(insert(Service.__table__), services)
+
+    # Step 2: 按主键分批读取店铺，逐家路由到分片（保留原主键）
+    store_table = Store.__table__
+    counts = {key: 0 for key in shard_router.shards}
+    skipped = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(store_table).where(store_table.c.id > last_id).order_by(store_table.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        by_shard = {}
+        for row in rows:
+            key = shard_router.shard_for_store(row.address_state, row.address_country, row.latitude, row.longitude)
+            if key is None:
+                skipped += 1
+                continue
+            by_shard.setdefault(key, []).append(dict(row._mapping))
+
+        links = db.session.execute(
+            select(store_services).where(store_services.c.store_id.in_([row.id for row in rows]))
+        ).all()
+        for key, stores in by_shard.items():
+            pks = {store['id'] for store in stores}
+            shard_links = [dict(link._mapping) for link in links if link.store_id in pks]
+            with shard_router.engine(key).begin() as conn:
+                conn.execute(insert(store_table), stores)
+                if shard_links:
+                    conn.execute(insert(store_services), shard_links)
+            counts[key] += len(stores)
+
+    # Step 3: 各worker重新汇总分片范围、清空店铺片段，搜索结果缓存整体失效
+    shard_router.mark_layout_changed()
+
+    for key, count in counts.items():
+        print(f"✓ {key}: {count} stores")
+    if skipped:
+        print(f"✓ Skipped {skipped} stores matching no shard (set STORE_DEFAULT_SHARD to keep them)")
@@ -0,0 +1,82 @@
+"""
+营业时间: 解析、打包、向量化判断营业，管理端校验和CSV校验规则一致
+
+运行（在final-project目录下）:
+    python -m pytest store_locator/tests
+"""
+from datetime import datetime
+import pandas as pd
+import pytest
+from store_locator.app.stores.hours import parse_hours, pack_week, day_window, is_open_at, open_mask
+from store_locator.app.stores.utils import validate_hours_format
+from store_locator.app.stores.validation import _valid_hours
+
+# 2026-10-19 是周一
+MONDAY = datetime(2026, 10, 19)
+
+CASES = [
+    ('08:00-22:00', (480, 1320)),
+    ('8:00-22:00', (480, 1320)),
+    (' 08:00 - 22:00 ', (480, 1320)),
+    ('00:00-24:00', (0, 1440)),
+    ('23:59-24:00', (1439, 1440)),
+    ('closed', None),
+    ('Closed', None),
+    ('8:5-22:00', None),
+    ('08:00-24:30', None),
+    ('24:00-24:00', None),
+    ('25:00-26:00', None),
+    ('08:60-22:00', None),
+    ('22:00-02:00', None),      # 跨午夜
+    ('08:00-08:00', None),
+    ('+8:00-22:00', None),
+    ('08:00-22:00-23:00', None),
+    ('0800-2200', None),
+    ('', None),
+]
+
+
+@pytest.mark.parametrize('value, expected', CASES)
+def test_parse_hours(value, expected):
+    assert parse_hours(value) == expected
+
+
+def test_admin_and_csv_validation_agree():
+    values = [value for value, _ in CASES if value]
+    csv_valid = _valid_hours(pd.Series(values)).tolist()
+    admin_valid = [validate_hours_format(value) for value in values]
+    assert csv_valid == admin_valid
+    assert admin_valid == [parse_hours(v) is not None or v.strip().lower() == 'closed' for v in values]
+
+
+def test_pack_week_round_trip():
+    packed = pack_week(['08:00-22:00', 'closed', '00:00-24:00', None, '22:00-02:00', '9:30-17:00', ''])
+    assert len(packed) == 28
+    assert [day_window(packed, day) for day in range(7)] == [
+        (480, 1320), None, (0, 1440), None, None, (570, 1020), None
+    ]
+
+
+def test_is_open_at_boundaries():
+    packed = pack_week(['08:00-22:00', 'closed', '00:00-24:00', 'closed', 'closed', 'closed', 'closed'])
+    assert not is_open_at(packed, 0, 479)
+    assert is_open_at(packed, 0, 480)
+    assert is_open_at(packed, 0, 1320)
+    assert not is_open_at(packed, 0, 1321)
+    assert not any(is_open_at(packed, 1, minute) for minute in (0, 720, 1439))
+    assert is_open_at(packed, 2, 0) and is_open_at(packed, 2, 1439)
+
+
+def test_open_mask_matches_scalar_check():
+    weeks = [
+        pack_week(['08:00-22:00'] * 7),
+        pack_week(['closed'] * 7),
+        pack_week(['00:00-24:00'] * 7),
+        pack_week(['22:00-23:00'] + ['closed'] * 6),
+    ]
+    for hour, minute in [(0, 0), (7, 59), (8, 0), (12, 0), (22, 0), (22, 1), (23, 59)]:
+        now = MONDAY.replace(hour=hour, minute=minute)
+        expected = [is_open_at(packed, 0, hour * 60 + minute) for packed in weeks]
+        assert open_mask(weeks, now).tolist() == expected
+
+    assert open_mask([], MONDAY).shape == (0,)
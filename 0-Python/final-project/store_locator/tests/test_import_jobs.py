@@ -0,0 +1,140 @@
+"""
+后台导入任务: 取消与执行的竞争、心跳超时的任务、启动恢复
+
+运行（在final-project目录下）:
+    python -m pytest store_locator/tests
+"""
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+import pytest
+from store_locator.benchmarks.common import make_bench_app
+
+
+@pytest.fixture
+def app(tmp_path):
+    spool = tmp_path / 'spool'
+    spool.mkdir()
+    app = make_bench_app(f"sqlite:///{tmp_path / 'jobs.db'}", IMPORT_SPOOL_DIR=str(spool),
+                         IMPORT_JOB_STALE_SECONDS=60, SPATIAL_INDEX_ENABLED=False)
+    with app.app_context():
+        from store_locator.app.extensions import db
+        db.create_all(bind_key=None)
+    return app
+
+
+def _spool_file(app, name, age=0):
+    path = os.path.join(app.config['IMPORT_SPOOL_DIR'], name)
+    with open(path, 'w') as f:
+        f.write('store_id\n')
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def _add_job(app, job_id, **values):
+    from store_locator.app.extensions import db
+    from store_locator.app.models import ImportJob
+
+    with app.app_context():
+        db.session.add(ImportJob(id=job_id, **values))
+        db.session.commit()
+
+
+def _status(app, job_id):
+    from store_locator.app.extensions import db
+    from store_locator.app.models import ImportJob
+
+    with app.app_context():
+        return db.session.get(ImportJob, job_id).status
+
+
+@pytest.fixture
+def no_import(monkeypatch):
+    """导入本身不应该开始"""
+    from store_locator.app.stores import import_jobs as module
+
+    def fail(*args, **kwargs):
+        raise AssertionError('import started for a cancelled job')
+    monkeypatch.setattr(module, 'import_stores_streaming', fail)
+
+
+def test_cancel_while_queued_skips_import(app, no_import):
+    from store_locator.app.stores.import_jobs import import_jobs
+
+    path = _spool_file(app, 'queued.csv')
+    _add_job(app, 'queued', mode='stream', file_path=path)
+    with app.app_context():
+        assert import_jobs.cancel('queued').status == 'cancelled'
+
+    import_jobs._run('queued')
+    assert _status(app, 'queued') == 'cancelled'
+    assert not os.path.exists(path)
+
+
+def test_cancel_between_read_and_start_is_not_lost(app, no_import, monkeypatch):
+    from store_locator.app.stores.import_jobs import import_jobs
+
+    path = _spool_file(app, 'race.csv')
+    _add_job(app, 'race', mode='stream', file_path=path)
+
+    update_job = import_jobs._update_job
+
+    def cancel_first(job_id, **values):
+        # _run 已经读到 queued，在改成 running 之前另一个请求提交了取消
+        if values.get('status') == 'running':
+            with app.app_context():
+                import_jobs.cancel(job_id)
+        return update_job(job_id, **values)
+    monkeypatch.setattr(import_jobs, '_update_job', cancel_first)
+
+    import_jobs._run('race')
+    assert _status(app, 'race') == 'cancelled'
+    assert not os.path.exists(path)
+
+
+def test_check_alive_marks_only_stale_jobs(app):
+    from store_locator.app.extensions import db
+    from store_locator.app.models import ImportJob
+    from store_locator.app.stores.import_jobs import import_jobs, STALE_JOB_ERROR
+
+    old = datetime.utcnow() - timedelta(minutes=5)
+    _add_job(app, 'dead', status='running', worker='otherhost:1', heartbeat_at=old)
+    _add_job(app, 'alive', status='running', worker='otherhost:2', heartbeat_at=datetime.utcnow())
+    _add_job(app, 'done', status='succeeded', worker='otherhost:3', heartbeat_at=old)
+
+    with app.app_context():
+        dead = import_jobs.check_alive(db.session.get(ImportJob, 'dead'))
+        assert (dead.status, dead.error) == ('failed', STALE_JOB_ERROR)
+        assert import_jobs.check_alive(db.session.get(ImportJob, 'alive')).status == 'running'
+        assert import_jobs.check_alive(db.session.get(ImportJob, 'done')).status == 'succeeded'
+
+
+def test_recover_fails_local_stale_jobs_and_removes_orphans(app):
+    from store_locator.app.stores.import_jobs import import_jobs
+
+    host = socket.gethostname()
+    old = datetime.utcnow() - timedelta(minutes=5)
+    dead_here = _spool_file(app, 'dead-here.csv', age=300)
+    dead_other = _spool_file(app, 'dead-other.csv', age=300)
+    alive = _spool_file(app, 'alive.csv', age=300)
+    orphan_old = _spool_file(app, 'orphan-old.csv', age=300)
+    orphan_new = _spool_file(app, 'orphan-new.csv')
+    _add_job(app, 'dead-here', status='running', worker=f'{host}:1', heartbeat_at=old, file_path=dead_here)
+    _add_job(app, 'dead-other', status='running', worker='otherhost:1', heartbeat_at=old, file_path=dead_other)
+    _add_job(app, 'alive', status='queued', worker=f'{host}:2', heartbeat_at=datetime.utcnow(), file_path=alive)
+
+    with app.app_context():
+        assert import_jobs.recover() == 1
+
+    assert _status(app, 'dead-here') == 'failed'
+    # 其他主机的任务由查询状态时的 check_alive 处理
+    assert _status(app, 'dead-other') == 'running'
+    assert _status(app, 'alive') == 'queued'
+    # 本主机的死任务和超时孤儿文件删掉；其他主机的死任务不再算活任务，它的文件也超时了
+    assert not os.path.exists(dead_here)
+    assert not os.path.exists(orphan_old)
+    assert not os.path.exists(dead_other)
+    assert os.path.exists(alive)
+    assert os.path.exists(orphan_new)
@@ -0,0 +1,105 @@
+"""
+管理端游标分页: 游标编码往返，按 id / updated 翻完所有页时每家店铺恰好出现一次（包括 updated_at 相同的店铺）
+
+运行（在final-project目录下）:
+    python -m pytest store_locator/tests
+"""
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import select, update
+from store_locator.benchmarks.common import make_bench_app, seed_database
+
+BASE = datetime(2026, 1, 1, 12, 0, 0, 123456)
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp('pagination')
+    app = make_bench_app(f"sqlite:///{tmp / 'stores.db'}", SPATIAL_INDEX_ENABLED=False)
+    with app.app_context():
+        from store_locator.app.extensions import db
+        from store_locator.app.models import Store
+
+        seed_database(237)
+        # 只有5个不同的修改时间，大量店铺的 updated_at 相同（翻页时靠 id 区分）
+        for pk in db.session.execute(select(Store.id)).scalars():
+            db.session.execute(
+                update(Store).where(Store.id == pk).values(updated_at=BASE + timedelta(minutes=pk % 5))
+            )
+        db.session.commit()
+    return app
+
+
+def _all_pages(app, order, per_page):
+    from store_locator.app.admin.pagination import keyset_page
+
+    pages, cursor = [], None
+    with app.app_context():
+        while True:
+            rows, cursor = keyset_page(order, cursor, per_page)
+            pages.append(rows)
+            if cursor is None:
+                return pages
+
+
+def test_cursor_round_trip():
+    from store_locator.app.admin.pagination import encode_cursor, decode_cursor
+
+    row = SimpleNamespace(id=42, updated_at=BASE)
+    assert decode_cursor(encode_cursor('id', row), 'id') == (42,)
+    assert decode_cursor(encode_cursor('updated', row), 'updated') == (BASE, 42)
+    assert decode_cursor(encode_cursor('updated', SimpleNamespace(id=7, updated_at=None)), 'updated') == (None, 7)
+    assert decode_cursor('', 'id') is None
+    # 游标不带base64填充，可以直接放进URL
+    assert '=' not in encode_cursor('updated', row)
+
+
+@pytest.mark.parametrize('cursor, order', [
+    ('not-base64!', 'id'),
+    ('eyJvIjoiaWQifQ', 'id'),                                  # {"o":"id"} 没有 k
+    (None, 'updated'),                                         # 用 id 排序的游标请求 updated 排序
+])
+def test_invalid_cursor(cursor, order):
+    from store_locator.app.admin.pagination import encode_cursor, decode_cursor, InvalidCursor
+
+    if cursor is None:
+        cursor = encode_cursor('id', SimpleNamespace(id=1, updated_at=BASE))
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor, order)
+
+
+@pytest.mark.parametrize('per_page', [1, 10, 50, 237, 500])
+def test_pages_cover_every_store_once_by_id(app, per_page):
+    pages = _all_pages(app, 'id', per_page)
+    ids = [row.id for rows in pages for row in rows]
+    assert ids == sorted(ids)
+    assert len(ids) == len(set(ids)) == 237
+    assert all(len(rows) == per_page for rows in pages[:-1])
+
+
+@pytest.mark.parametrize('per_page', [1, 7, 50, 500])
+def test_pages_cover_every_store_once_by_updated(app, per_page):
+    pages = _all_pages(app, 'updated', per_page)
+    keys = [(row.updated_at, row.id) for rows in pages for row in rows]
+    assert keys == sorted(keys, reverse=True)
+    assert len({pk for _, pk in keys}) == len(keys) == 237
+
+
+def test_route_rejects_bad_cursor(app):
+    from flask_jwt_extended import create_access_token
+    from store_locator.app.extensions import db
+    from store_locator.app.models import Permission, Role, User
+
+    with app.app_context():
+        role = Role(name='viewer', permissions=[Permission(name='view_stores')])
+        user = User(email='viewer@test.com', role=role, password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        headers = {'Authorization': f'Bearer {create_access_token(identity=str(user.id))}'}
+
+    client = app.test_client()
+    first = client.get('/api/admin/stores?cursor=&per_page=100', headers=headers).get_json()
+    assert len(first['stores']) == 100 and first['pagination']['next_cursor']
+    resp = client.get('/api/admin/stores?cursor=garbage', headers=headers)
+    assert resp.status_code == 400
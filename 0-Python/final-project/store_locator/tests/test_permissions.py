@@ -0,0 +1,126 @@
+"""
+权限缓存: 命中时不查库，角色/权限/用户状态变更后版本号失效（本进程和其他进程），
+只改 last_login 不失效，共享缓存不可用时每次查库
+
+运行（在final-project目录下）:
+    python -m pytest store_locator/tests
+"""
+from datetime import datetime
+import pytest
+from store_locator.benchmarks.common import make_bench_app
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_bench_app(f"sqlite:///{tmp_path / 'auth.db'}", SPATIAL_INDEX_ENABLED=False,
+                         PERMISSION_VERSION_CHECK_INTERVAL=0)
+    with app.app_context():
+        from store_locator.app.extensions import db
+        from store_locator.app.models import Permission, Role, User
+
+        db.create_all(bind_key=None)
+        view, manage = Permission(name='view_stores'), Permission(name='manage_stores')
+        db.session.add_all([
+            User(email='staff@test.com', password_hash='x', role=Role(name='staff', permissions=[view])),
+            Permission(name='import_data'),
+            manage
+        ])
+        db.session.commit()
+    return app
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """记录真正查库的次数"""
+    from store_locator.app.auth.permissions import permission_cache
+
+    calls = []
+    load = permission_cache._load
+
+    def counting_load(user_id):
+        calls.append(user_id)
+        return load(user_id)
+    monkeypatch.setattr(permission_cache, '_load', counting_load)
+    return calls
+
+
+def _get(app, user_id=1):
+    from store_locator.app.auth.permissions import permission_cache
+
+    with app.app_context():
+        return permission_cache.get_user(user_id)
+
+
+def test_hit_does_not_query(app, loads):
+    user = _get(app)
+    assert user.permissions == {'view_stores'} and user.role_name == 'staff'
+    assert _get(app) is user
+    assert loads == [1]
+
+
+def test_role_permission_change_invalidates(app, loads):
+    from store_locator.app.extensions import db
+    from store_locator.app.models import Permission, Role
+
+    assert not _get(app).has_permission('manage_stores')
+    with app.app_context():
+        role = Role.query.filter_by(name='staff').one()
+        role.permissions.append(Permission.query.filter_by(name='manage_stores').one())
+        db.session.commit()
+
+    assert _get(app).has_permission('manage_stores')
+    assert loads == [1, 1]
+
+
+def test_user_status_change_invalidates(app, loads):
+    from store_locator.app.extensions import db
+    from store_locator.app.models import User
+
+    assert _get(app).status == 'active'
+    with app.app_context():
+        db.session.get(User, 1).status = 'inactive'
+        db.session.commit()
+    assert _get(app).status == 'inactive'
+
+
+def test_last_login_does_not_invalidate(app, loads):
+    from store_locator.app.extensions import db
+    from store_locator.app.models import User
+
+    _get(app)
+    with app.app_context():
+        db.session.get(User, 1).last_login = datetime.utcnow()
+        db.session.commit()
+    _get(app)
+    assert loads == [1]
+
+
+def test_version_bumped_by_other_process(app, loads, monkeypatch):
+    from store_locator.app.auth.permissions import permission_cache, VERSION_KEY
+    from store_locator.app.extensions import cache
+
+    _get(app)
+    # 其他进程提交了角色变更: 只有共享缓存里的版本号变了
+    with app.app_context():
+        cache.set(VERSION_KEY, 'other-process', timeout=0)
+    _get(app)
+    assert loads == [1, 1]
+
+    # 检查间隔之内不重新读版本号，继续用本地缓存
+    monkeypatch.setattr(permission_cache, 'version_check_interval', 60)
+    with app.app_context():
+        cache.set(VERSION_KEY, 'again', timeout=0)
+    _get(app)
+    assert loads == [1, 1]
+
+
+def test_shared_cache_unavailable_loads_every_time(app, loads, monkeypatch):
+    from store_locator.app.auth import permissions
+
+    def unavailable(*args, **kwargs):
+        raise ConnectionError('redis down')
+    monkeypatch.setattr(permissions.cache, 'get', unavailable)
+
+    _get(app)
+    _get(app)
+    assert loads == [1, 1]
@@ -0,0 +1,154 @@
+"""
+混合限流: 多进程（多个实例）共享计数、同步期间的并发请求、窗口切换、后端故障降级与恢复
+时间都通过 now 参数注入，后台同步线程不启动，同步由测试显式调用
+
+运行（在final-project目录下）:
+    python -m pytest store_locator/tests
+"""
+import pytest
+from store_locator.app.rate_limit import HybridRateLimiter, MemoryCounterBackend, parse_limit
+
+# 对齐到天，分钟/小时窗口都从 T0 开始
+T0 = 1_800_000_000 // 86400 * 86400
+PER_MINUTE = [(10, 60)]
+
+
+class FlakyBackend:
+    """可以切换成不可用的共享后端；on_call 在读写后端期间（不持有限流器的锁）执行"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.down = False
+        self.calls = 0
+        self.on_call = None
+
+    def incr_many(self, items):
+        self.calls += 1
+        if self.on_call:
+            self.on_call()
+        if self.down:
+            raise ConnectionError('backend down')
+        return self.backend.incr_many(items)
+
+
+def _limiter(backend, monkeypatch):
+    limiter = HybridRateLimiter()
+    limiter.backend = backend
+    limiter.retry_interval = 5.0
+    monkeypatch.setattr(limiter, '_ensure_sync_thread', lambda: None)
+    return limiter
+
+
+def _allowed(limiter, count, now, key='client', limits=PER_MINUTE):
+    return [limiter.hit(key, limits, now=now)[0] for _ in range(count)]
+
+
+def _counter(limiter, key='client', limit=(10, 60)):
+    return limiter._counters[f'rl:v1:{limit[0]}:{limit[1]}:{key}']
+
+
+def test_parse_limit():
+    assert parse_limit('10 per minute') == (10, 60)
+    assert parse_limit('100/hour') == (100, 3600)
+    assert parse_limit(' 5 per seconds ') == (5, 1)
+    with pytest.raises(ValueError):
+        parse_limit('10 every minute')
+
+
+def test_limit_enforced_across_instances(monkeypatch):
+    shared = MemoryCounterBackend()
+    a, b = _limiter(shared, monkeypatch), _limiter(shared, monkeypatch)
+
+    assert all(_allowed(a, 6, T0 + 1))
+    a.sync(now=T0 + 1)
+    # b 同步时用 INCRBY 0 读到 a 的6次
+    assert b.hit('client', PER_MINUTE, now=T0 + 1)[0]
+    b.sync(now=T0 + 1)
+    assert _counter(b).synced == 7
+
+    assert _allowed(b, 4, T0 + 2) == [True, True, True, False]
+    b.sync(now=T0 + 2)
+    a.sync(now=T0 + 2)
+    assert _counter(a).synced == 10
+    allowed, retry_after, remaining = a.hit('client', PER_MINUTE, now=T0 + 2)
+    assert (allowed, remaining) == (False, 0)
+    assert retry_after == 58
+
+
+def test_hits_during_sync_are_kept(monkeypatch):
+    backend = FlakyBackend(MemoryCounterBackend())
+    limiter = _limiter(backend, monkeypatch)
+
+    assert all(_allowed(limiter, 3, T0 + 1))
+    # 同步请求发出后、结果回来之前又来了2个请求
+    backend.on_call = lambda: _allowed(limiter, 2, T0 + 1)
+    limiter.sync(now=T0 + 1)
+    backend.on_call = None
+
+    counter = _counter(limiter)
+    assert (counter.synced, counter.pending) == (3, 2)
+    limiter.sync(now=T0 + 1)
+    assert (counter.synced, counter.pending) == (5, 0)
+
+
+def test_token_bucket_limits_bursts_across_window_boundary(monkeypatch):
+    limiter = _limiter(MemoryCounterBackend(), monkeypatch)
+
+    # 窗口最后一秒用完10次，下一个窗口开始时计数清零，但令牌只补回了 1/6 个
+    assert all(_allowed(limiter, 10, T0 + 59))
+    allowed, retry_after, _ = limiter.hit('client', PER_MINUTE, now=T0 + 60)
+    assert not allowed and retry_after == pytest.approx(5.0)
+    # 每6秒补充1个令牌
+    assert _allowed(limiter, 2, T0 + 66) == [True, False]
+
+
+def test_window_rollover_resets_counts(monkeypatch):
+    shared = MemoryCounterBackend()
+    limiter = _limiter(shared, monkeypatch)
+
+    assert _allowed(limiter, 11, T0 + 50) == [True] * 10 + [False]
+    limiter.sync(now=T0 + 50)
+    assert _counter(limiter).synced == 10
+
+    # 下一个窗口: 全局计数从0开始，令牌也已经补满
+    assert all(_allowed(limiter, 10, T0 + 60 + 50))
+    counter = _counter(limiter)
+    assert (counter.window, counter.synced, counter.pending) == ((T0 + 110) // 60, 0, 10)
+    limiter.sync(now=T0 + 110)
+    assert counter.synced == 10
+
+
+def test_sync_skips_counters_from_previous_window(monkeypatch):
+    backend = FlakyBackend(MemoryCounterBackend())
+    limiter = _limiter(backend, monkeypatch)
+
+    _allowed(limiter, 3, T0 + 59)
+    # 同步时已经进入下一个窗口，旧窗口的 pending 不写到新窗口的key
+    limiter.sync(now=T0 + 61)
+    assert backend.calls == 0
+    assert _counter(limiter).pending == 3
+
+
+def test_degraded_then_recovered(monkeypatch):
+    backend = FlakyBackend(MemoryCounterBackend())
+    limiter = _limiter(backend, monkeypatch)
+
+    _allowed(limiter, 4, T0 + 1)
+    backend.down = True
+    limiter.sync(now=T0 + 1)
+    assert limiter.degraded and limiter.sync_failures == 1
+
+    # 降级期间只用本地令牌桶，请求照常判断
+    assert _allowed(limiter, 6, T0 + 2) == [True] * 6
+    assert not limiter.hit('client', PER_MINUTE, now=T0 + 2)[0]
+
+    # retry_interval 之内不再访问后端
+    limiter.sync(now=T0 + 3)
+    assert backend.calls == 1
+
+    backend.down = False
+    limiter.sync(now=T0 + 7)
+    assert not limiter.degraded
+    counter = _counter(limiter)
+    assert (counter.synced, counter.pending) == (10, 0)
+    assert backend.backend.incr_many([(f'rl:v1:10:60:client:{T0 // 60}', 0, 61)]) == [10]
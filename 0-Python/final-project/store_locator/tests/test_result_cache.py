@@ -0,0 +1,96 @@
+"""
+搜索结果缓存: 命中缓存（包括同一网格里其他中心点填充的、被截断的列表）的结果与实时计算一致，
+店铺变更后所在瓦片的缓存失效
+
+运行（在final-project目录下）:
+    python -m pytest store_locator/tests
+"""
+import random
+import pytest
+from store_locator.benchmarks.common import make_bench_app, seed_database
+
+NYC = (40.7128, -74.0060)
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp('result_cache')
+    app = make_bench_app(f"sqlite:///{tmp / 'stores.db'}", SEARCH_CACHE_ENABLED=True, POSTAL_NEARBY_ENABLED=False)
+    with app.app_context():
+        from store_locator.app.stores.spatial_index import spatial_index
+        seed_database(5000)
+        spatial_index.rebuild()
+    return app
+
+
+def _search(app, use_cache, **query):
+    from store_locator.app.stores.result_cache import search_result_cache
+    from store_locator.app.stores.search import get_search_service
+
+    search_result_cache.enabled = use_cache
+    try:
+        with app.app_context():
+            result = get_search_service().search_stores(**query)
+    finally:
+        search_result_cache.enabled = True
+    return [store['id'] for store in result['stores']]
+
+
+@pytest.fixture
+def grid(app):
+    """临时修改网格大小（粗网格下中心点偏移大，截断的缓存列表更容易不够用）"""
+    from store_locator.app.extensions import cache
+    from store_locator.app.stores.result_cache import search_result_cache
+
+    default = search_result_cache.grid_degrees
+
+    def set_grid(degrees):
+        search_result_cache.grid_degrees = degrees
+        with app.app_context():
+            cache.clear()
+    yield set_grid
+    set_grid(default)
+
+
+@pytest.mark.parametrize('grid_degrees', [0.01, 0.2])
+def test_cached_results_match_live(app, grid, grid_degrees):
+    from store_locator.app.stores.result_cache import search_result_cache
+
+    grid(grid_degrees)
+    rng = random.Random(7)
+    recomputed = search_result_cache.recomputed
+    for _ in range(60):
+        lat, lon = NYC[0] + rng.uniform(-0.2, 0.2), NYC[1] + rng.uniform(-0.2, 0.2)
+        for limit in (5, 10, 20):
+            query = dict(latitude=lat, longitude=lon, radius_miles=25, limit=limit)
+            assert _search(app, True, **query) == _search(app, False, **query)
+    if grid_degrees > 0.1:
+        # 截断的列表覆盖不了偏离网格中心的查询时改为实时计算
+        assert search_result_cache.recomputed > recomputed
+
+
+def test_truncated_entry_filled_from_other_corner_of_cell(app):
+    # 同一个0.01度网格的两个对角: 先由一角填充缓存，另一角取用
+    query = dict(radius_miles=10, limit=10)
+    _search(app, True, latitude=40.7101, longitude=-74.0099, **query)
+    corner = dict(latitude=40.7199, longitude=-74.0001, **query)
+    assert _search(app, True, **corner) == _search(app, False, **corner)
+
+
+def test_store_change_invalidates_cached_result(app):
+    from store_locator.app.extensions import db
+    from store_locator.app.models import Store
+    from store_locator.app.stores.signals import stores_changed
+
+    query = dict(latitude=NYC[0], longitude=NYC[1], radius_miles=5, limit=10)
+    closest = _search(app, True, **query)[0]
+    assert _search(app, True, **query)[0] == closest
+
+    with app.app_context():
+        store = Store.query.filter_by(store_id=closest).one()
+        store.status = 'inactive'
+        db.session.commit()
+        stores_changed.send(app, store_ids=[store.id])
+
+    assert closest not in _search(app, True, **query)
+    assert _search(app, True, **query) == _search(app, False, **query)
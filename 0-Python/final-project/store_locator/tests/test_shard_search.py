@@ -0,0 +1,131 @@
+"""
+分片搜索: 3个临时SQLite分片库上的k路归并结果与不分片搜索一致，写入后分片能看到
+
+运行（在final-project目录下）:
+    python -m pytest store_locator/tests
+"""
+import pytest
+from sqlalchemy import select, update
+from store_locator.benchmarks.common import make_bench_app, seed_database
+
+# dr5 是纽约市区，dr 是美国东北部其余地区，其他都落到默认分片 rest
+SHARDS = {'nyc': {'geohash': ['dr5']}, 'northeast': {'geohash': ['dr']}, 'rest': {}}
+
+QUERIES = [
+    # 纽约中心在 dr5 北边界附近，搜索框跨 nyc / northeast / rest
+    dict(latitude=40.7128, longitude=-74.0060, radius_miles=25, limit=20),
+    dict(latitude=40.7128, longitude=-74.0060, radius_miles=50, limit=100),
+    # 费城往南跨 dr 的南边界（39.375）
+    dict(latitude=39.9526, longitude=-75.1652, radius_miles=50, limit=50, store_types=['regular', 'outlet']),
+    dict(latitude=39.5, longitude=-75.0, radius_miles=30, limit=20, services=['pharmacy']),
+    # 只落在默认分片
+    dict(latitude=34.0522, longitude=-118.2437, radius_miles=10, limit=20),
+    # nearest模式逐圈扩大，跨分片
+    dict(latitude=41.0, longitude=-73.5, radius_miles=1, limit=30, nearest=True),
+]
+
+
+def _search(app, query):
+    from store_locator.app.stores.search import get_search_service
+
+    with app.app_context():
+        result = get_search_service().search_stores(**query)
+    return [(store['id'], store['distance_miles']) for store in result['stores']]
+
+
+@pytest.fixture(scope='module')
+def apps(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp('shards')
+    primary_url = f"sqlite:///{tmp / 'primary.db'}"
+    common = dict(SEARCH_CACHE_ENABLED=False, POSTAL_NEARBY_ENABLED=False, STORE_SHARD_LAYOUT_CHECK_INTERVAL=0)
+
+    unsharded = make_bench_app(primary_url, SQLALCHEMY_BINDS={}, STORE_SHARDS={}, **common)
+    with unsharded.app_context():
+        seed_database(5000)
+    expected = [_search(unsharded, query) for query in QUERIES]
+
+    binds = {key: f"sqlite:///{tmp / key}.db" for key in SHARDS}
+    sharded = make_bench_app(primary_url, SQLALCHEMY_BINDS=binds, STORE_SHARDS=SHARDS,
+                             STORE_DEFAULT_SHARD='rest', **common)
+    with sharded.app_context():
+        from store_locator.app.extensions import db
+        from store_locator.app.models import Store, Service, store_services
+        from store_locator.app.stores.shards import shard_router
+
+        for key in binds:
+            db.metadata.create_all(shard_router.engine(key),
+                                   tables=[Service.__table__, Store.__table__, store_services])
+        shard_router.sync_stores(db.session.execute(select(Store.id)).scalars().all())
+        shard_router.mark_layout_changed()
+    return sharded, expected
+
+
+@pytest.mark.parametrize('index', range(len(QUERIES)))
+def test_merge_matches_unsharded(apps, index):
+    sharded, expected = apps
+    actual = _search(sharded, QUERIES[index])
+    assert actual
+    assert [store_id for store_id, _ in actual] == [store_id for store_id, _ in expected[index]]
+    assert [d for _, d in actual] == [d for _, d in expected[index]]
+
+
+def test_bbox_spans_shards(apps):
+    sharded, _ = apps
+    from store_locator.app.stores.search import get_search_service
+
+    with sharded.app_context():
+        entries, _ = get_search_service()._nearest_entries(40.7128, -74.0060, 25, None, None, False, 100)
+    assert {shard for (shard, _), *_ in entries} >= {'nyc', 'northeast'}
+
+
+def test_writes_reach_shards(apps):
+    sharded, _ = apps
+    from store_locator.app.extensions import db
+    from store_locator.app.models import Store
+    from store_locator.app.stores.signals import stores_changed
+
+    query = dict(latitude=40.7128, longitude=-74.0060, radius_miles=25, limit=20)
+    closest = _search(sharded, query)[0][0]
+
+    with sharded.app_context():
+        # 管理端修改: 下线最近的店铺
+        store = Store.query.filter_by(store_id=closest).one()
+        store.status = 'inactive'
+        db.session.commit()
+        stores_changed.send(sharded, store_ids=[store.id])
+    assert closest not in [store_id for store_id, _ in _search(sharded, query)]
+
+    with sharded.app_context():
+        # CSV导入: 同一家店搬到洛杉矶，从 nyc 分片移到默认分片
+        db.session.execute(
+            update(Store).where(Store.id == store.id)
+            .values(status='active', latitude=34.0522, longitude=-118.2437)
+        )
+        db.session.commit()
+        stores_changed.send(sharded, store_ids=[store.id])
+
+    moved = _search(sharded, dict(latitude=34.0522, longitude=-118.2437, radius_miles=1, limit=5))
+    assert moved[0][0] == closest
+    assert closest not in [store_id for store_id, _ in _search(sharded, query)]
+
+
+def test_store_moved_to_new_region_is_searchable(apps):
+    sharded, _ = apps
+    from store_locator.app.extensions import db
+    from store_locator.app.models import Store
+    from store_locator.app.stores.signals import stores_changed
+
+    anchorage = dict(latitude=61.2181, longitude=-149.9003, radius_miles=5, limit=5)
+    # 先搜一次: 范围已经汇总好，安克雷奇不在任何分片的范围里
+    assert _search(sharded, anchorage) == []
+
+    with sharded.app_context():
+        store = Store.query.filter_by(status='active').order_by(Store.id.desc()).first()
+        db.session.execute(
+            update(Store).where(Store.id == store.id)
+            .values(latitude=anchorage['latitude'], longitude=anchorage['longitude'], address_state='AK')
+        )
+        db.session.commit()
+        stores_changed.send(sharded, store_ids=[store.id])
+
+    assert [store_id for store_id, _ in _search(sharded, anchorage)] == [store.store_id]